@@ -1,15 +1,26 @@
-from typing import Annotated
-from fastapi import Depends, FastAPI, HTTPException, Query, Response, status
+from contextlib import asynccontextmanager
+from typing import Annotated, AsyncIterator
+import anyio
+from fastapi import Depends, FastAPI, HTTPException, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 import datetime as dt
 
 from config import Settings
 
-from api.utils import error_detail
-from api.routes import auth, task
+from api.utils import check_expire, error_detail, model_response, user_expiry_type
+from db.instrument import instrument
+from api.routes import auth, metrics, task
 from api.routes.auth import get_current_user
-from src.models import Daylist, Agenda, User
+from src.models import Daylist, Agenda, LazyGuest, User, UserFromDB
 import src.operations as backend
+from src.cleanup import cleanup_forever
+from src.rollover import rollover_forever
+from src.userauth import set_password_rounds, PasswordQueueFull
+
+
+# seconds a client should wait before retrying when the server is busy
+BUSY_RETRY_AFTER = 1
 
 
 def configure(app: FastAPI, settings: Settings):
@@ -23,81 +34,186 @@ def configure(app: FastAPI, settings: Settings):
             "Content-Type",
             "Authorization",
             "Access-Control-Allow-Origin",
+            "If-None-Match",
         ],
+        "expose_headers": ["ETag"],
     }
     if settings.allowed_origins_regex:
         cors_settings["allow_origin_regex"] = settings.allowed_origins_regex
 
     app.add_middleware(CORSMiddleware, **cors_settings)
 
+    set_password_rounds(settings.password_rounds)
+
+    if settings.instrument_queries:
+        instrument(backend.DB)
+        instrument(backend.ADB)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    async with anyio.create_task_group() as tasks:
+        if backend.SETTINGS.cleanup_interval:
+            tasks.start_soon(cleanup_forever, backend.SETTINGS)
+        if backend.SETTINGS.rollover_interval:
+            tasks.start_soon(rollover_forever, backend.SETTINGS)
+        if backend.SETTINGS.cache_invalidation:
+            tasks.start_soon(backend.BUS.listen_forever)
+        yield
+        tasks.cancel_scope.cancel()
+    # release pooled async connections when the server shuts down
+    await backend.ADB.disconnect()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(metrics.RequestMetricsMiddleware)
 app.include_router(auth.router)
+app.include_router(metrics.router)
 app.include_router(task.router)
 
 configure(app, backend.SETTINGS)
 
 
-# Parameters
+@app.exception_handler(PasswordQueueFull)
+async def password_queue_full(request: Request, exc: PasswordQueueFull):
+    """Refuse logins and signups at once while password workers are backed up."""
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": error_detail("Server is busy, try again soon", "busy")},
+        headers={"Retry-After": str(BUSY_RETRY_AFTER)},
+    )
+
+
+# Helpers
+
+
+def guest_daylist(guest: LazyGuest, expire: dt.time | None) -> Daylist:
+    """The empty list of a guest without a row, which is only made by their write."""
+    return Daylist(id=0, expiry=backend.list_expiry(expire or guest.list_expire))
+
+
+async def read_todaylist(
+    user: User, response: Response, expire: dt.time | None
+) -> Daylist:
+    """Get or create today's list for the user, setting the status if it's new."""
+    if isinstance(user, LazyGuest):
+        return guest_daylist(user, expire)
+
+    created, daylist = await backend.get_or_make_todaylist(user.id, expire)
+    if created:
+        response.status_code = status.HTTP_201_CREATED
+    return daylist
+
+
+def daylist_etag(daylist_id: int, version: int, *parts: object) -> str:
+    """A strong etag for a version of a list, and anything else shown with it."""
+    return '"' + ".".join(str(part) for part in (daylist_id, version, *parts)) + '"'
 
-user_expiry_type = Query(description="a timezone-aware ISO time string")
+
+async def check_not_modified(user: User, request: Request, *parts: object) -> None:
+    """Answer 304 if the client's copy of today's list is current.
+
+    Only the list's id and version are looked up, so polling an unchanged list costs
+    a single small query.
+    """
+    if_none_match = request.headers.get("If-None-Match")
+    if not if_none_match or isinstance(user, LazyGuest):
+        return
+    current = await backend.get_todaylist_version(user.id)
+    if current is None:
+        return
+    etag = daylist_etag(*current, *parts)
+    # clients may send several etags, or weak ones, which match by their value
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    if etag in tags or "*" in tags:
+        raise HTTPException(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+        )
 
 
 # Routes
 
 
 @app.get("/", summary="Health check")
-def read_root():
+async def read_root():
     """Check if the server is running."""
     return "API server is running!"
 
 
-@app.get("/today", summary="Read today's todo items")
-def read_today(
+@app.get("/today", summary="Read today's todo items", response_model=Daylist)
+async def read_today(
     current_user: Annotated[User, Depends(get_current_user)],
+    request: Request,
     response: Response,
     expire: Annotated[dt.time | None, user_expiry_type] = None,
-) -> Daylist:
+) -> Response:
     """Read the current list of things to do today.
 
     Contains a list of pending tasks and done tasks. This list expires within 24 hours.
     By default, expires at midnight UTC, or you can provide a custom expiration time
-    that will be used if a new list needs to be created today.
+    that will be used if a new list needs to be created today. Send the ETag of a
+    list you have in If-None-Match to get a 304 if it hasn't changed.
     """
-    if expire and not expire.tzinfo:
-        raise HTTPException(
-            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-            detail=error_detail(
-                "Expire time parameter must have a timezone.", errtype="time_parsing"
-            ),
+    check_expire(expire)
+    await check_not_modified(current_user, request)
+    daylist = await read_todaylist(current_user, response, expire)
+    if daylist.id:
+        response.headers["ETag"] = daylist_etag(daylist.id, daylist.version)
+    return model_response(daylist, response)
+
+
+@app.get("/today/stream", summary="Follow changes to today's list")
+async def stream_today(
+    current_user: Annotated[UserFromDB, Depends(get_current_user)],
+) -> StreamingResponse:
+    """Stream server-sent events as today's list changes.
+
+    Sends "added", "done" and "pending" events with the ids of the affected tasks,
+    and "expired" with the list's id when it expires. Read `/today` for the list.
+    Idle streams get a comment every so often, so proxies keep them open.
+    """
+    # a guest's changes are sent by their guest key, so they can follow without a row
+    user_id, guest_key = current_user.id, current_user.guest_key
+
+    async def messages() -> AsyncIterator[str]:
+        events = backend.follow_todaylist(
+            user_id, backend.SETTINGS.stream_keepalive, guest_key
         )
-    created, daylist = backend.get_or_make_todaylist(current_user.id, expire)
-    if created:
-        response.status_code = status.HTTP_201_CREATED
-    return daylist
+        async for event in events:
+            yield event.encode() if event else ": keepalive\n\n"
+
+    return StreamingResponse(
+        messages(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
-@app.get("/agenda", summary="Read today's agenda")
-def read_agenda(
+@app.get("/agenda", summary="Read today's agenda", response_model=Agenda)
+async def read_agenda(
     current_user: Annotated[User, Depends(get_current_user)],
+    request: Request,
     response: Response,
     expire: Annotated[dt.time | None, user_expiry_type] = None,
-) -> Agenda:
+) -> Response:
     """Read a timeline of what to do next.
 
     Contains a timeline and indicates the overall finish time. Includes indications if
     the timeline exceeds the expiry time of today's list. You can provide a custom
-    expiration time that will be used if a new list needs to be created today.
+    expiration time that will be used if a new list needs to be created today. Send
+    the ETag of an agenda you have in If-None-Match to get a 304 if it hasn't changed.
     """
-    if expire and not expire.tzinfo:
-        raise HTTPException(
-            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-            detail=error_detail(
-                "Expire time parameter must have a timezone.", errtype="time_parsing"
-            ),
-        )
-    created, daylist = backend.get_or_make_todaylist(current_user.id, expire)
+    check_expire(expire)
+    # the timeline starts at the current minute, so the agenda changes with it
+    start = backend.agenda_start()
+    minute = int(start.timestamp()) // 60
+    await check_not_modified(current_user, request, minute)
+    if isinstance(current_user, LazyGuest):
+        daylist = guest_daylist(current_user, expire)
+        return model_response(backend.build_agenda(daylist, start), response)
+
+    created, plan = await backend.get_or_make_agenda(current_user.id, expire)
     if created:
         response.status_code = status.HTTP_201_CREATED
-    agenda = backend.build_agenda(daylist)
-    return agenda
+    response.headers["ETag"] = daylist_etag(plan.daylist_id, plan.version, minute)
+    return model_response(plan.anchor(start), response)
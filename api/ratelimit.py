@@ -0,0 +1,216 @@
+"""Admission control for the expensive login and signup routes.
+
+Each client IP and each email has a token bucket per route: a request takes a
+token, and tokens refill steadily up to the bucket's capacity. Requests that find
+an empty bucket get a 429 response instead of a password check.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+import math
+import threading
+import time
+from typing import Annotated, Any, Awaitable, Callable, Protocol
+
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security import OAuth2PasswordRequestForm
+
+from api.utils import error_detail
+import src.operations as backend
+from src.metrics import REGISTRY
+
+
+PERIODS = {"second": 1, "minute": 60, "hour": 60 * 60, "day": 24 * 60 * 60}
+GUEST_USERNAME = "anonymous"
+
+RATE_LIMITED = REGISTRY.counter(
+    "rate_limited_requests_total",
+    "Requests refused by a rate limit, by route and what was limited.",
+    ("route", "scope"),
+)
+
+
+@dataclass(frozen=True)
+class Limit:
+    """Allow a number of requests per period, refilling at an even rate."""
+
+    capacity: int
+    period: float  # seconds
+
+    @classmethod
+    @lru_cache(maxsize=64)
+    def parse(cls, spec: str) -> "Limit":
+        """Read a limit such as '5/minute', once for each spec."""
+        count, _, period = spec.partition("/")
+        if period not in PERIODS or not count.strip().isdigit() or not int(count):
+            raise ValueError(f"Rate limit should look like '5/minute', got {spec!r}")
+        return cls(capacity=int(count), period=PERIODS[period])
+
+    @property
+    def rate(self) -> float:
+        """Tokens added per second."""
+        return self.capacity / self.period
+
+
+@dataclass(frozen=True)
+class Decision:
+    allowed: bool
+    remaining: int
+    retry_after: float  # seconds until a request would be allowed
+    reset: float  # seconds until the bucket is full again
+
+
+def decide(limit: Limit, tokens: float) -> Decision:
+    """Describe a bucket left with some tokens after a request took one.
+
+    Fewer than 0 tokens means there was no whole token for the request to take.
+    """
+    allowed = tokens >= 0
+    stored = kept_tokens(tokens)
+    return Decision(
+        allowed=allowed,
+        remaining=int(stored),
+        retry_after=0.0 if allowed else (1 - stored) / limit.rate,
+        reset=(limit.capacity - stored) / limit.rate,
+    )
+
+
+def kept_tokens(tokens: float) -> float:
+    """The tokens to keep after a request took one, which refused requests return."""
+    return tokens if tokens >= 0 else tokens + 1
+
+
+# Stores
+
+
+class RateLimitStore(Protocol):
+    """Where buckets are kept; shared stores apply limits across worker processes."""
+
+    async def take(self, key: str, limit: Limit) -> Decision: ...
+
+
+class MemoryStore:
+    """Buckets in this process, forgetting the least recently used past max_keys."""
+
+    def __init__(
+        self, max_keys: int = 100_000, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        self.max_keys = max_keys
+        self._clock = clock
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def take(self, key: str, limit: Limit) -> Decision:
+        now = self._clock()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (limit.capacity, now))
+            tokens = min(limit.capacity, tokens + (now - updated) * limit.rate) - 1
+            self._buckets[key] = (kept_tokens(tokens), now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return decide(limit, tokens)
+
+
+class RedisStore:
+    """Buckets in Redis, or a server compatible with it, shared by every worker."""
+
+    # refill and take in one step, so concurrent workers can't both take the last token
+    SCRIPT = """
+        local capacity = tonumber(ARGV[1])
+        local rate = tonumber(ARGV[2])
+        local now = tonumber(ARGV[3])
+        local bucket = redis.call("HMGET", KEYS[1], "tokens", "updated")
+        local tokens = tonumber(bucket[1]) or capacity
+        local updated = tonumber(bucket[2]) or now
+        tokens = math.min(capacity, tokens + math.max(now - updated, 0) * rate) - 1
+        local stored = tokens
+        if tokens < 0 then stored = tokens + 1 end
+        redis.call(
+            "HSET", KEYS[1], "tokens", tostring(stored), "updated", tostring(now)
+        )
+        redis.call("PEXPIRE", KEYS[1], math.ceil(capacity / rate * 1000))
+        return tostring(tokens)
+    """
+
+    def __init__(self, client: Any, prefix: str = "ratelimit:") -> None:
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisStore":
+        try:
+            from redis import asyncio as redis  # type: ignore
+        except ImportError as error:
+            raise RuntimeError(
+                "A rate limit store url needs the redis package installed"
+            ) from error
+        return cls(redis.Redis.from_url(url))
+
+    async def take(self, key: str, limit: Limit) -> Decision:
+        tokens = await self.client.eval(
+            self.SCRIPT,
+            1,
+            self.prefix + key,
+            limit.capacity,
+            limit.rate,
+            time.time(),
+        )
+        return decide(limit, float(tokens))
+
+
+def make_store(url: str) -> RateLimitStore:
+    """A shared store at the url, or buckets in this process if there is none."""
+    if url:
+        return RedisStore.from_url(url)
+    return MemoryStore()
+
+
+STORE: RateLimitStore = make_store(backend.SETTINGS.rate_limit_store_url)
+
+
+# Dependencies
+
+
+def limit_logins(route: str) -> Callable[..., Awaitable[None]]:
+    """Rate limit a route by client IP and by the email in its login form.
+
+    Limits come from the RATE_LIMITS setting for the route; guests logging in
+    share a username, so they are only limited by IP. The client IP is the peer
+    uvicorn reports: behind a proxy, every client shares the proxy's IP unless
+    uvicorn trusts its forwarded headers.
+    """
+
+    async def check_rate_limits(
+        request: Request,
+        form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
+    ) -> None:
+        limits = backend.SETTINGS.rate_limits.get(route, {})
+        subjects = {"ip": request.client.host if request.client else "unknown"}
+        if form_data.username != GUEST_USERNAME:
+            subjects["email"] = form_data.username.strip().lower()
+
+        for scope, subject in subjects.items():
+            if scope not in limits:
+                continue
+            limit = Limit.parse(limits[scope])
+            decision = await STORE.take(f"{route}:{scope}:{subject}", limit)
+            if not decision.allowed:
+                RATE_LIMITED.inc(route=route, scope=scope)
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail=error_detail("Too many attempts, try again later"),
+                    headers=rate_limit_headers(limit, decision),
+                )
+
+    return check_rate_limits
+
+
+def rate_limit_headers(limit: Limit, decision: Decision) -> dict[str, str]:
+    return {
+        "Retry-After": str(math.ceil(decision.retry_after)),
+        "RateLimit-Limit": str(limit.capacity),
+        "RateLimit-Remaining": str(decision.remaining),
+        "RateLimit-Reset": str(math.ceil(decision.reset)),
+    }
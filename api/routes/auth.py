@@ -1,21 +1,24 @@
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, time, timedelta, timezone
 from typing import Annotated
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 import jwt
+from pydantic import ValidationError
 
-from api.utils import error_detail
+from api.ratelimit import limit_logins
+from api.utils import check_expire, error_detail, user_expiry_type
 from src.userauth import (
     acceptable_user_creds,
     authenticate_user,
     create_user,
     create_guest_user,
-    fetch_user,
+    fetch_token_user,
     make_user_sub,
+    materialize_guest,
     populate_guest_user,
 )
 import src.operations as backend
-from src.models import ActionResult, User, UserFromDB, Token, TokenData
+from src.models import ActionResult, LazyGuest, User, UserFromDB, Token, TokenData
 
 
 ALGORITHM = "HS256"
@@ -31,13 +34,16 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="user/token")
 # Token/JWT handling
 
 
-def build_token_object(user: User) -> Token:
-    user_sub = make_user_sub(user)
+def build_token_object(user: UserFromDB, list_expire: time | None = None) -> Token:
+    claims = {"sub": make_user_sub(user), "ver": user.version}
+    if list_expire and isinstance(user, LazyGuest):
+        # kept until the guest's first write makes their list
+        claims["expire"] = list_expire.isoformat()
     if user.email:
         token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINS)
     else:
         token_expires = timedelta(minutes=ACCESS_TOKEN_GUEST_EXPIRE_MINS)
-    access_token = create_token(data={"sub": user_sub}, expires_delta=token_expires)
+    access_token = create_token(data=claims, expires_delta=token_expires)
     return Token(access_token=access_token, token_type="bearer")
 
 
@@ -69,7 +75,7 @@ REGISTRATION_ERROR = HTTPException(
 # Auth functions
 
 
-def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]) -> UserFromDB:
+async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]) -> UserFromDB:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail=error_detail("Could not validate credentials"),
@@ -82,21 +88,28 @@ def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]) -> UserFromD
         user_sub: str = payload.get("sub")
         if user_sub is None:
             raise credentials_exception
-        token_data = TokenData(user_sub=user_sub)
-    except jwt.InvalidTokenError:
+        token_data = TokenData(
+            user_sub=user_sub,
+            user_version=payload.get("ver"),
+            list_expire=payload.get("expire"),
+        )
+    except (jwt.InvalidTokenError, ValidationError):
         raise credentials_exception
 
-    # check if the user is registered or guest, retrieve them accordingly
-    user = fetch_user(sub=token_data.user_sub)
+    # the token is only valid for the version of the user it was issued for
+    user = await fetch_token_user(token_data.user_sub, token_data.user_version)
     if user is None:
         raise credentials_exception
 
+    if isinstance(user, LazyGuest) and token_data.list_expire:
+        user = user.model_copy(update={"list_expire": token_data.list_expire})
     return user
 
 
-def get_current_anon_user(
+async def get_current_anon_user(
     current_user: Annotated[UserFromDB, Depends(get_current_user)]
 ) -> UserFromDB:
+    """The current guest, who may not be stored yet."""
     if current_user.email:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -109,13 +122,22 @@ def get_current_anon_user(
 
 
 @router.get("/", response_model=User, summary="Read user details")
-def read_user(current_user: Annotated[UserFromDB, Depends(get_current_user)]):
-    """Read details for the currently logged-in user."""
+async def read_user(current_user: Annotated[UserFromDB, Depends(get_current_user)]):
+    """Read details for the currently logged-in user.
+
+    A guest who hasn't written anything yet is stored, to have an id.
+    """
+    if isinstance(current_user, LazyGuest):
+        current_user = await materialize_guest(current_user)
     return current_user
 
 
-@router.post("/", summary="Sign up as a new user")
-def register_new_user(
+@router.post(
+    "/",
+    summary="Sign up as a new user",
+    dependencies=[Depends(limit_logins("/user/"))],
+)
+async def register_new_user(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()]
 ) -> Token:
     """Create a new user with by providing an email and password.
@@ -126,15 +148,19 @@ def register_new_user(
     if not acceptable_user_creds(email=form_data.username, pw=form_data.password):
         raise INSUFFICIENT_EMAIL_PW_ERROR
 
-    new_uid = create_user(email=form_data.username, pw=form_data.password)
+    new_uid = await create_user(email=form_data.username, pw=form_data.password)
     if not new_uid:
         raise REGISTRATION_ERROR
 
-    return login_token(form_data)
+    return await login_token(form_data)
 
 
-@router.post("/register", summary="Sign up (for guest users)")
-def populate_anon_user_creds(
+@router.post(
+    "/register",
+    summary="Sign up (for guest users)",
+    dependencies=[Depends(limit_logins("/user/register"))],
+)
+async def populate_anon_user_creds(
     current_user: Annotated[UserFromDB, Depends(get_current_anon_user)],
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
 ) -> ActionResult:
@@ -143,33 +169,48 @@ def populate_anon_user_creds(
     * `username`: Must be a valid email address not yet registered in the system
     * `password`: Must be at least 6 characters
 
-    It's recommended that users request a new token after performing this operation.
+    The guest's access token stops working, so log in with the new email and password
+    to get a new token.
     """
     creds_data = {"email": form_data.username, "pw": form_data.password}
     # ensure only guest users can do this (reg users should edit details differently)
     if not acceptable_user_creds(**creds_data):
         raise INSUFFICIENT_EMAIL_PW_ERROR
 
-    # edit user to add credentials
-    result = populate_guest_user(current_user, **creds_data)
-    if not result:
+    # edit user to add credentials, storing a lazy guest only now they are valid
+    user_id = await populate_guest_user(current_user, **creds_data)
+    if not user_id:
         raise REGISTRATION_ERROR
 
-    return ActionResult(success=[current_user.id])
+    return ActionResult(success=[user_id])
 
 
-@router.post("/token", summary="Login to get an access token")
-def login_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()]) -> Token:
+@router.post(
+    "/token",
+    summary="Login to get an access token",
+    dependencies=[Depends(limit_logins("/user/token"))],
+)
+async def login_token(
+    form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
+    expire: Annotated[time | None, user_expiry_type] = None,
+) -> Token:
     """Get an access token by logging in with email and password.
 
     * `username`: Must be a valid email address registered on the system
     * `password`: The password associated with this email account
+
+    Guests log in as `anonymous` with the guest key. They are only stored once
+    they write something, so a guest's choice of when lists expire is given here,
+    and used for the list their first task makes.
     """
+    check_expire(expire)
     # validate credentials or create temp user
     if form_data.username == "anonymous":
-        user = create_guest_user(pw=form_data.password)
+        user = await create_guest_user(pw=form_data.password)
     else:
-        user = authenticate_user(user_email=form_data.username, pw=form_data.password)
+        user = await authenticate_user(
+            user_email=form_data.username, pw=form_data.password
+        )
 
     if not user:
         raise HTTPException(
@@ -179,4 +220,4 @@ def login_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()]) -> T
         )
 
     # build access token
-    return build_token_object(user=user)
+    return build_token_object(user=user, list_expire=expire)
@@ -0,0 +1,109 @@
+import time
+from typing import cast
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from db.connect import pool_stats
+import src.operations as backend
+from src.metrics import REGISTRY
+
+
+router = APIRouter()
+
+REQUESTS = REGISTRY.counter(
+    "http_requests_total",
+    "Requests handled, by route template and response status.",
+    ("method", "route", "status"),
+)
+REQUEST_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds",
+    "Request latency, by route template.",
+    ("method", "route"),
+)
+REQUESTS_IN_PROGRESS = REGISTRY.gauge(
+    "http_requests_in_progress", "Requests currently being handled."
+)
+POOL_GAUGES = {
+    "size": REGISTRY.gauge(
+        "db_pool_size", "Connections the pool keeps open.", ("pool",)
+    ),
+    "checked_out": REGISTRY.gauge(
+        "db_pool_checked_out", "Connections currently in use.", ("pool",)
+    ),
+    "idle": REGISTRY.gauge(
+        "db_pool_idle", "Open connections waiting to be used.", ("pool",)
+    ),
+    "overflow": REGISTRY.gauge(
+        "db_pool_overflow", "Connections open beyond the pool size.", ("pool",)
+    ),
+    "waiting": REGISTRY.gauge(
+        "db_pool_waiting", "Callers currently waiting for a connection.", ("pool",)
+    ),
+}
+POOL_COUNTERS = {
+    "checkouts": REGISTRY.counter(
+        "db_pool_checkouts_total", "Connections checked out.", ("pool",)
+    ),
+    "wait_seconds": REGISTRY.counter(
+        "db_pool_wait_seconds_total", "Time spent getting connections.", ("pool",)
+    ),
+}
+PROMETHEUS_TEXT = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class RequestMetricsMiddleware:
+    """Count and time each request by its route template, e.g. /task/{id}/do."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        REQUESTS_IN_PROGRESS.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUESTS_IN_PROGRESS.dec()
+            # templates rather than raw paths keep the number of series small
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_DURATION.observe(
+                time.perf_counter() - start, method=scope["method"], route=route
+            )
+            REQUESTS.inc(method=scope["method"], route=route, status=str(status_code))
+
+
+# Routes
+
+
+@router.get(
+    "/metrics",
+    summary="Read server metrics",
+    response_class=PlainTextResponse,
+    include_in_schema=False,
+)
+async def read_metrics() -> PlainTextResponse:
+    """Report server metrics in the Prometheus text format."""
+    engines = {"async": backend.ADB.engine, "sync": backend.DB.engine}
+    for pool, engine in engines.items():
+        for stat, value in pool_stats(engine).items():
+            if stat in POOL_COUNTERS:
+                # the pool keeps the totals, so counters catch up to them
+                counter = POOL_COUNTERS[stat]
+                counter.inc(cast(float, value) - counter.value(pool=pool), pool=pool)
+            else:
+                POOL_GAUGES[stat].set(cast(float, value), pool=pool)
+    return PlainTextResponse(REGISTRY.render(), media_type=PROMETHEUS_TEXT)
@@ -1,40 +1,105 @@
 from typing import Annotated
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Body, Depends, HTTPException, Response, status
 
 from api.routes.auth import get_current_user
-from api.utils import error_detail
-from src.models import ActionResult, NewTask, Task, User
+from api.utils import error_detail, model_response
+from src.models import (
+    ActionResult,
+    LazyGuest,
+    NewTask,
+    Task,
+    TaskId,
+    UserFromDB,
+)
 import src.operations as backend
+from src.userauth import materialize_guest
 
 
 router = APIRouter(prefix="/task")
 
 
-@router.post("/", summary="Add a new pending task", status_code=status.HTTP_201_CREATED)
-def create_task(
-    current_user: Annotated[User, Depends(get_current_user)], task: NewTask
-) -> Task:
+async def get_current_list_user(
+    current_user: Annotated[UserFromDB, Depends(get_current_user)]
+) -> UserFromDB:
+    """The current user, about to add tasks to today's list.
+
+    A guest without a row is stored first, with today's list expiring when their
+    token says, as if they had read it.
+    """
+    if isinstance(current_user, LazyGuest):
+        list_expire = current_user.list_expire
+        current_user = await materialize_guest(current_user)
+        await backend.get_or_make_todaylist(current_user.id, list_expire)
+    return current_user
+
+
+@router.post(
+    "/",
+    summary="Add a new pending task",
+    status_code=status.HTTP_201_CREATED,
+    response_model=Task,
+)
+async def create_task(
+    current_user: Annotated[UserFromDB, Depends(get_current_list_user)],
+    task: NewTask,
+    response: Response,
+) -> Response:
     """Add a new task into your list for today.
 
     Provide new task details with a time estimate less than 24hours. Today's task list
     must already exist for this to succeed. On a 404 failure, visit `/today` to set up
     today's list.
     """
-    created_task = backend.create_task(current_user.id, task)
+    created_task = await backend.create_task(
+        current_user.id, task, current_user.guest_key
+    )
     if not created_task:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=error_detail("No list exists - can't add a new task."),
         )
-    return created_task
+    return model_response(created_task, response, status.HTTP_201_CREATED)
+
+
+@router.post(
+    "/bulk",
+    summary="Add many new pending tasks",
+    status_code=status.HTTP_201_CREATED,
+    response_model=list[Task],
+)
+async def create_tasks(
+    current_user: Annotated[UserFromDB, Depends(get_current_list_user)],
+    tasks: Annotated[
+        list[NewTask], Body(min_length=1, max_length=backend.SETTINGS.bulk_task_limit)
+    ],
+    response: Response,
+) -> Response:
+    """Add several new tasks to the end of your list for today, in the given order.
+
+    Provide a list of new task details, as for adding a single task. The number of
+    tasks per request is limited. Today's task list must already exist for this to
+    succeed. On a 404 failure, visit `/today` to set up today's list.
+    """
+    created_tasks = await backend.create_tasks(
+        current_user.id, tasks, current_user.guest_key
+    )
+    if created_tasks is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=error_detail("No list exists - can't add new tasks."),
+        )
+    return model_response(created_tasks, response, status.HTTP_201_CREATED)
 
 
 @router.post("/bulk/do", summary="Mark many tasks as done")
-def bulk_task_done(
-    current_user: Annotated[User, Depends(get_current_user)], task_ids: list[int]
+async def bulk_task_done(
+    current_user: Annotated[UserFromDB, Depends(get_current_user)],
+    task_ids: list[TaskId],
 ) -> ActionResult:
     """Mark a list of tasks from your list as done/completed in bulk."""
-    successful, result_ids = backend.mark_tasks_done(current_user.id, task_ids=task_ids)
+    successful, result_ids = await backend.mark_tasks_done(
+        current_user.id, task_ids=task_ids, guest_key=current_user.guest_key
+    )
 
     if successful:
         return ActionResult(success=result_ids)
@@ -48,11 +113,13 @@ def bulk_task_done(
 
 
 @router.post("/{id}/do", summary="Mark a task as done")
-def mark_task_done(
-    current_user: Annotated[User, Depends(get_current_user)], id: int
+async def mark_task_done(
+    current_user: Annotated[UserFromDB, Depends(get_current_user)], id: TaskId
 ) -> ActionResult:
     """Mark a task from your list as done/completed."""
-    successful, result_ids = backend.mark_tasks_done(current_user.id, task_ids=[id])
+    successful, result_ids = await backend.mark_tasks_done(
+        current_user.id, task_ids=[id], guest_key=current_user.guest_key
+    )
 
     if successful:
         return ActionResult(success=result_ids)
@@ -64,11 +131,13 @@ def mark_task_done(
 
 
 @router.post("/{id}/undo", summary="Mark a done task as pending")
-def mark_task_pending(
-    current_user: Annotated[User, Depends(get_current_user)], id: int
+async def mark_task_pending(
+    current_user: Annotated[UserFromDB, Depends(get_current_user)], id: TaskId
 ) -> ActionResult:
     """Mark a done task from your list as pending."""
-    successful, result_ids = backend.mark_tasks_pending(current_user.id, task_ids=[id])
+    successful, result_ids = await backend.mark_tasks_pending(
+        current_user.id, task_ids=[id], guest_key=current_user.guest_key
+    )
 
     if successful:
         return ActionResult(success=result_ids)
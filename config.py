@@ -1,7 +1,14 @@
-from pydantic import model_validator
+from typing import Annotated, Any
+
+from pydantic import StringConstraints, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
+RateLimit = Annotated[
+    str, StringConstraints(pattern=r"^\s*0*[1-9]\d*\s*/(second|minute|hour|day)$")
+]
+
+
 class Settings(BaseSettings):
     testing: bool = False
     allowed_origins: list[str] = []
@@ -10,6 +17,66 @@ class Settings(BaseSettings):
     guest_user_key: str = ""
     database_url: str = ""
     test_database_url: str = ""
+    bulk_task_limit: int = 100
+    # connection pool, per worker process
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = -1
+    db_pool_pre_ping: bool = False
+    instrument_queries: bool = False
+    # users looked up by their token, per worker process; a ttl of 0 turns it off
+    user_cache_ttl: float = 60
+    user_cache_size: int = 10000
+    # agenda timelines per user, checked against their list's version when read
+    agenda_cache_ttl: float = 600
+    agenda_cache_size: int = 10000
+    # password hashing processes per worker, and operations allowed to wait for them
+    password_workers: int = 2
+    password_queue_size: int = 32
+    # bcrypt cost, the same for every worker so logins don't rehash back and forth
+    password_rounds: int = 12
+    # login attempts per client IP and per email, as "<count>/<second|minute|hour|day>"
+    rate_limits: dict[str, dict[str, RateLimit]] = {
+        "/user/token": {"ip": "30/minute", "email": "10/minute"},
+        "/user/": {"ip": "10/minute", "email": "5/minute"},
+        "/user/register": {"ip": "10/minute", "email": "5/minute"},
+    }
+    # a redis url to share rate limits between workers, or they are per process
+    rate_limit_store_url: str = ""
+    # the cleanup job deletes guests and expired lists unused for this many days
+    # (0 keeps them), in batches with a pause between them, so it never holds
+    # long locks; the API runs it in each worker every interval seconds, if set
+    guest_retention_days: float = 7
+    daylist_retention_days: float = 90
+    cleanup_batch_size: int = 500
+    cleanup_batch_pause: float = 0.1
+    cleanup_interval: float = 0
+    # tasks are partitioned by month of their list's expiry; the cleanup job makes
+    # partitions months ahead, and drops those past list retention, or detaches them
+    task_partition_months: int = 2
+    detach_task_partitions: bool = False
+    # the rollover job makes users' next lists this many seconds before their lists
+    # expire, in batches, optionally carrying over pending tasks; the API runs it in
+    # each worker every interval seconds, if set
+    rollover_ahead: float = 3600
+    rollover_batch_size: int = 500
+    rollover_batch_pause: float = 0.1
+    rollover_carry_over: bool = False
+    rollover_interval: float = 0
+    # users who haven't read a list for this many days, nor written to the expiring
+    # one, get no next list until their next request
+    rollover_active_days: float = 2
+    # events buffered for each open stream of list changes before a client that is
+    # too slow is dropped, and seconds between keepalives on idle streams
+    stream_buffer: int = 32
+    stream_keepalive: float = 15
+    # workers tell each other which cached entries their writes made stale, through
+    # the database, checking their listening connection every interval seconds
+    cache_invalidation: bool = True
+    cache_invalidation_check: float = 10
+    # tokens naming users by email or "anon:<id>" instead of id, from older releases
+    accept_legacy_tokens: bool = True
 
     model_config = SettingsConfigDict(env_file=("docker.env", ".env"), extra="allow")
 
@@ -25,6 +92,16 @@ class Settings(BaseSettings):
             self.test_database_url = self.test_database_url.replace(bad_form, good_form)
         return self
 
+    def db_pool_options(self) -> dict[str, Any]:
+        """Engine keyword arguments for sizing and maintaining the connection pool."""
+        return {
+            "pool_size": self.db_pool_size,
+            "max_overflow": self.db_max_overflow,
+            "pool_timeout": self.db_pool_timeout,
+            "pool_recycle": self.db_pool_recycle,
+            "pool_pre_ping": self.db_pool_pre_ping,
+        }
+
 
 def get_settings() -> Settings:
     settings = Settings()
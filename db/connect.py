@@ -1,5 +1,15 @@
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 import os
+import threading
+import time
+from typing import Any, AsyncIterator, Iterator, TypedDict
+
 import pugsql  # type: ignore
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 
 _this_dir = os.path.dirname(os.path.abspath(__file__))
@@ -10,7 +20,176 @@ class DBQueriesWrapper(pugsql.compiler.Module):
     pass
 
 
-def query_connect(url: str) -> DBQueriesWrapper:
+def query_connect(url: str, **kwargs: Any) -> DBQueriesWrapper:
+    """Connect the named SQL queries, passing any engine options through."""
     queries = pugsql.module(_query_module_path)
-    queries.connect(url)
+    queries.connect(url, **{"poolclass": TimedQueuePool, **kwargs})
+    return queries
+
+
+# Connection pools
+
+
+class PoolStats(TypedDict):
+    size: int
+    checked_out: int
+    idle: int
+    overflow: int
+    waiting: int
+    checkouts: int
+    wait_seconds: float
+
+
+class _TimedPoolMixin:
+    """Count the checkouts from a pool and the time spent waiting on them."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.waiting = 0
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+
+    def connect(self) -> Any:
+        with self._stats_lock:
+            self.waiting += 1
+        start = time.perf_counter()
+        try:
+            return super().connect()  # type: ignore
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._stats_lock:
+                self.waiting -= 1
+                self.checkouts += 1
+                self.wait_seconds += elapsed
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_stats(engine: Any) -> PoolStats:
+    """Report usage of a sync or async engine's connection pool.
+
+    Checkout counts and wait times are only tracked by the timed pools.
+    """
+    pool = engine.pool
+    stats = PoolStats(
+        size=0,
+        checked_out=0,
+        idle=0,
+        overflow=0,
+        waiting=getattr(pool, "waiting", 0),
+        checkouts=getattr(pool, "checkouts", 0),
+        wait_seconds=getattr(pool, "wait_seconds", 0.0),
+    )
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            idle=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+        )
+    return stats
+
+
+# Async queries
+
+
+class AsyncStatement:
+    """A named SQL query, awaited instead of called."""
+
+    def __init__(self, module: "AsyncDBQueriesWrapper", statement: Any) -> None:
+        self.name = statement.name
+        self.sql = statement.sql
+        self._module = module
+        self._text = text(statement.sql)
+        self.result = statement.result  # pugsql's :one, :many etc. handling
+
+    async def __call__(self, **params: Any) -> Any:
+        result = await self._module._execute(self._text, params)
+        return self.result.transform(result)
+
+
+class AsyncDBQueriesWrapper:
+    """Async counterpart to DBQueriesWrapper, running the same named SQL queries.
+
+    Statements are awaited, and run on the current task's transaction if one is open.
+    """
+
+    def __init__(self, sqlpath: str) -> None:
+        self.engine: AsyncEngine | None = None
+        self._connection: ContextVar[AsyncConnection | None] = ContextVar(
+            f"connection_{id(self)}", default=None
+        )
+        self._statements: dict[str, AsyncStatement] = {}
+        # reuse pugsql's parsing, so both wrappers share one set of query files
+        for statement in pugsql.module(sqlpath):
+            self._statements[statement.name] = AsyncStatement(self, statement)
+            setattr(self, statement.name, self._statements[statement.name])
+
+    def __iter__(self) -> Iterator[AsyncStatement]:
+        return iter(self._statements.values())
+
+    def connect(self, url: str, **kwargs: Any) -> None:
+        self.engine = create_async_engine(
+            asyncpg_url(url), **{"poolclass": TimedAsyncQueuePool, **kwargs}
+        )
+
+    async def disconnect(self) -> None:
+        if self.engine:
+            await self.engine.dispose()
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[AsyncConnection]:
+        """Run the awaited statements in this block in one transaction.
+
+        Nested blocks use savepoints.
+        """
+        connection = self._connection.get()
+        if connection is not None:
+            async with connection.begin_nested():
+                yield connection
+            return
+
+        async with self._engine().begin() as connection:
+            token = self._connection.set(connection)
+            try:
+                yield connection
+            finally:
+                self._connection.reset(token)
+
+    async def _execute(self, clause: Any, params: dict[str, Any]) -> Any:
+        connection = self._connection.get()
+        if connection is not None:
+            return await connection.execute(clause, params)
+
+        async with self._engine().begin() as connection:
+            return await connection.execute(clause, params)
+
+    def _engine(self) -> AsyncEngine:
+        if self.engine is None:
+            raise RuntimeError("Queries are not connected to a database")
+        return self.engine
+
+
+def asyncpg_url(url: str) -> str:
+    """Convert a psql connection string to use the asyncpg driver."""
+    db_url = make_url(url).set(drivername="postgresql+asyncpg")
+    # asyncpg names the libpq sslmode option differently
+    if "sslmode" in db_url.query:
+        sslmode = db_url.query["sslmode"]
+        db_url = db_url.difference_update_query(["sslmode"]).update_query_dict(
+            {"ssl": sslmode}
+        )
+    return db_url.render_as_string(hide_password=False)
+
+
+def async_query_connect(url: str, **kwargs: Any) -> AsyncDBQueriesWrapper:
+    queries = AsyncDBQueriesWrapper(_query_module_path)
+    queries.connect(url, **kwargs)
     return queries
@@ -1,14 +1,17 @@
 from datetime import datetime, timedelta
-from typing import Any, Generator, Union
+from typing import Any, AsyncContextManager, Generator, TypedDict, Union
 
 AnonUserDict = dict[str, int]
 UserDict = dict[str, Union[str, int, datetime, None]]
 TaskDict = dict[str, Union[str, int, timedelta, bool]]
-DaylistDict = dict[str, Union[int, datetime, list[TaskDict]]]
+DaylistDict = dict[str, Union[int, bool, datetime, list[TaskDict]]]
+TaskResultDict = dict[str, Union[int, bool]]
+RolloverDict = dict[str, Union[int, datetime, None]]
 
 class DBQueriesWrapper:
     """Wrapper for dynamically imported SQL functions - typing and autocomplete."""
 
+    engine: Any
     def transaction(self) -> Any: ...
 
     # Users
@@ -24,19 +27,29 @@ class DBQueriesWrapper:
     @staticmethod
     def get_registered_user(email: str) -> UserDict | None: ...
     @staticmethod
+    def get_guest_user(guest_key: str) -> UserDict | None: ...
+    @staticmethod
     def get_anon_user() -> AnonUserDict | None: ...
     # create
     @staticmethod
     def add_anon_user() -> int: ...
     @staticmethod
+    def add_guest_user(guest_key: str) -> UserDict: ...
+    @staticmethod
     def add_registered_user(email: str, password_hash: str) -> int: ...
     # update
     @staticmethod
     def register_anon_user(id: int, email: str, password_hash: str) -> int: ...
+    @staticmethod
+    def update_password_hash(id: int, password_hash: str, new_hash: str) -> int: ...
     # delete
     @staticmethod
     def delete_user(id: int) -> int: ...
     @staticmethod
+    def delete_inactive_guests(
+        before: Union[str, datetime], batch_size: int
+    ) -> int: ...
+    @staticmethod
     def delete_all_users() -> int: ...
 
     # Daylists
@@ -44,6 +57,23 @@ class DBQueriesWrapper:
     def get_active_daylist(user_id: int) -> DaylistDict | None: ...
     @staticmethod
     def add_daylist(user_id: int, expiry: Union[str, datetime]) -> int: ...
+    @staticmethod
+    def get_or_add_todaylist(
+        user_id: int, expiry: Union[str, datetime]
+    ) -> DaylistDict | None: ...
+    @staticmethod
+    def add_next_daylists(
+        after_expiry: Union[str, datetime],
+        after_id: int,
+        until: Union[str, datetime],
+        active_since: Union[str, datetime],
+        batch_size: int,
+        carry_over: bool,
+    ) -> Generator[RolloverDict, None, None]: ...
+    @staticmethod
+    def delete_expired_daylists(
+        before: Union[str, datetime], batch_size: int
+    ) -> int: ...
 
     # Tasks
     # read
@@ -61,14 +91,176 @@ class DBQueriesWrapper:
     @staticmethod
     def add_task_for_user(user_id: int, title: str, estimate: timedelta) -> int: ...
     @staticmethod
+    def add_tasks_for_user(
+        user_id: int, tasks: str
+    ) -> Generator[TaskDict, None, None]: ...
+    @staticmethod
     def add_task_to_list(daylist_id: int, title: str, estimate: timedelta) -> int: ...
     # update
     @staticmethod
     def complete_task(id: int) -> int: ...
     @staticmethod
     def uncomplete_task(id: int) -> int: ...
+    @staticmethod
+    def complete_tasks_for_user(
+        user_id: int, task_ids: str
+    ) -> Generator[TaskResultDict, None, None]: ...
+    @staticmethod
+    def uncomplete_tasks_for_user(
+        user_id: int, task_ids: str
+    ) -> Generator[TaskResultDict, None, None]: ...
     # delete
     @staticmethod
     def delete_task(id: int) -> int: ...
+    # partitions
+    @staticmethod
+    def create_task_partitions(
+        since: Union[str, datetime], until: Union[str, datetime]
+    ) -> int: ...
+    @staticmethod
+    def retire_task_partitions(before: Union[str, datetime], detach: bool) -> int: ...
+
+    # Notifications
+    @staticmethod
+    def notify(channel: str, payload: str) -> None: ...
+
+def query_connect(url: str, **kwargs: Any) -> DBQueriesWrapper: ...
+
+class PoolStats(TypedDict):
+    size: int
+    checked_out: int
+    idle: int
+    overflow: int
+    waiting: int
+    checkouts: int
+    wait_seconds: float
+
+def pool_stats(engine: Any) -> PoolStats: ...
+
+class AsyncDBQueriesWrapper:
+    """Async wrapper for the same SQL functions - typing and autocomplete."""
+
+    engine: Any
+    def transaction(self) -> AsyncContextManager[Any]: ...
+    async def disconnect(self) -> None: ...
+
+    # Users
+    # read
+    @staticmethod
+    async def count_users(user_id: int) -> int: ...
+    @staticmethod
+    async def count_anon_users() -> int: ...
+    @staticmethod
+    async def count_registered_users() -> int: ...
+    @staticmethod
+    async def get_user(id: int) -> UserDict | None: ...
+    @staticmethod
+    async def get_registered_user(email: str) -> UserDict | None: ...
+    @staticmethod
+    async def get_guest_user(guest_key: str) -> UserDict | None: ...
+    @staticmethod
+    async def get_anon_user() -> AnonUserDict | None: ...
+    # create
+    @staticmethod
+    async def add_anon_user() -> int: ...
+    @staticmethod
+    async def add_guest_user(guest_key: str) -> UserDict: ...
+    @staticmethod
+    async def add_registered_user(email: str, password_hash: str) -> int: ...
+    # update
+    @staticmethod
+    async def register_anon_user(id: int, email: str, password_hash: str) -> int: ...
+    @staticmethod
+    async def update_password_hash(
+        id: int, password_hash: str, new_hash: str
+    ) -> int: ...
+    # delete
+    @staticmethod
+    async def delete_user(id: int) -> int: ...
+    @staticmethod
+    async def delete_inactive_guests(
+        before: Union[str, datetime], batch_size: int
+    ) -> int: ...
+    @staticmethod
+    async def delete_all_users() -> int: ...
+
+    # Daylists
+    @staticmethod
+    async def get_active_daylist(user_id: int) -> DaylistDict | None: ...
+    @staticmethod
+    async def add_daylist(user_id: int, expiry: Union[str, datetime]) -> int: ...
+    @staticmethod
+    async def get_or_add_todaylist(
+        user_id: int, expiry: Union[str, datetime]
+    ) -> DaylistDict | None: ...
+    @staticmethod
+    async def add_next_daylists(
+        after_expiry: Union[str, datetime],
+        after_id: int,
+        until: Union[str, datetime],
+        active_since: Union[str, datetime],
+        batch_size: int,
+        carry_over: bool,
+    ) -> Generator[RolloverDict, None, None]: ...
+    @staticmethod
+    async def delete_expired_daylists(
+        before: Union[str, datetime], batch_size: int
+    ) -> int: ...
+
+    # Tasks
+    # read
+    @staticmethod
+    async def count_tasks(daylist_id: int) -> int: ...
+    @staticmethod
+    async def get_task(id: int) -> TaskDict | None: ...
+    @staticmethod
+    async def get_current_tasks(user_id: int) -> Generator[TaskDict, None, None]: ...
+    @staticmethod
+    async def get_pending_tasks(user_id: int) -> Generator[TaskDict, None, None]: ...
+    @staticmethod
+    async def get_done_tasks(user_id: int) -> Generator[TaskDict, None, None]: ...
+    # create
+    @staticmethod
+    async def add_task_for_user(
+        user_id: int, title: str, estimate: timedelta
+    ) -> int: ...
+    @staticmethod
+    async def add_tasks_for_user(
+        user_id: int, tasks: str
+    ) -> Generator[TaskDict, None, None]: ...
+    @staticmethod
+    async def add_task_to_list(
+        daylist_id: int, title: str, estimate: timedelta
+    ) -> int: ...
+    # update
+    @staticmethod
+    async def complete_task(id: int) -> int: ...
+    @staticmethod
+    async def uncomplete_task(id: int) -> int: ...
+    @staticmethod
+    async def complete_tasks_for_user(
+        user_id: int, task_ids: str
+    ) -> Generator[TaskResultDict, None, None]: ...
+    @staticmethod
+    async def uncomplete_tasks_for_user(
+        user_id: int, task_ids: str
+    ) -> Generator[TaskResultDict, None, None]: ...
+    # delete
+    @staticmethod
+    async def delete_task(id: int) -> int: ...
+    # partitions
+    @staticmethod
+    async def create_task_partitions(
+        since: Union[str, datetime], until: Union[str, datetime]
+    ) -> int: ...
+    @staticmethod
+    async def retire_task_partitions(
+        before: Union[str, datetime], detach: bool
+    ) -> int: ...
+
+    # Notifications
+    @staticmethod
+    async def notify(channel: str, payload: str) -> None: ...
 
-def query_connect(url: str) -> DBQueriesWrapper: ...
+def asyncpg_url(url: str) -> str: ...
+def async_query_connect(url: str, **kwargs: Any) -> AsyncDBQueriesWrapper: ...
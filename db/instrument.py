@@ -0,0 +1,135 @@
+from contextlib import asynccontextmanager, contextmanager
+import time
+from typing import Any, AsyncIterator, Callable, Iterator
+
+from pugsql.statement import Affected, Many, Raw  # type: ignore
+
+from db.connect import AsyncDBQueriesWrapper
+from src.metrics import REGISTRY
+
+
+QUERY_CALLS = REGISTRY.counter(
+    "db_query_calls_total", "Calls to each named SQL query.", ("query",)
+)
+QUERY_ERRORS = REGISTRY.counter(
+    "db_query_errors_total", "Named SQL query calls that raised.", ("query",)
+)
+QUERY_ROWS = REGISTRY.counter(
+    "db_query_rows_total",
+    "Rows returned by each named SQL query, or affected for :affected queries.",
+    ("query",),
+)
+QUERY_DURATION = REGISTRY.histogram(
+    "db_query_duration_seconds", "Latency of each named SQL query.", ("query",)
+)
+TRANSACTION_DURATION = REGISTRY.histogram(
+    "db_transaction_duration_seconds",
+    "Time spent in transaction blocks, by whether they committed.",
+    ("outcome",),
+)
+
+
+def instrument(queries: Any) -> None:
+    """Record calls, latency and rows for the named queries, and transaction time.
+
+    Works on sync and async query wrappers. Statements are wrapped in place, so
+    callers are unchanged. Calling this again on the same queries does nothing.
+    """
+    if getattr(queries, "_instrumented", False):
+        return
+
+    is_async = isinstance(queries, AsyncDBQueriesWrapper)
+    for statement in list(queries):
+        timed = _timed_async_statement if is_async else _timed_statement
+        setattr(queries, statement.name, timed(statement))
+
+    timed_transaction = _timed_async_transaction if is_async else _timed_transaction
+    queries.transaction = timed_transaction(queries.transaction)
+    queries._instrumented = True
+
+
+# Statements
+
+
+def _timed_statement(statement: Any) -> Callable[..., Any]:
+    def timed(*args: Any, **kwargs: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            result = statement(*args, **kwargs)
+        except Exception:
+            QUERY_ERRORS.inc(query=statement.name)
+            raise
+        finally:
+            _record_call(statement.name, start)
+        return _record_rows(statement, result)
+
+    timed.name = statement.name  # type: ignore
+    return timed
+
+
+def _timed_async_statement(statement: Any) -> Callable[..., Any]:
+    async def timed(*args: Any, **kwargs: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            result = await statement(*args, **kwargs)
+        except Exception:
+            QUERY_ERRORS.inc(query=statement.name)
+            raise
+        finally:
+            _record_call(statement.name, start)
+        return _record_rows(statement, result)
+
+    timed.name = statement.name  # type: ignore
+    return timed
+
+
+def _record_call(name: str, start: float) -> None:
+    QUERY_CALLS.inc(query=name)
+    QUERY_DURATION.observe(time.perf_counter() - start, query=name)
+
+
+def _record_rows(statement: Any, result: Any) -> Any:
+    """Count a statement's rows, and return its result unchanged for the caller."""
+    if isinstance(statement.result, Many):
+        # rows are already fetched, so counting them costs no extra round trip
+        rows = list(result)
+        QUERY_ROWS.inc(len(rows), query=statement.name)
+        return iter(rows)
+    if isinstance(statement.result, Affected):
+        QUERY_ROWS.inc(result or 0, query=statement.name)
+    elif not isinstance(statement.result, Raw):
+        QUERY_ROWS.inc(int(result is not None), query=statement.name)
+    return result
+
+
+# Transactions
+
+
+def _timed_transaction(transaction: Callable[[], Any]) -> Callable[[], Any]:
+    @contextmanager
+    def timed() -> Iterator[Any]:
+        start = time.perf_counter()
+        outcome = "rollback"
+        try:
+            with transaction() as session:
+                yield session
+            outcome = "commit"
+        finally:
+            TRANSACTION_DURATION.observe(time.perf_counter() - start, outcome=outcome)
+
+    return timed
+
+
+def _timed_async_transaction(transaction: Callable[[], Any]) -> Callable[[], Any]:
+    @asynccontextmanager
+    async def timed() -> AsyncIterator[Any]:
+        start = time.perf_counter()
+        outcome = "rollback"
+        try:
+            async with transaction() as connection:
+                yield connection
+            outcome = "commit"
+        finally:
+            TRANSACTION_DURATION.observe(time.perf_counter() - start, outcome=outcome)
+
+    return timed
@@ -0,0 +1,42 @@
+-- migrate:up
+
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+-- creation time bounds a list's active period, so compare it with expiry
+ALTER TABLE daylists
+    ALTER COLUMN created_at TYPE timestamp with time zone;
+UPDATE daylists
+    SET created_at = least(now(), expiry)
+    WHERE created_at IS NULL;
+ALTER TABLE daylists
+    ALTER COLUMN created_at SET NOT NULL;
+
+-- modify records that violate new constraint:
+-- an overlapping list ends when the user's next list was created
+UPDATE daylists dl
+    SET expiry = violations.next_created_at
+    FROM (
+        SELECT id, expiry,
+            lead(created_at) OVER (PARTITION BY user_id ORDER BY created_at, id)
+            AS next_created_at
+        FROM daylists
+    ) violations
+    WHERE dl.id = violations.id AND violations.next_created_at < violations.expiry;
+
+-- a user's lists can't be active at the same time
+ALTER TABLE daylists
+    ADD CONSTRAINT exclude_overlapping_daylists
+    EXCLUDE USING gist (
+        user_id WITH =,
+        tstzrange(least(created_at, expiry), expiry) WITH &&
+    );
+
+-- migrate:down
+
+ALTER TABLE daylists
+    DROP CONSTRAINT exclude_overlapping_daylists;
+ALTER TABLE daylists
+    ALTER COLUMN created_at DROP NOT NULL,
+    ALTER COLUMN created_at TYPE timestamp;
+
+DROP EXTENSION IF EXISTS btree_gist;
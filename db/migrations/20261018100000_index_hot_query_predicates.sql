@@ -0,0 +1,25 @@
+-- migrate:up
+
+-- the active list lookup in every authenticated request:
+--  user_id = :user_id AND expiry > now(), and the latest list first
+CREATE INDEX daylists_user_id_expiry_idx
+    ON daylists (user_id, expiry DESC);
+
+-- a list's pending tasks in order, skipping its (usually more numerous) done tasks
+CREATE INDEX tasks_pending_daylist_order_idx
+    ON tasks (daylist_id, daylist_order)
+    WHERE NOT done;
+
+-- a list's done tasks in the order they were finished
+CREATE INDEX tasks_done_daylist_finished_at_idx
+    ON tasks (daylist_id, finished_at)
+    WHERE done;
+
+-- note: users.email lookups already use the unique_email constraint's index,
+--       and tasks.daylist_id lookups can use unique_task_order_in_daylist
+
+-- migrate:down
+
+DROP INDEX tasks_done_daylist_finished_at_idx;
+DROP INDEX tasks_pending_daylist_order_idx;
+DROP INDEX daylists_user_id_expiry_idx;
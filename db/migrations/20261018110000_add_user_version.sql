@@ -0,0 +1,10 @@
+-- migrate:up
+
+-- counts changes to a user's identity, so tokens issued before a change are stale
+ALTER TABLE users
+    ADD COLUMN version integer NOT NULL DEFAULT 1;
+
+-- migrate:down
+
+ALTER TABLE users
+    DROP COLUMN version;
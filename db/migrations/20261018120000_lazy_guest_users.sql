@@ -0,0 +1,12 @@
+-- migrate:up
+
+-- guests log in without a row, which is added with this key at their first write
+ALTER TABLE users
+    ADD COLUMN guest_key uuid,
+    ADD CONSTRAINT unique_guest_key UNIQUE (guest_key);
+
+-- migrate:down
+
+ALTER TABLE users
+    DROP CONSTRAINT unique_guest_key,
+    DROP COLUMN guest_key;
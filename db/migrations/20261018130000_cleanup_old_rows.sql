@@ -0,0 +1,26 @@
+-- migrate:up
+
+-- when a user was stored, so guests whose tokens have expired can be found;
+-- existing users count as stored now
+ALTER TABLE users
+    ADD COLUMN created_at timestamp with time zone NOT NULL DEFAULT now();
+
+-- the cleanup job's scan for old guests, oldest first
+CREATE INDEX users_guest_created_at_idx
+    ON users (created_at)
+    WHERE email IS NULL;
+
+-- the cleanup job's scan for lists past retention, oldest first
+CREATE INDEX daylists_expiry_idx
+    ON daylists (expiry);
+
+-- note: deleting users and lists cascades through daylists_user_id_expiry_idx
+--       and unique_task_order_in_daylist
+
+-- migrate:down
+
+DROP INDEX daylists_expiry_idx;
+DROP INDEX users_guest_created_at_idx;
+
+ALTER TABLE users
+    DROP COLUMN created_at;
@@ -0,0 +1,226 @@
+-- migrate:up
+
+-- tasks are partitioned by month of their list's expiry, so queries for active
+-- lists only read the latest partitions, and old months can be dropped whole;
+-- a list's expiry is copied to its tasks, and kept in step by the foreign key
+ALTER TABLE daylists
+    ADD CONSTRAINT unique_daylist_id_expiry UNIQUE (id, expiry);
+
+ALTER TABLE tasks RENAME TO tasks_unpartitioned;
+
+CREATE TABLE tasks (
+    id integer NOT NULL DEFAULT nextval('tasks_id_seq'),
+    title varchar(200) NOT NULL,
+    done boolean NOT NULL DEFAULT false,
+    estimate interval,
+    created_at timestamp DEFAULT now(),
+    updated_at timestamp,
+    finished_at timestamp,
+    daylist_id integer NOT NULL,
+    daylist_order integer,
+    daylist_expiry timestamp with time zone NOT NULL,
+    CONSTRAINT check_done_task_has_finishtime
+        CHECK (NOT done OR finished_at IS NOT NULL),
+    CONSTRAINT check_done_tasks_unordered
+        CHECK (daylist_order IS NULL OR done = false),
+    CONSTRAINT check_pending_tasks_ordered
+        CHECK (daylist_order IS NOT NULL OR done = true),
+    CONSTRAINT check_undone_task_no_finishtime
+        CHECK (done OR finished_at IS NULL)
+) PARTITION BY RANGE (daylist_expiry);
+
+-- holds tasks for months without a partition yet, until one is made for them
+CREATE TABLE tasks_default PARTITION OF tasks DEFAULT;
+
+INSERT INTO tasks
+    (id, title, done, estimate, created_at, updated_at, finished_at,
+     daylist_id, daylist_order, daylist_expiry)
+    SELECT  t.id, t.title, t.done, t.estimate, t.created_at, t.updated_at,
+            t.finished_at, t.daylist_id, t.daylist_order, dl.expiry
+        FROM tasks_unpartitioned AS t
+            INNER JOIN daylists AS dl ON t.daylist_id = dl.id;
+
+ALTER SEQUENCE tasks_id_seq OWNED BY tasks.id;
+DROP TABLE tasks_unpartitioned;
+
+-- unique keys must include the partition key, which is fixed by the list anyway
+ALTER TABLE tasks
+    ADD CONSTRAINT tasks_pkey PRIMARY KEY (id, daylist_expiry),
+    ADD CONSTRAINT unique_task_order_in_daylist
+        UNIQUE (daylist_id, daylist_order, daylist_expiry),
+    ADD CONSTRAINT tasks_daylist_id_fkey
+        FOREIGN KEY (daylist_id, daylist_expiry)
+        REFERENCES daylists (id, expiry)
+        ON DELETE CASCADE ON UPDATE CASCADE;
+
+CREATE INDEX tasks_pending_daylist_order_idx
+    ON tasks (daylist_id, daylist_order)
+    WHERE NOT done;
+
+CREATE INDEX tasks_done_daylist_finished_at_idx
+    ON tasks (daylist_id, finished_at)
+    WHERE done;
+
+-- make the monthly partitions, named like tasks_p2024_08, for lists expiring
+-- from since until until (in UTC), moving their tasks out of the default
+-- partition; returns how many were made
+CREATE FUNCTION create_task_partitions(
+    since timestamp with time zone, until timestamp with time zone
+) RETURNS integer
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    month timestamp := date_trunc('month', since AT TIME ZONE 'UTC');
+    lower_bound timestamp with time zone;
+    upper_bound timestamp with time zone;
+    partition_name text;
+    made integer := 0;
+BEGIN
+    -- workers starting together make each partition once
+    PERFORM pg_advisory_xact_lock(hashtext('create_task_partitions'));
+
+    WHILE month <= until AT TIME ZONE 'UTC' LOOP
+        partition_name := 'tasks_p' || to_char(month, 'YYYY_MM');
+        lower_bound := month AT TIME ZONE 'UTC';
+        upper_bound := (month + interval '1 month') AT TIME ZONE 'UTC';
+
+        IF to_regclass('public.' || partition_name) IS NULL THEN
+            -- nothing may add to the month in the default partition meanwhile
+            LOCK TABLE public.tasks_default IN ACCESS EXCLUSIVE MODE;
+            EXECUTE format(
+                'CREATE TABLE public.%I '
+                '(LIKE public.tasks INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+                partition_name
+            );
+            EXECUTE format(
+                'WITH moved AS ('
+                '    DELETE FROM public.tasks_default'
+                '        WHERE daylist_expiry >= $1 AND daylist_expiry < $2'
+                '        RETURNING *'
+                ') INSERT INTO public.%I SELECT * FROM moved',
+                partition_name
+            ) USING lower_bound, upper_bound;
+            EXECUTE format(
+                'ALTER TABLE public.tasks ATTACH PARTITION public.%I '
+                'FOR VALUES FROM (%L) TO (%L)',
+                partition_name, lower_bound, upper_bound
+            );
+            made := made + 1;
+        END IF;
+
+        month := month + interval '1 month';
+    END LOOP;
+
+    RETURN made;
+END;
+$$;
+
+-- drop the monthly partitions ending at or before a time, or detach them to keep
+-- as tables of their own, without the foreign key so deleting their lists leaves
+-- them be; returns how many were retired
+CREATE FUNCTION retire_task_partitions(
+    before timestamp with time zone, detach boolean
+) RETURNS integer
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    partition_name text;
+    foreign_key text;
+    retired integer := 0;
+BEGIN
+    FOR partition_name IN
+        SELECT child.relname
+            FROM pg_inherits
+                INNER JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+            WHERE   pg_inherits.inhparent = CAST('public.tasks' AS regclass)
+                    AND child.relname ~ '^tasks_p\d{4}_\d{2}$'
+                    AND (to_date(substr(child.relname, 8), 'YYYY_MM')
+                         + interval '1 month') AT TIME ZONE 'UTC' <= before
+            ORDER BY child.relname
+    LOOP
+        IF detach THEN
+            EXECUTE format(
+                'ALTER TABLE public.tasks DETACH PARTITION public.%I',
+                partition_name
+            );
+            FOR foreign_key IN
+                SELECT conname FROM pg_constraint
+                    WHERE   conrelid = CAST('public.' || partition_name AS regclass)
+                            AND contype = 'f'
+            LOOP
+                EXECUTE format(
+                    'ALTER TABLE public.%I DROP CONSTRAINT %I',
+                    partition_name, foreign_key
+                );
+            END LOOP;
+        ELSE
+            EXECUTE format('DROP TABLE public.%I', partition_name);
+        END IF;
+        retired := retired + 1;
+    END LOOP;
+
+    RETURN retired;
+END;
+$$;
+
+-- partitions for the existing lists, and lists made in the coming month
+SELECT create_task_partitions(
+    coalesce((SELECT min(expiry) FROM daylists), now()),
+    now() + interval '1 month'
+);
+
+-- migrate:down
+
+DROP FUNCTION retire_task_partitions(timestamp with time zone, boolean);
+DROP FUNCTION create_task_partitions(
+    timestamp with time zone, timestamp with time zone
+);
+
+ALTER TABLE tasks RENAME TO tasks_partitioned;
+
+CREATE TABLE tasks (
+    id integer NOT NULL DEFAULT nextval('tasks_id_seq'),
+    title varchar(200) NOT NULL,
+    done boolean NOT NULL DEFAULT false,
+    estimate interval,
+    created_at timestamp DEFAULT now(),
+    updated_at timestamp,
+    finished_at timestamp,
+    daylist_id integer NOT NULL,
+    daylist_order integer,
+    CONSTRAINT check_done_task_has_finishtime
+        CHECK (NOT done OR finished_at IS NOT NULL),
+    CONSTRAINT check_done_tasks_unordered
+        CHECK (daylist_order IS NULL OR done = false),
+    CONSTRAINT check_pending_tasks_ordered
+        CHECK (daylist_order IS NOT NULL OR done = true),
+    CONSTRAINT check_undone_task_no_finishtime
+        CHECK (done OR finished_at IS NULL)
+);
+
+INSERT INTO tasks
+    (id, title, done, estimate, created_at, updated_at, finished_at,
+     daylist_id, daylist_order)
+    SELECT  id, title, done, estimate, created_at, updated_at, finished_at,
+            daylist_id, daylist_order
+        FROM tasks_partitioned;
+
+ALTER SEQUENCE tasks_id_seq OWNED BY tasks.id;
+DROP TABLE tasks_partitioned;
+
+ALTER TABLE tasks
+    ADD CONSTRAINT tasks_pkey PRIMARY KEY (id),
+    ADD CONSTRAINT unique_task_order_in_daylist UNIQUE (daylist_id, daylist_order),
+    ADD CONSTRAINT tasks_daylist_id_fkey
+        FOREIGN KEY (daylist_id) REFERENCES daylists (id) ON DELETE CASCADE;
+
+CREATE INDEX tasks_pending_daylist_order_idx
+    ON tasks (daylist_id, daylist_order)
+    WHERE NOT done;
+
+CREATE INDEX tasks_done_daylist_finished_at_idx
+    ON tasks (daylist_id, finished_at)
+    WHERE done;
+
+ALTER TABLE daylists
+    DROP CONSTRAINT unique_daylist_id_expiry;
@@ -0,0 +1,10 @@
+-- migrate:up
+
+-- counts changes to a list's tasks, so clients can tell if their copy is current
+ALTER TABLE daylists
+    ADD COLUMN version integer NOT NULL DEFAULT 1;
+
+-- migrate:down
+
+ALTER TABLE daylists
+    DROP COLUMN version;
@@ -0,0 +1,10 @@
+-- migrate:up
+
+-- when a request first read each of the user's lists, so jobs can tell idle users
+ALTER TABLE users
+    ADD COLUMN last_active_at timestamp with time zone NOT NULL DEFAULT now();
+
+-- migrate:down
+
+ALTER TABLE users
+    DROP COLUMN last_active_at;
@@ -0,0 +1,11 @@
+-- migrate:up
+
+-- the list whose pending tasks a next list takes over on its first read, once that
+-- list has expired and its tasks can no longer change
+ALTER TABLE daylists
+    ADD COLUMN carry_from integer;
+
+-- migrate:down
+
+ALTER TABLE daylists
+    DROP COLUMN carry_from;
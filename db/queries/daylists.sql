@@ -1,12 +1,137 @@
 -- :name get_active_daylist :one
-SELECT id, expiry
+SELECT id, expiry, version
     FROM daylists
-    WHERE user_id = :user_id AND expiry > now()
+    WHERE user_id = :user_id AND expiry > now() AND created_at <= now()
     ORDER BY expiry DESC LIMIT 1;
 -- TESTED
+-- note: the version changes with the list's tasks, so it tells if a copy is current
 
 -- :name add_daylist :scalar
 INSERT INTO daylists (user_id, expiry)
     VALUES (:user_id, :expiry)
     RETURNING id;
--- TESTED
\ No newline at end of file
+-- TESTED
+
+-- :name get_or_add_todaylist :one
+WITH active AS (
+    SELECT  dl.id,
+            dl.expiry,
+            dl.version,
+            dl.created_at,
+            dl.carry_from,
+            coalesce(t.pending_tasks, '[]') AS pending_tasks,
+            coalesce(t.done_tasks, '[]') AS done_tasks,
+            coalesce(t.max_order, 0) AS max_order
+        FROM daylists AS dl
+            LEFT JOIN LATERAL (
+                SELECT
+                    json_agg(json_build_object(
+                                'id', id,
+                                'title', title,
+                                'estimate', extract(epoch FROM estimate),
+                                'done', done)
+                            ORDER BY daylist_order ASC)
+                        FILTER (WHERE NOT done) AS pending_tasks,
+                    json_agg(json_build_object(
+                                'id', id,
+                                'title', title,
+                                'estimate', extract(epoch FROM estimate),
+                                'done', done)
+                            ORDER BY finished_at ASC)
+                        FILTER (WHERE done) AS done_tasks,
+                    max(daylist_order) AS max_order
+                    FROM tasks
+                    WHERE daylist_id = dl.id AND daylist_expiry > now()
+            ) AS t ON true
+        WHERE dl.user_id = :user_id AND dl.expiry > now() AND dl.created_at <= now()
+        ORDER BY dl.expiry DESC LIMIT 1
+), created AS (
+    INSERT INTO daylists (user_id, expiry)
+        SELECT CAST(:user_id AS integer), CAST(:expiry AS timestamp with time zone)
+        WHERE NOT EXISTS (SELECT FROM active)
+        ON CONFLICT DO NOTHING
+        RETURNING id, expiry, version
+), claimed AS (
+    UPDATE daylists AS dl
+        SET carry_from = NULL, version = dl.version + 1
+        FROM active
+        WHERE dl.id = active.id AND dl.carry_from IS NOT NULL
+        RETURNING dl.id, dl.expiry, active.carry_from, active.max_order
+), carried AS (
+    INSERT INTO tasks (title, estimate, daylist_id, daylist_expiry, daylist_order)
+        SELECT  t.title, t.estimate, claimed.id, claimed.expiry,
+                claimed.max_order
+                    + row_number() OVER (ORDER BY t.daylist_order)
+            FROM claimed
+                INNER JOIN daylists AS old ON old.id = claimed.carry_from
+                INNER JOIN tasks AS t
+                    ON  t.daylist_id = old.id
+                        AND t.daylist_expiry = old.expiry
+                        AND NOT t.done
+), touched AS (
+    UPDATE users SET last_active_at = now()
+        WHERE   id = :user_id
+                AND last_active_at < coalesce((SELECT created_at FROM active), now())
+)
+SELECT  id, expiry, version, false AS is_new,
+        EXISTS (SELECT FROM claimed) AS is_stale,
+        pending_tasks, done_tasks
+    FROM active
+UNION ALL
+SELECT id, expiry, version, true AS is_new, false AS is_stale, '[]', '[]' FROM created;
+-- TESTED
+-- note: returns nothing if a concurrent call created the list first - call again
+-- note: the first read of a list the rollover job made copies the pending tasks of
+--       the list before it, after any already added, and is_stale says to call
+--       again to see them
+-- note: marks the user active on their first read of each list, so only once a day
+-- note: task estimates are returned in seconds, for json compatibility
+
+-- :name delete_expired_daylists :affected
+DELETE FROM daylists
+    WHERE id IN (
+        SELECT id FROM daylists
+            WHERE expiry < :before
+            ORDER BY expiry
+            LIMIT :batch_size
+            FOR UPDATE SKIP LOCKED
+    );
+-- TESTED
+-- note: also deletes the lists' tasks
+
+-- :name add_next_daylists :many
+WITH expiring AS (
+    SELECT dl.id, dl.user_id, dl.expiry
+        FROM daylists AS dl
+            INNER JOIN users AS u ON u.id = dl.user_id
+        WHERE   (dl.expiry, dl.id) > (
+                    CAST(:after_expiry AS timestamp with time zone),
+                    CAST(:after_id AS integer)
+                )
+                AND dl.expiry <= :until
+                AND (dl.version > 1 OR u.last_active_at > :active_since)
+                AND NOT EXISTS (
+                    SELECT FROM daylists AS later
+                        WHERE later.user_id = dl.user_id AND later.expiry > dl.expiry
+                )
+        ORDER BY dl.expiry, dl.id
+        LIMIT :batch_size
+), created AS (
+    INSERT INTO daylists (user_id, created_at, expiry, carry_from)
+        SELECT  user_id, expiry, expiry + interval '1 day',
+                CASE WHEN CAST(:carry_over AS boolean) THEN id END
+            FROM expiring
+        ON CONFLICT DO NOTHING
+        RETURNING id, user_id, expiry
+)
+SELECT expiring.id, expiring.expiry, created.id AS next_id
+    FROM expiring LEFT JOIN created ON created.user_id = expiring.user_id
+    ORDER BY expiring.expiry, expiring.id;
+-- TESTED
+-- note: makes the next list of each user whose latest list expires by the time,
+--       starting when it expires and lasting a day, after the (expiry, id) given
+-- note: only for users who wrote to that list or read a list since active_since,
+--       so an idle user's lists stop rolling over instead of piling up daily
+-- note: next_id is null if a request made the user's next list first
+-- note: carry_over has the next list copy the pending tasks on its first read, so
+--       tasks finished or added before the current list expires are counted
@@ -0,0 +1,4 @@
+-- :name notify :scalar
+SELECT pg_notify(:channel, :payload);
+-- TESTED
+-- note: listeners get the payload once the current transaction commits
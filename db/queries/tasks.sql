@@ -17,6 +17,8 @@ SELECT t.id, t.title, t.estimate, t.done
                     ON t.daylist_id = dl.id
     WHERE   dl.user_id = :user_id
             AND dl.expiry > now()
+            AND dl.created_at <= now()
+            AND t.daylist_expiry > now()
     ORDER BY done ASC, daylist_order ASC, finished_at ASC;
 -- TESTED
 -- BOOKMARK: add testing after items may get reordered by updates
@@ -27,6 +29,8 @@ SELECT t.id, t.title, t.estimate
                     ON t.daylist_id = dl.id
     WHERE   dl.user_id = :user_id
             AND dl.expiry > now()
+            AND dl.created_at <= now()
+            AND t.daylist_expiry > now()
             AND NOT done
     ORDER BY daylist_order ASC;
 -- TESTED
@@ -38,6 +42,8 @@ SELECT t.id, t.title, t.estimate
                     ON t.daylist_id = dl.id
     WHERE   dl.user_id = :user_id
             AND dl.expiry > now()
+            AND dl.created_at <= now()
+            AND t.daylist_expiry > now()
             AND done
     ORDER BY finished_at ASC;
 -- TESTED
@@ -45,61 +51,261 @@ SELECT t.id, t.title, t.estimate
 
 
 -- :name add_task_for_user :scalar
-WITH last_row (target_daylist_id, max_order) AS (
+WITH last_row (target_daylist_id, target_expiry, max_order) AS (
     SELECT  max(dl.id),
+            max(dl.expiry),
             coalesce(max(t.daylist_order), 0)
         FROM daylists as dl
-            LEFT JOIN tasks as t ON dl.id = t.daylist_id
-            WHERE dl.user_id = :user_id AND dl.expiry > now()          
+            LEFT JOIN tasks as t
+                ON dl.id = t.daylist_id AND t.daylist_expiry > now()
+            WHERE   dl.user_id = :user_id
+                    AND dl.expiry > now()
+                    AND dl.created_at <= now()
+), inserted AS (
+    INSERT INTO tasks
+        (title, estimate, daylist_id, daylist_expiry, daylist_order)
+        VALUES (:title, :estimate,
+                (SELECT target_daylist_id from last_row),
+                (SELECT target_expiry from last_row),
+                (SELECT max_order + 1 from last_row))
+        RETURNING id, daylist_id
+), bumped AS (
+    UPDATE daylists
+        SET version = version + 1
+        WHERE id IN (SELECT daylist_id FROM inserted)
 )
-INSERT INTO tasks
-    (title, estimate, daylist_id, daylist_order)
-    VALUES (:title, :estimate,
-            (SELECT target_daylist_id from last_row),
-            (SELECT max_order + 1 from last_row))
-    RETURNING id;
+SELECT id FROM inserted;
 -- TESTED
+-- note: a user has one active list, so the max id and expiry are from that list
+-- note: also counts up the version of the list
+
+-- :name add_tasks_for_user :many
+WITH last_row (target_daylist_id, target_expiry, max_order) AS (
+    SELECT  max(dl.id),
+            max(dl.expiry),
+            coalesce(max(t.daylist_order), 0)
+        FROM daylists as dl
+            LEFT JOIN tasks as t
+                ON dl.id = t.daylist_id AND t.daylist_expiry > now()
+            WHERE   dl.user_id = :user_id
+                    AND dl.expiry > now()
+                    AND dl.created_at <= now()
+), inserted AS (
+    INSERT INTO tasks
+        (title, estimate, daylist_id, daylist_expiry, daylist_order)
+        SELECT  new_tasks.title, new_tasks.estimate,
+                last_row.target_daylist_id,
+                last_row.target_expiry,
+                last_row.max_order + new_tasks.position
+            FROM ROWS FROM (
+                    json_to_recordset(CAST(:tasks AS json))
+                        AS (title varchar(200), estimate interval)
+                ) WITH ORDINALITY AS new_tasks (title, estimate, position)
+                CROSS JOIN last_row
+        RETURNING id, title, estimate, done, daylist_order
+), bumped AS (
+    UPDATE daylists
+        SET version = version + 1
+        WHERE   id = (SELECT target_daylist_id FROM last_row)
+                AND EXISTS (SELECT FROM inserted)
+)
+SELECT id, title, estimate, done
+    FROM inserted
+    ORDER BY daylist_order ASC;
+-- TESTED
+-- note: tasks is a json array of objects with title and estimate
+-- note: also counts up the version of the list
 
 -- :name add_task_to_list :scalar
-WITH last_row (max_order) AS (
+WITH daylist (expiry) AS (
+    SELECT expiry FROM daylists WHERE id = :daylist_id
+), last_row (max_order) AS (
     SELECT coalesce(max(daylist_order), 0)
         FROM tasks
-        WHERE daylist_id = :daylist_id
+        WHERE   daylist_id = :daylist_id
+                AND daylist_expiry = (SELECT expiry FROM daylist)
+), inserted AS (
+    INSERT INTO tasks
+        (title, estimate, daylist_id, daylist_expiry, daylist_order)
+        VALUES (:title, :estimate, :daylist_id,
+                (SELECT expiry FROM daylist),
+                (SELECT max_order + 1 from last_row))
+        RETURNING id, daylist_id
+), bumped AS (
+    UPDATE daylists
+        SET version = version + 1
+        WHERE id IN (SELECT daylist_id FROM inserted)
 )
-INSERT INTO tasks
-    (title, estimate, daylist_id, daylist_order)
-    VALUES (:title, :estimate, :daylist_id,
-            (SELECT max_order + 1 from last_row))
-    RETURNING id;
+SELECT id FROM inserted;
 -- TESTED
+-- note: also counts up the version of the list
 
 
--- :name complete_task :affected
-UPDATE tasks
-    SET
-        done = true,
-        daylist_order = NULL,
-        finished_at = now(),
-        updated_at = now()
-    WHERE id = :id;
+-- :name complete_task :scalar
+WITH updated AS (
+    UPDATE tasks
+        SET
+            done = true,
+            daylist_order = NULL,
+            finished_at = now(),
+            updated_at = now()
+        WHERE id = :id
+        RETURNING daylist_id
+), bumped AS (
+    UPDATE daylists
+        SET version = version + 1
+        WHERE id IN (SELECT daylist_id FROM updated)
+)
+SELECT count(*) FROM updated;
 -- TESTED
+-- note: returns how many tasks were changed, and counts up the version of the list
 
--- :name uncomplete_task :affected
+-- :name uncomplete_task :scalar
 WITH last_row (max_order) AS (
     SELECT coalesce(max(daylist_order), 0)
         FROM tasks
         WHERE daylist_id = (SELECT daylist_id FROM tasks WHERE id=:id)
+), updated AS (
+    UPDATE tasks
+        SET
+            done = false,
+            daylist_order = (SELECT max_order + 1 FROM last_row),
+            finished_at = NULL,
+            updated_at = now()
+        WHERE id = :id AND done
+        RETURNING daylist_id
+), bumped AS (
+    UPDATE daylists
+        SET version = version + 1
+        WHERE id IN (SELECT daylist_id FROM updated)
 )
-UPDATE tasks
-    SET
-        done = false,
-        daylist_order = (SELECT max_order + 1 FROM last_row),
-        finished_at = NULL,
-        updated_at = now()
-    WHERE id = :id AND done;
+SELECT count(*) FROM updated;
 -- TESTED
+-- note: returns how many tasks were changed, and counts up the version of the list
 
+-- :name complete_tasks_for_user :many
+WITH requested (id) AS (
+    SELECT DISTINCT CAST(value AS integer)
+        FROM json_array_elements_text(CAST(:task_ids AS json))
+), owned AS (
+    SELECT t.id
+        FROM tasks as t INNER JOIN daylists as dl
+                        ON t.daylist_id = dl.id
+        WHERE   dl.user_id = :user_id
+                AND dl.expiry > now()
+                AND dl.created_at <= now()
+                AND t.daylist_expiry > now()
+                AND t.id IN (SELECT id FROM requested)
+), invalid AS (
+    SELECT id FROM requested
+    EXCEPT
+    SELECT id FROM owned
+), updated AS (
+    UPDATE tasks
+        SET
+            done = true,
+            daylist_order = NULL,
+            finished_at = now(),
+            updated_at = now()
+        WHERE   id IN (SELECT id FROM owned)
+                AND NOT EXISTS (SELECT FROM invalid)
+        RETURNING id, daylist_id
+), bumped AS (
+    UPDATE daylists
+        SET version = version + 1
+        WHERE id IN (SELECT daylist_id FROM updated)
+)
+SELECT id, false AS valid FROM invalid
+UNION ALL
+SELECT id, true AS valid FROM updated
+ORDER BY id;
+-- TESTED
+-- note: task_ids is a json array of ids
+-- note: all or nothing - if any id is invalid, only the invalid ids are returned
+-- note: also counts up the version of the list
 
--- :name delete_task :affected
-DELETE FROM tasks WHERE id = :id;
--- TESTED
\ No newline at end of file
+-- :name uncomplete_tasks_for_user :many
+WITH requested (id) AS (
+    SELECT DISTINCT CAST(value AS integer)
+        FROM json_array_elements_text(CAST(:task_ids AS json))
+), owned AS (
+    SELECT t.id, t.done, t.finished_at, t.daylist_id
+        FROM tasks as t INNER JOIN daylists as dl
+                        ON t.daylist_id = dl.id
+        WHERE   dl.user_id = :user_id
+                AND dl.expiry > now()
+                AND dl.created_at <= now()
+                AND t.daylist_expiry > now()
+                AND t.id IN (SELECT id FROM requested)
+), invalid AS (
+    SELECT id FROM requested
+    EXCEPT
+    SELECT id FROM owned
+), last_row (daylist_id, max_order) AS (
+    SELECT daylist_id, coalesce(max(daylist_order), 0)
+        FROM tasks
+        WHERE   daylist_id IN (SELECT daylist_id FROM owned)
+                AND daylist_expiry > now()
+        GROUP BY daylist_id
+), reordered (id, new_order) AS (
+    SELECT  owned.id,
+            last_row.max_order + row_number() OVER (
+                PARTITION BY owned.daylist_id
+                ORDER BY owned.finished_at ASC, owned.id ASC
+            )
+        FROM owned INNER JOIN last_row
+                   ON owned.daylist_id = last_row.daylist_id
+        WHERE owned.done
+), updated AS (
+    UPDATE tasks
+        SET
+            done = false,
+            daylist_order = reordered.new_order,
+            finished_at = NULL,
+            updated_at = now()
+        FROM reordered
+        WHERE   tasks.id = reordered.id
+                AND NOT EXISTS (SELECT FROM invalid)
+        RETURNING tasks.id, tasks.daylist_id
+), bumped AS (
+    UPDATE daylists
+        SET version = version + 1
+        WHERE id IN (SELECT daylist_id FROM updated)
+)
+SELECT id, false AS valid FROM invalid
+UNION ALL
+SELECT id, true AS valid FROM updated
+ORDER BY id;
+-- TESTED
+-- note: task_ids is a json array of ids
+-- note: all or nothing - if any id is invalid, only the invalid ids are returned
+-- note: already-pending tasks are valid but unaffected, and are not returned
+-- note: also counts up the version of the list
+
+
+-- :name delete_task :scalar
+WITH deleted AS (
+    DELETE FROM tasks WHERE id = :id RETURNING daylist_id
+), bumped AS (
+    UPDATE daylists
+        SET version = version + 1
+        WHERE id IN (SELECT daylist_id FROM deleted)
+)
+SELECT count(*) FROM deleted;
+-- TESTED
+-- note: returns how many tasks were deleted, and counts up the version of the list
+
+
+-- :name create_task_partitions :scalar
+SELECT create_task_partitions(
+    CAST(:since AS timestamp with time zone), CAST(:until AS timestamp with time zone)
+);
+-- TESTED
+-- note: makes the missing monthly partitions, returning how many were made
+
+-- :name retire_task_partitions :scalar
+SELECT retire_task_partitions(
+    CAST(:before AS timestamp with time zone), CAST(:detach AS boolean)
+);
+-- TESTED
+-- note: drops or detaches monthly partitions ending by the time, returning how many
@@ -13,11 +13,18 @@ SELECT count(id) FROM users WHERE email IS NOT NULL;
 
 
 -- :name get_user :one
-SELECT id, email, password_hash, registered_at FROM users WHERE id = :id;
+SELECT id, email, password_hash, registered_at, version FROM users WHERE id = :id;
 -- TESTED
 
 -- :name get_registered_user :one
-SELECT id, email, password_hash, registered_at FROM users WHERE email = :email;
+SELECT id, email, password_hash, registered_at, version
+    FROM users WHERE email = :email;
+-- TESTED
+
+-- :name get_guest_user :one
+SELECT id, email, password_hash, registered_at, version,
+        CAST(guest_key AS text) AS guest_key
+    FROM users WHERE guest_key = CAST(:guest_key AS uuid);
 -- TESTED
 
 -- :name get_anon_user :one
@@ -33,6 +40,15 @@ INSERT INTO users (email)
     RETURNING id;
 -- TESTED
 
+-- :name add_guest_user :one
+INSERT INTO users (guest_key)
+    VALUES (CAST(:guest_key AS uuid))
+    ON CONFLICT (guest_key) DO UPDATE SET guest_key = excluded.guest_key
+    RETURNING id, email, password_hash, registered_at, version,
+        CAST(guest_key AS text) AS guest_key;
+-- TESTED
+-- note: returns the existing row if the guest was already added
+
 -- :name add_registered_user :scalar
 INSERT INTO users (email, password_hash, registered_at)
     VALUES (:email, :password_hash, now())
@@ -46,16 +62,44 @@ INSERT INTO users (email, password_hash, registered_at)
 UPDATE users
     SET email = :email,
         password_hash = :password_hash,
-        registered_at = now()
+        registered_at = now(),
+        version = version + 1
     WHERE id = :id AND email IS NULL;
 -- TESTED
 
+-- :name update_password_hash :affected
+UPDATE users
+    SET password_hash = :new_hash
+    WHERE id = :id AND password_hash = :password_hash;
+-- TESTED
+-- note: only replaces the hash that was checked, in case the password changed since
+
 
 
 -- :name delete_user :affected
 DELETE FROM users WHERE id = :id;
 -- TESTED
 
+-- :name delete_inactive_guests :affected
+DELETE FROM users
+    WHERE id IN (
+        SELECT id FROM users AS u
+            WHERE email IS NULL
+                AND created_at < :before
+                AND last_active_at < :before
+                AND NOT EXISTS (
+                    SELECT FROM daylists
+                        WHERE user_id = u.id AND expiry > :before AND version > 1
+                )
+            ORDER BY created_at
+            LIMIT :batch_size
+            FOR UPDATE SKIP LOCKED
+    );
+-- TESTED
+-- note: guests stored before the cutoff, who haven't read a list since it, nor
+--       written to a list expiring after it; skips guests locked by a write
+-- note: lists the rollover job made ahead of time don't count as activity
+
 -- :name delete_all_users :affected
 DELETE FROM users;
 -- TESTED
@@ -1,6 +1,7 @@
 SET statement_timeout = 0;
 SET lock_timeout = 0;
 SET idle_in_transaction_session_timeout = 0;
+SET transaction_timeout = 0;
 SET client_encoding = 'UTF8';
 SET standard_conforming_strings = on;
 SELECT pg_catalog.set_config('search_path', '', false);
@@ -9,6 +10,122 @@ SET xmloption = content;
 SET client_min_messages = warning;
 SET row_security = off;
 
+--
+-- Name: btree_gist; Type: EXTENSION; Schema: -; Owner: -
+--
+
+CREATE EXTENSION IF NOT EXISTS btree_gist WITH SCHEMA public;
+
+
+--
+-- Name: EXTENSION btree_gist; Type: COMMENT; Schema: -; Owner: -
+--
+
+COMMENT ON EXTENSION btree_gist IS 'support for indexing common datatypes in GiST';
+
+
+--
+-- Name: create_task_partitions(timestamp with time zone, timestamp with time zone); Type: FUNCTION; Schema: public; Owner: -
+--
+
+CREATE FUNCTION public.create_task_partitions(since timestamp with time zone, until timestamp with time zone) RETURNS integer
+    LANGUAGE plpgsql
+    AS $_$
+DECLARE
+    month timestamp := date_trunc('month', since AT TIME ZONE 'UTC');
+    lower_bound timestamp with time zone;
+    upper_bound timestamp with time zone;
+    partition_name text;
+    made integer := 0;
+BEGIN
+    -- workers starting together make each partition once
+    PERFORM pg_advisory_xact_lock(hashtext('create_task_partitions'));
+
+    WHILE month <= until AT TIME ZONE 'UTC' LOOP
+        partition_name := 'tasks_p' || to_char(month, 'YYYY_MM');
+        lower_bound := month AT TIME ZONE 'UTC';
+        upper_bound := (month + interval '1 month') AT TIME ZONE 'UTC';
+
+        IF to_regclass('public.' || partition_name) IS NULL THEN
+            -- nothing may add to the month in the default partition meanwhile
+            LOCK TABLE public.tasks_default IN ACCESS EXCLUSIVE MODE;
+            EXECUTE format(
+                'CREATE TABLE public.%I '
+                '(LIKE public.tasks INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+                partition_name
+            );
+            EXECUTE format(
+                'WITH moved AS ('
+                '    DELETE FROM public.tasks_default'
+                '        WHERE daylist_expiry >= $1 AND daylist_expiry < $2'
+                '        RETURNING *'
+                ') INSERT INTO public.%I SELECT * FROM moved',
+                partition_name
+            ) USING lower_bound, upper_bound;
+            EXECUTE format(
+                'ALTER TABLE public.tasks ATTACH PARTITION public.%I '
+                'FOR VALUES FROM (%L) TO (%L)',
+                partition_name, lower_bound, upper_bound
+            );
+            made := made + 1;
+        END IF;
+
+        month := month + interval '1 month';
+    END LOOP;
+
+    RETURN made;
+END;
+$_$;
+
+
+--
+-- Name: retire_task_partitions(timestamp with time zone, boolean); Type: FUNCTION; Schema: public; Owner: -
+--
+
+CREATE FUNCTION public.retire_task_partitions(before timestamp with time zone, detach boolean) RETURNS integer
+    LANGUAGE plpgsql
+    AS $_$
+DECLARE
+    partition_name text;
+    foreign_key text;
+    retired integer := 0;
+BEGIN
+    FOR partition_name IN
+        SELECT child.relname
+            FROM pg_inherits
+                INNER JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+            WHERE   pg_inherits.inhparent = CAST('public.tasks' AS regclass)
+                    AND child.relname ~ '^tasks_p\d{4}_\d{2}$'
+                    AND (to_date(substr(child.relname, 8), 'YYYY_MM')
+                         + interval '1 month') AT TIME ZONE 'UTC' <= before
+            ORDER BY child.relname
+    LOOP
+        IF detach THEN
+            EXECUTE format(
+                'ALTER TABLE public.tasks DETACH PARTITION public.%I',
+                partition_name
+            );
+            FOR foreign_key IN
+                SELECT conname FROM pg_constraint
+                    WHERE   conrelid = CAST('public.' || partition_name AS regclass)
+                            AND contype = 'f'
+            LOOP
+                EXECUTE format(
+                    'ALTER TABLE public.%I DROP CONSTRAINT %I',
+                    partition_name, foreign_key
+                );
+            END LOOP;
+        ELSE
+            EXECUTE format('DROP TABLE public.%I', partition_name);
+        END IF;
+        retired := retired + 1;
+    END LOOP;
+
+    RETURN retired;
+END;
+$_$;
+
+
 SET default_tablespace = '';
 
 SET default_table_access_method = heap;
@@ -21,7 +138,9 @@ CREATE TABLE public.daylists (
     id integer NOT NULL,
     user_id integer NOT NULL,
     expiry timestamp with time zone NOT NULL,
-    created_at timestamp without time zone DEFAULT now()
+    created_at timestamp with time zone DEFAULT now() NOT NULL,
+    version integer DEFAULT 1 NOT NULL,
+    carry_from integer
 );
 
 
@@ -59,20 +178,22 @@ CREATE TABLE public.schema_migrations (
 --
 
 CREATE TABLE public.tasks (
-    id integer NOT NULL,
-    title character varying(200) NOT NULL,
+    id integer CONSTRAINT tasks_id_not_null1 NOT NULL,
+    title character varying(200) CONSTRAINT tasks_title_not_null1 NOT NULL,
     done boolean DEFAULT false NOT NULL,
     estimate interval,
     created_at timestamp without time zone DEFAULT now(),
     updated_at timestamp without time zone,
     finished_at timestamp without time zone,
-    daylist_id integer NOT NULL,
+    daylist_id integer CONSTRAINT tasks_daylist_id_not_null1 NOT NULL,
     daylist_order integer,
+    daylist_expiry timestamp with time zone NOT NULL,
     CONSTRAINT check_done_task_has_finishtime CHECK (((NOT done) OR (finished_at IS NOT NULL))),
     CONSTRAINT check_done_tasks_unordered CHECK (((daylist_order IS NULL) OR (done = false))),
     CONSTRAINT check_pending_tasks_ordered CHECK (((daylist_order IS NOT NULL) OR (done = true))),
     CONSTRAINT check_undone_task_no_finishtime CHECK ((done OR (finished_at IS NULL)))
-);
+)
+PARTITION BY RANGE (daylist_expiry);
 
 
 --
@@ -95,6 +216,72 @@ CREATE SEQUENCE public.tasks_id_seq
 ALTER SEQUENCE public.tasks_id_seq OWNED BY public.tasks.id;
 
 
+--
+-- Name: tasks_default; Type: TABLE; Schema: public; Owner: -
+--
+
+CREATE TABLE public.tasks_default (
+    id integer DEFAULT nextval('public.tasks_id_seq'::regclass) CONSTRAINT tasks_id_not_null1 NOT NULL,
+    title character varying(200) CONSTRAINT tasks_title_not_null1 NOT NULL,
+    done boolean DEFAULT false CONSTRAINT tasks_done_not_null NOT NULL,
+    estimate interval,
+    created_at timestamp without time zone DEFAULT now(),
+    updated_at timestamp without time zone,
+    finished_at timestamp without time zone,
+    daylist_id integer CONSTRAINT tasks_daylist_id_not_null1 NOT NULL,
+    daylist_order integer,
+    daylist_expiry timestamp with time zone CONSTRAINT tasks_daylist_expiry_not_null NOT NULL,
+    CONSTRAINT check_done_task_has_finishtime CHECK (((NOT done) OR (finished_at IS NOT NULL))),
+    CONSTRAINT check_done_tasks_unordered CHECK (((daylist_order IS NULL) OR (done = false))),
+    CONSTRAINT check_pending_tasks_ordered CHECK (((daylist_order IS NOT NULL) OR (done = true))),
+    CONSTRAINT check_undone_task_no_finishtime CHECK ((done OR (finished_at IS NULL)))
+);
+
+
+--
+-- Name: tasks_p2026_10; Type: TABLE; Schema: public; Owner: -
+--
+
+CREATE TABLE public.tasks_p2026_10 (
+    id integer DEFAULT nextval('public.tasks_id_seq'::regclass) CONSTRAINT tasks_id_not_null1 NOT NULL,
+    title character varying(200) CONSTRAINT tasks_title_not_null1 NOT NULL,
+    done boolean DEFAULT false CONSTRAINT tasks_done_not_null NOT NULL,
+    estimate interval,
+    created_at timestamp without time zone DEFAULT now(),
+    updated_at timestamp without time zone,
+    finished_at timestamp without time zone,
+    daylist_id integer CONSTRAINT tasks_daylist_id_not_null1 NOT NULL,
+    daylist_order integer,
+    daylist_expiry timestamp with time zone CONSTRAINT tasks_daylist_expiry_not_null NOT NULL,
+    CONSTRAINT check_done_task_has_finishtime CHECK (((NOT done) OR (finished_at IS NOT NULL))),
+    CONSTRAINT check_done_tasks_unordered CHECK (((daylist_order IS NULL) OR (done = false))),
+    CONSTRAINT check_pending_tasks_ordered CHECK (((daylist_order IS NOT NULL) OR (done = true))),
+    CONSTRAINT check_undone_task_no_finishtime CHECK ((done OR (finished_at IS NULL)))
+);
+
+
+--
+-- Name: tasks_p2026_11; Type: TABLE; Schema: public; Owner: -
+--
+
+CREATE TABLE public.tasks_p2026_11 (
+    id integer DEFAULT nextval('public.tasks_id_seq'::regclass) CONSTRAINT tasks_id_not_null1 NOT NULL,
+    title character varying(200) CONSTRAINT tasks_title_not_null1 NOT NULL,
+    done boolean DEFAULT false CONSTRAINT tasks_done_not_null NOT NULL,
+    estimate interval,
+    created_at timestamp without time zone DEFAULT now(),
+    updated_at timestamp without time zone,
+    finished_at timestamp without time zone,
+    daylist_id integer CONSTRAINT tasks_daylist_id_not_null1 NOT NULL,
+    daylist_order integer,
+    daylist_expiry timestamp with time zone CONSTRAINT tasks_daylist_expiry_not_null NOT NULL,
+    CONSTRAINT check_done_task_has_finishtime CHECK (((NOT done) OR (finished_at IS NOT NULL))),
+    CONSTRAINT check_done_tasks_unordered CHECK (((daylist_order IS NULL) OR (done = false))),
+    CONSTRAINT check_pending_tasks_ordered CHECK (((daylist_order IS NOT NULL) OR (done = true))),
+    CONSTRAINT check_undone_task_no_finishtime CHECK ((done OR (finished_at IS NULL)))
+);
+
+
 --
 -- Name: users; Type: TABLE; Schema: public; Owner: -
 --
@@ -104,6 +291,10 @@ CREATE TABLE public.users (
     email character varying(254),
     password_hash character varying(100),
     registered_at timestamp without time zone,
+    version integer DEFAULT 1 NOT NULL,
+    guest_key uuid,
+    created_at timestamp with time zone DEFAULT now() NOT NULL,
+    last_active_at timestamp with time zone DEFAULT now() NOT NULL,
     CONSTRAINT check_registered_user_data CHECK ((((email IS NULL) AND (password_hash IS NULL) AND (registered_at IS NULL)) OR ((email IS NOT NULL) AND (password_hash IS NOT NULL) AND (registered_at IS NOT NULL))))
 );
 
@@ -128,6 +319,27 @@ CREATE SEQUENCE public.users_id_seq
 ALTER SEQUENCE public.users_id_seq OWNED BY public.users.id;
 
 
+--
+-- Name: tasks_default; Type: TABLE ATTACH; Schema: public; Owner: -
+--
+
+ALTER TABLE ONLY public.tasks ATTACH PARTITION public.tasks_default DEFAULT;
+
+
+--
+-- Name: tasks_p2026_10; Type: TABLE ATTACH; Schema: public; Owner: -
+--
+
+ALTER TABLE ONLY public.tasks ATTACH PARTITION public.tasks_p2026_10 FOR VALUES FROM ('2026-10-01 00:00:00+00') TO ('2026-11-01 00:00:00+00');
+
+
+--
+-- Name: tasks_p2026_11; Type: TABLE ATTACH; Schema: public; Owner: -
+--
+
+ALTER TABLE ONLY public.tasks ATTACH PARTITION public.tasks_p2026_11 FOR VALUES FROM ('2026-11-01 00:00:00+00') TO ('2026-12-01 00:00:00+00');
+
+
 --
 -- Name: daylists id; Type: DEFAULT; Schema: public; Owner: -
 --
@@ -157,6 +369,14 @@ ALTER TABLE ONLY public.daylists
     ADD CONSTRAINT daylists_pkey PRIMARY KEY (id);
 
 
+--
+-- Name: daylists exclude_overlapping_daylists; Type: CONSTRAINT; Schema: public; Owner: -
+--
+
+ALTER TABLE ONLY public.daylists
+    ADD CONSTRAINT exclude_overlapping_daylists EXCLUDE USING gist (user_id WITH =, tstzrange(LEAST(created_at, expiry), expiry) WITH &&);
+
+
 --
 -- Name: schema_migrations schema_migrations_pkey; Type: CONSTRAINT; Schema: public; Owner: -
 --
@@ -165,12 +385,76 @@ ALTER TABLE ONLY public.schema_migrations
     ADD CONSTRAINT schema_migrations_pkey PRIMARY KEY (version);
 
 
+--
+-- Name: tasks unique_task_order_in_daylist; Type: CONSTRAINT; Schema: public; Owner: -
+--
+
+ALTER TABLE ONLY public.tasks
+    ADD CONSTRAINT unique_task_order_in_daylist UNIQUE (daylist_id, daylist_order, daylist_expiry);
+
+
+--
+-- Name: tasks_default tasks_default_daylist_id_daylist_order_daylist_expiry_key; Type: CONSTRAINT; Schema: public; Owner: -
+--
+
+ALTER TABLE ONLY public.tasks_default
+    ADD CONSTRAINT tasks_default_daylist_id_daylist_order_daylist_expiry_key UNIQUE (daylist_id, daylist_order, daylist_expiry);
+
+
 --
 -- Name: tasks tasks_pkey; Type: CONSTRAINT; Schema: public; Owner: -
 --
 
 ALTER TABLE ONLY public.tasks
-    ADD CONSTRAINT tasks_pkey PRIMARY KEY (id);
+    ADD CONSTRAINT tasks_pkey PRIMARY KEY (id, daylist_expiry);
+
+
+--
+-- Name: tasks_default tasks_default_pkey; Type: CONSTRAINT; Schema: public; Owner: -
+--
+
+ALTER TABLE ONLY public.tasks_default
+    ADD CONSTRAINT tasks_default_pkey PRIMARY KEY (id, daylist_expiry);
+
+
+--
+-- Name: tasks_p2026_10 tasks_p2026_10_daylist_id_daylist_order_daylist_expiry_key; Type: CONSTRAINT; Schema: public; Owner: -
+--
+
+ALTER TABLE ONLY public.tasks_p2026_10
+    ADD CONSTRAINT tasks_p2026_10_daylist_id_daylist_order_daylist_expiry_key UNIQUE (daylist_id, daylist_order, daylist_expiry);
+
+
+--
+-- Name: tasks_p2026_10 tasks_p2026_10_pkey; Type: CONSTRAINT; Schema: public; Owner: -
+--
+
+ALTER TABLE ONLY public.tasks_p2026_10
+    ADD CONSTRAINT tasks_p2026_10_pkey PRIMARY KEY (id, daylist_expiry);
+
+
+--
+-- Name: tasks_p2026_11 tasks_p2026_11_daylist_id_daylist_order_daylist_expiry_key; Type: CONSTRAINT; Schema: public; Owner: -
+--
+
+ALTER TABLE ONLY public.tasks_p2026_11
+    ADD CONSTRAINT tasks_p2026_11_daylist_id_daylist_order_daylist_expiry_key UNIQUE (daylist_id, daylist_order, daylist_expiry);
+
+
+--
+-- Name: tasks_p2026_11 tasks_p2026_11_pkey; Type: CONSTRAINT; Schema: public; Owner: -
+--
+
+ALTER TABLE ONLY public.tasks_p2026_11
+    ADD CONSTRAINT tasks_p2026_11_pkey PRIMARY KEY (id, daylist_expiry);
+
+
+--
+-- Name: daylists unique_daylist_id_expiry; Type: CONSTRAINT; Schema: public; Owner: -
+--
+
+ALTER TABLE ONLY public.daylists
+    ADD CONSTRAINT unique_daylist_id_expiry UNIQUE (id, expiry);
 
 
 --
@@ -182,11 +466,11 @@ ALTER TABLE ONLY public.users
 
 
 --
--- Name: tasks unique_task_order_in_daylist; Type: CONSTRAINT; Schema: public; Owner: -
+-- Name: users unique_guest_key; Type: CONSTRAINT; Schema: public; Owner: -
 --
 
-ALTER TABLE ONLY public.tasks
-    ADD CONSTRAINT unique_task_order_in_daylist UNIQUE (daylist_id, daylist_order);
+ALTER TABLE ONLY public.users
+    ADD CONSTRAINT unique_guest_key UNIQUE (guest_key);
 
 
 --
@@ -197,6 +481,167 @@ ALTER TABLE ONLY public.users
     ADD CONSTRAINT users_pkey PRIMARY KEY (id);
 
 
+--
+-- Name: daylists_expiry_idx; Type: INDEX; Schema: public; Owner: -
+--
+
+CREATE INDEX daylists_expiry_idx ON public.daylists USING btree (expiry);
+
+
+--
+-- Name: daylists_user_id_expiry_idx; Type: INDEX; Schema: public; Owner: -
+--
+
+CREATE INDEX daylists_user_id_expiry_idx ON public.daylists USING btree (user_id, expiry DESC);
+
+
+--
+-- Name: tasks_pending_daylist_order_idx; Type: INDEX; Schema: public; Owner: -
+--
+
+CREATE INDEX tasks_pending_daylist_order_idx ON ONLY public.tasks USING btree (daylist_id, daylist_order) WHERE (NOT done);
+
+
+--
+-- Name: tasks_default_daylist_id_daylist_order_idx; Type: INDEX; Schema: public; Owner: -
+--
+
+CREATE INDEX tasks_default_daylist_id_daylist_order_idx ON public.tasks_default USING btree (daylist_id, daylist_order) WHERE (NOT done);
+
+
+--
+-- Name: tasks_done_daylist_finished_at_idx; Type: INDEX; Schema: public; Owner: -
+--
+
+CREATE INDEX tasks_done_daylist_finished_at_idx ON ONLY public.tasks USING btree (daylist_id, finished_at) WHERE done;
+
+
+--
+-- Name: tasks_default_daylist_id_finished_at_idx; Type: INDEX; Schema: public; Owner: -
+--
+
+CREATE INDEX tasks_default_daylist_id_finished_at_idx ON public.tasks_default USING btree (daylist_id, finished_at) WHERE done;
+
+
+--
+-- Name: tasks_p2026_10_daylist_id_daylist_order_idx; Type: INDEX; Schema: public; Owner: -
+--
+
+CREATE INDEX tasks_p2026_10_daylist_id_daylist_order_idx ON public.tasks_p2026_10 USING btree (daylist_id, daylist_order) WHERE (NOT done);
+
+
+--
+-- Name: tasks_p2026_10_daylist_id_finished_at_idx; Type: INDEX; Schema: public; Owner: -
+--
+
+CREATE INDEX tasks_p2026_10_daylist_id_finished_at_idx ON public.tasks_p2026_10 USING btree (daylist_id, finished_at) WHERE done;
+
+
+--
+-- Name: tasks_p2026_11_daylist_id_daylist_order_idx; Type: INDEX; Schema: public; Owner: -
+--
+
+CREATE INDEX tasks_p2026_11_daylist_id_daylist_order_idx ON public.tasks_p2026_11 USING btree (daylist_id, daylist_order) WHERE (NOT done);
+
+
+--
+-- Name: tasks_p2026_11_daylist_id_finished_at_idx; Type: INDEX; Schema: public; Owner: -
+--
+
+CREATE INDEX tasks_p2026_11_daylist_id_finished_at_idx ON public.tasks_p2026_11 USING btree (daylist_id, finished_at) WHERE done;
+
+
+--
+-- Name: users_guest_created_at_idx; Type: INDEX; Schema: public; Owner: -
+--
+
+CREATE INDEX users_guest_created_at_idx ON public.users USING btree (created_at) WHERE (email IS NULL);
+
+
+--
+-- Name: tasks_default_daylist_id_daylist_order_daylist_expiry_key; Type: INDEX ATTACH; Schema: public; Owner: -
+--
+
+ALTER INDEX public.unique_task_order_in_daylist ATTACH PARTITION public.tasks_default_daylist_id_daylist_order_daylist_expiry_key;
+
+
+--
+-- Name: tasks_default_daylist_id_daylist_order_idx; Type: INDEX ATTACH; Schema: public; Owner: -
+--
+
+ALTER INDEX public.tasks_pending_daylist_order_idx ATTACH PARTITION public.tasks_default_daylist_id_daylist_order_idx;
+
+
+--
+-- Name: tasks_default_daylist_id_finished_at_idx; Type: INDEX ATTACH; Schema: public; Owner: -
+--
+
+ALTER INDEX public.tasks_done_daylist_finished_at_idx ATTACH PARTITION public.tasks_default_daylist_id_finished_at_idx;
+
+
+--
+-- Name: tasks_default_pkey; Type: INDEX ATTACH; Schema: public; Owner: -
+--
+
+ALTER INDEX public.tasks_pkey ATTACH PARTITION public.tasks_default_pkey;
+
+
+--
+-- Name: tasks_p2026_10_daylist_id_daylist_order_daylist_expiry_key; Type: INDEX ATTACH; Schema: public; Owner: -
+--
+
+ALTER INDEX public.unique_task_order_in_daylist ATTACH PARTITION public.tasks_p2026_10_daylist_id_daylist_order_daylist_expiry_key;
+
+
+--
+-- Name: tasks_p2026_10_daylist_id_daylist_order_idx; Type: INDEX ATTACH; Schema: public; Owner: -
+--
+
+ALTER INDEX public.tasks_pending_daylist_order_idx ATTACH PARTITION public.tasks_p2026_10_daylist_id_daylist_order_idx;
+
+
+--
+-- Name: tasks_p2026_10_daylist_id_finished_at_idx; Type: INDEX ATTACH; Schema: public; Owner: -
+--
+
+ALTER INDEX public.tasks_done_daylist_finished_at_idx ATTACH PARTITION public.tasks_p2026_10_daylist_id_finished_at_idx;
+
+
+--
+-- Name: tasks_p2026_10_pkey; Type: INDEX ATTACH; Schema: public; Owner: -
+--
+
+ALTER INDEX public.tasks_pkey ATTACH PARTITION public.tasks_p2026_10_pkey;
+
+
+--
+-- Name: tasks_p2026_11_daylist_id_daylist_order_daylist_expiry_key; Type: INDEX ATTACH; Schema: public; Owner: -
+--
+
+ALTER INDEX public.unique_task_order_in_daylist ATTACH PARTITION public.tasks_p2026_11_daylist_id_daylist_order_daylist_expiry_key;
+
+
+--
+-- Name: tasks_p2026_11_daylist_id_daylist_order_idx; Type: INDEX ATTACH; Schema: public; Owner: -
+--
+
+ALTER INDEX public.tasks_pending_daylist_order_idx ATTACH PARTITION public.tasks_p2026_11_daylist_id_daylist_order_idx;
+
+
+--
+-- Name: tasks_p2026_11_daylist_id_finished_at_idx; Type: INDEX ATTACH; Schema: public; Owner: -
+--
+
+ALTER INDEX public.tasks_done_daylist_finished_at_idx ATTACH PARTITION public.tasks_p2026_11_daylist_id_finished_at_idx;
+
+
+--
+-- Name: tasks_p2026_11_pkey; Type: INDEX ATTACH; Schema: public; Owner: -
+--
+
+ALTER INDEX public.tasks_pkey ATTACH PARTITION public.tasks_p2026_11_pkey;
+
+
 --
 -- Name: daylists daylists_user_id_fkey; Type: FK CONSTRAINT; Schema: public; Owner: -
 --
@@ -209,8 +654,8 @@ ALTER TABLE ONLY public.daylists
 -- Name: tasks tasks_daylist_id_fkey; Type: FK CONSTRAINT; Schema: public; Owner: -
 --
 
-ALTER TABLE ONLY public.tasks
-    ADD CONSTRAINT tasks_daylist_id_fkey FOREIGN KEY (daylist_id) REFERENCES public.daylists(id) ON DELETE CASCADE;
+ALTER TABLE public.tasks
+    ADD CONSTRAINT tasks_daylist_id_fkey FOREIGN KEY (daylist_id, daylist_expiry) REFERENCES public.daylists(id, expiry) ON UPDATE CASCADE ON DELETE CASCADE;
 
 
 --
@@ -227,4 +672,13 @@ INSERT INTO public.schema_migrations (version) VALUES
     ('20240828065735'),
     ('20240909225518'),
     ('20240926232413'),
-    ('20241015180043');
+    ('20241015180043'),
+    ('20261018090000'),
+    ('20261018100000'),
+    ('20261018110000'),
+    ('20261018120000'),
+    ('20261018130000'),
+    ('20261018140000'),
+    ('20261018150000'),
+    ('20261019090000'),
+    ('20261019100000');
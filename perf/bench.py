@@ -0,0 +1,116 @@
+"""Benchmark building and serializing today's list from a database row.
+
+Compares validating the row, then letting FastAPI validate the returned model again
+before serializing it, with the trusted path the API takes::
+
+    python -m perf.bench --tasks 500
+"""
+
+from dataclasses import dataclass
+import datetime as dt
+from functools import partial
+import timeit
+from typing import Any, Callable
+
+import pydantic_core
+from rich import print
+from rich.table import Table
+import typer
+from typing_extensions import Annotated
+
+from src.models import Daylist
+
+
+# Setup
+
+app = typer.Typer()
+
+
+@dataclass
+class Timing:
+    name: str
+    seconds: float  # per list, the best of several runs
+
+
+def list_row(tasks: int, done_every: int = 3) -> dict[str, Any]:
+    """A row as get_or_add_todaylist returns it, with every nth task done."""
+    expiry = dt.datetime.now(dt.timezone.utc) + dt.timedelta(hours=12)
+    rows = [
+        {
+            "id": task_id,
+            "title": f"task {task_id}",
+            "estimate": 600.0,
+            "done": task_id % done_every == 0,
+        }
+        for task_id in range(1, tasks + 1)
+    ]
+    return {
+        "id": 1,
+        "expiry": expiry,
+        "version": 1,
+        "pending_tasks": [row for row in rows if not row["done"]],
+        "done_tasks": [row for row in rows if row["done"]],
+    }
+
+
+# Paths from row to response body
+
+
+def validated_body(row: dict[str, Any]) -> bytes:
+    daylist = Daylist.model_validate(row)
+    # FastAPI dumps a returned model, validates the dump, then serializes that
+    return Daylist.model_validate(daylist.model_dump()).model_dump_json().encode()
+
+
+def trusted_body(row: dict[str, Any]) -> bytes:
+    return pydantic_core.to_json(Daylist.from_row(row))
+
+
+PATHS: dict[str, Callable[[dict[str, Any]], bytes]] = {
+    "validated": validated_body,
+    "trusted": trusted_body,
+}
+
+
+def run_benchmark(tasks: int, number: int = 100, repeat: int = 5) -> list[Timing]:
+    row = list_row(tasks)
+    timings = []
+    for name, path in PATHS.items():
+        runs = timeit.repeat(partial(path, row), number=number, repeat=repeat)
+        timings.append(Timing(name, min(runs) / number))
+    return timings
+
+
+# Display
+
+
+def display_timings(tasks: int, timings: list[Timing]) -> None:
+    table = Table(title=f"Today's list with {tasks} tasks, from row to response")
+    for column in ["Path", "µs per list", "Speedup"]:
+        table.add_column(column, justify="left" if column == "Path" else "right")
+
+    slowest = max(timing.seconds for timing in timings)
+    for timing in timings:
+        table.add_row(
+            timing.name,
+            f"{timing.seconds * 1_000_000:.0f}",
+            f"{slowest / timing.seconds:.1f}x",
+        )
+    print(table)
+
+
+# Commands
+
+
+@app.command()
+def main(
+    tasks: Annotated[int, typer.Option(help="Tasks in the list")] = 500,
+    number: Annotated[int, typer.Option(help="Lists built in each run")] = 100,
+    repeat: Annotated[int, typer.Option(help="Runs, of which the best is kept")] = 5,
+) -> None:
+    """Time building and serializing a list by each path."""
+    display_timings(tasks, run_benchmark(tasks, number, repeat))
+
+
+if __name__ == "__main__":
+    app()
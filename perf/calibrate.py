@@ -0,0 +1,35 @@
+"""Find the bcrypt cost to configure for this machine.
+
+Prints the highest cost, from 10 up, that hashes a password within a target time, as
+a setting to give every worker, e.g. in .env::
+
+    python -m perf.calibrate --target-ms 250
+"""
+
+from rich import print
+import typer
+from typing_extensions import Annotated
+
+from src.userauth import calibrate_password_rounds
+
+
+# Setup
+
+app = typer.Typer()
+
+
+# Commands
+
+
+@app.command()
+def main(
+    target_ms: Annotated[
+        float, typer.Option(help="Longest time to hash a password, in ms")
+    ] = 250,
+) -> None:
+    """Print a PASSWORD_ROUNDS setting that hashes within the target here."""
+    print(f"PASSWORD_ROUNDS={calibrate_password_rounds(target_ms)}")
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,278 @@
+"""Load test the API with simulated user sessions.
+
+Each virtual user logs in as a guest, reads today's list, adds tasks, completes some
+of them in bulk, then polls the agenda, pausing to "think" between requests.
+
+Against a running server::
+
+    python -m perf.load --url http://localhost:8000 --users 200
+
+Or in-process against the ASGI app, using the configured database::
+
+    python -m perf.load --users 200
+
+Every virtual user logs in from the same client IP, so the in-process app runs
+without login rate limits; start a server under test with ``RATE_LIMITS='{}'``.
+"""
+
+import asyncio
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+import math
+import random
+import time
+from typing import Any, ContextManager, Iterator, Optional
+
+import httpx
+from rich import print
+from rich.table import Table
+import typer
+from typing_extensions import Annotated
+
+
+# Setup
+
+app = typer.Typer()
+
+IN_PROCESS_URL = "http://loadtest"
+
+
+@dataclass
+class SessionConfig:
+    guest_key: str
+    tasks: int = 5
+    agenda_polls: int = 3
+    think_time: float = 0.5
+
+
+@dataclass
+class EndpointStats:
+    latencies: list[float] = field(default_factory=list)
+    errors: int = 0
+
+    def percentile(self, pct: float) -> float:
+        return percentile(self.latencies, pct)
+
+
+@dataclass
+class LoadReport:
+    elapsed: float = 0.0
+    sessions: int = 0
+    endpoints: dict[str, EndpointStats] = field(
+        default_factory=lambda: defaultdict(EndpointStats)
+    )
+
+    def requests(self) -> int:
+        return sum(len(stats.latencies) for stats in self.endpoints.values())
+
+    def throughput(self, endpoint: Optional[str] = None) -> float:
+        """Requests per second, overall or for one endpoint."""
+        if not self.elapsed:
+            return 0.0
+        if endpoint:
+            return len(self.endpoints[endpoint].latencies) / self.elapsed
+        return self.requests() / self.elapsed
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """The nearest-rank percentile of some values, e.g. pct=95 for p95."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = math.ceil(pct / 100 * len(ordered))
+    return ordered[max(rank, 1) - 1]
+
+
+# Sessions
+
+
+async def request(
+    client: httpx.AsyncClient,
+    report: LoadReport,
+    method: str,
+    url: str,
+    name: Optional[str] = None,
+    **kwargs: Any,
+) -> Optional[httpx.Response]:
+    """Send a request, timing it under its endpoint name, e.g. 'POST /task/'.
+
+    Error responses and failed connections both count as errors; a request that
+    got no response returns None, so an overloaded server doesn't end the run.
+    """
+    start = time.perf_counter()
+    stats = report.endpoints[name or f"{method} {url}"]
+    try:
+        response: Optional[httpx.Response] = await client.request(method, url, **kwargs)
+    except httpx.TransportError:
+        response = None
+    stats.latencies.append(time.perf_counter() - start)
+    if response is None or response.is_error:
+        stats.errors += 1
+    return response
+
+
+async def user_session(
+    client: httpx.AsyncClient,
+    report: LoadReport,
+    config: SessionConfig,
+    rng: random.Random,
+) -> None:
+    """One guest's visit: login, read the list, add and finish tasks, watch agenda."""
+
+    async def think() -> None:
+        if config.think_time:
+            await asyncio.sleep(rng.uniform(0, 2 * config.think_time))
+
+    login = {"username": "anonymous", "password": config.guest_key}
+    response = await request(client, report, "POST", "/user/token", data=login)
+    if response is None or response.is_error:
+        return
+    token = response.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    await request(client, report, "GET", "/today", headers=headers)
+    await think()
+
+    task_ids = []
+    for number in range(config.tasks):
+        new_task = {
+            "title": f"load test task {number}",
+            "estimate": f"PT{rng.randint(5, 90)}M",
+        }
+        response = await request(
+            client, report, "POST", "/task/", json=new_task, headers=headers
+        )
+        if response is not None and not response.is_error:
+            task_ids.append(response.json()["id"])
+        await think()
+
+    if task_ids:
+        done_ids = rng.sample(task_ids, k=rng.randint(1, len(task_ids)))
+        await request(
+            client, report, "POST", "/task/bulk/do", json=done_ids, headers=headers
+        )
+        await think()
+
+    for _ in range(config.agenda_polls):
+        await request(client, report, "GET", "/agenda", headers=headers)
+        await think()
+
+    report.sessions += 1
+
+
+async def run_load(
+    client: httpx.AsyncClient,
+    config: SessionConfig,
+    users: int = 10,
+    sessions: int = 1,
+    seed: int = 0,
+) -> LoadReport:
+    """Run concurrent virtual users, each through some sessions one after another.
+
+    Think times and task contents come from the seed, so runs are reproducible.
+    """
+    report = LoadReport()
+
+    async def virtual_user(user_number: int) -> None:
+        rng = random.Random(seed * 1_000_003 + user_number)
+        for _ in range(sessions):
+            await user_session(client, report, config, rng)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(virtual_user(number) for number in range(users)))
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+def load_client(url: Optional[str] = None, timeout: float = 30) -> httpx.AsyncClient:
+    """A client for a running server at the url, or for the app in this process."""
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    if url:
+        return httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits)
+
+    from api.main import app as api_app
+
+    transport = httpx.ASGITransport(app=api_app)
+    return httpx.AsyncClient(
+        transport=transport, base_url=IN_PROCESS_URL, timeout=timeout
+    )
+
+
+@contextmanager
+def unlimited_logins() -> Iterator[None]:
+    """Turn off the login rate limits of the app in this process, for one run."""
+    import src.operations as backend
+
+    limits = backend.SETTINGS.rate_limits
+    backend.SETTINGS.rate_limits = {}
+    try:
+        yield
+    finally:
+        backend.SETTINGS.rate_limits = limits
+
+
+# Display
+
+
+def display_report(report: LoadReport) -> None:
+    table = Table(title=f"{report.sessions} sessions in {report.elapsed:.1f}s")
+    table.add_column("Endpoint")
+    for column in ["Requests", "Errors", "Req/s", "p50 ms", "p95 ms", "p99 ms"]:
+        table.add_column(column, justify="right")
+
+    for name, stats in sorted(report.endpoints.items()):
+        table.add_row(
+            name,
+            str(len(stats.latencies)),
+            str(stats.errors),
+            f"{report.throughput(name):.1f}",
+            *(f"{stats.percentile(pct) * 1000:.1f}" for pct in [50, 95, 99]),
+        )
+    print(table)
+    print(f"Total: {report.requests()} requests, {report.throughput():.1f} req/s")
+
+
+# Commands
+
+
+@app.command()
+def main(
+    url: Annotated[
+        Optional[str], typer.Option(help="Server to test; in-process app if unset")
+    ] = None,
+    users: Annotated[int, typer.Option(help="Concurrent virtual users")] = 10,
+    sessions: Annotated[int, typer.Option(help="Sessions run by each user")] = 1,
+    tasks: Annotated[int, typer.Option(help="Tasks added in each session")] = 5,
+    polls: Annotated[int, typer.Option(help="Agenda reads in each session")] = 3,
+    think: Annotated[
+        float, typer.Option(help="Mean seconds between a user's requests")
+    ] = 0.5,
+    seed: Annotated[int, typer.Option(help="Seed for reproducible runs")] = 0,
+    guest_key: Annotated[
+        Optional[str], typer.Option(help="Guest login key; from settings if unset")
+    ] = None,
+) -> None:
+    """Simulate concurrent guest sessions and report latency for each endpoint."""
+    if guest_key is None:
+        from config import get_settings
+
+        guest_key = get_settings().guest_user_key
+    config = SessionConfig(
+        guest_key=guest_key, tasks=tasks, agenda_polls=polls, think_time=think
+    )
+
+    # virtual users share one client IP, which a running server has to allow for
+    limits: ContextManager[None] = nullcontext() if url else unlimited_logins()
+
+    async def run() -> LoadReport:
+        async with load_client(url) as client:
+            with limits:
+                return await run_load(client, config, users, sessions, seed)
+
+    report = asyncio.run(run())
+    display_report(report)
+
+
+if __name__ == "__main__":
+    app()
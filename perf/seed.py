@@ -0,0 +1,324 @@
+"""Fill a database with synthetic users, daylists and tasks for scale testing.
+
+Rows are generated in batches of users and streamed into Postgres with COPY, one
+transaction per batch. The same seed and date always generate the same data.
+
+Run against a local database that nothing else is writing to, e.g.::
+
+    python -m perf.seed --users 1000000 --lists 4 --tasks 3
+
+Ids continue from the largest existing ids, and the id sequences are moved past
+the seeded rows afterwards, so the app can keep adding rows as usual.
+"""
+
+from dataclasses import dataclass, field
+import datetime as dt
+import random
+import time
+from typing import Any, Iterable, Iterator, Optional
+
+from rich import print
+from sqlalchemy import create_engine, text
+import typer
+from typing_extensions import Annotated
+
+
+# Setup
+
+app = typer.Typer()
+
+TABLES = ["users", "daylists", "tasks"]
+COPY_COLUMNS = {
+    "users": "id, email, password_hash, registered_at",
+    "daylists": "id, user_id, expiry, created_at",
+    "tasks": (
+        "id, title, done, estimate, created_at, finished_at,"
+        " daylist_id, daylist_order, daylist_expiry"
+    ),
+}
+NULL = "\\N"
+
+VERBS = ["write", "review", "call", "plan", "fix", "read", "clean", "email", "buy"]
+NOUNS = ["report", "garden", "budget", "slides", "bike", "groceries", "inbox", "car"]
+TITLES = [f"{verb} {noun}" for verb in VERBS for noun in NOUNS]
+ESTIMATES = [str(dt.timedelta(minutes=5 * step)) for step in range(1, 25)]
+MINS_IN_DAY = 24 * 60
+
+
+@dataclass
+class SeedConfig:
+    users: int = 1000
+    guest_ratio: float = 0.5
+    lists: int = 4  # mean expired lists per user
+    active_ratio: float = 0.3
+    tasks: int = 3  # mean tasks per list
+    expired_done_ratio: float = 0.8
+    active_done_ratio: float = 0.3
+    today: dt.date = field(default_factory=dt.date.today)
+    seed: int = 0
+
+
+@dataclass
+class SeedBatch:
+    """COPY-ready lines for each table, and the next free ids after them."""
+
+    next_ids: dict[str, int]
+    rows: dict[str, list[str]] = field(
+        default_factory=lambda: {table: [] for table in TABLES}
+    )
+
+    def add(self, table: str, *values: Any) -> int:
+        row_id = self.next_ids[table]
+        self.next_ids[table] += 1
+        line = "\t".join(NULL if value is None else str(value) for value in values)
+        self.rows[table].append(f"{row_id}\t{line}\n")
+        return row_id
+
+
+class Timestamps:
+    """Formatted times, in whole minutes from midnight UTC at the start of today.
+
+    Formatting is cached, since seeded rows share relatively few distinct minutes.
+    """
+
+    def __init__(self, today: dt.date) -> None:
+        self.midnight = dt.datetime.combine(today, dt.time(), dt.timezone.utc)
+        self._aware: dict[int, str] = {}
+        self._naive: dict[int, str] = {}
+
+    def aware(self, minutes: int) -> str:
+        if minutes not in self._aware:
+            timestamp = self.midnight + dt.timedelta(minutes=minutes)
+            self._aware[minutes] = timestamp.isoformat()
+        return self._aware[minutes]
+
+    def naive(self, minutes: int) -> str:
+        """For the timestamp columns without a timezone, which hold UTC times."""
+        if minutes not in self._naive:
+            timestamp = self.midnight + dt.timedelta(minutes=minutes)
+            self._naive[minutes] = timestamp.replace(tzinfo=None).isoformat()
+        return self._naive[minutes]
+
+
+# Generation
+
+
+def generate_batch(
+    config: SeedConfig,
+    first_user: int,
+    count: int,
+    next_ids: dict[str, int],
+    password_hash: str,
+    times: Optional[Timestamps] = None,
+) -> SeedBatch:
+    """Generate rows for users number first_user up to first_user + count.
+
+    Each user has their own random generator, so the data doesn't depend on
+    the batch size.
+    """
+    batch = SeedBatch(next_ids=dict(next_ids))
+    times = times or Timestamps(config.today)
+
+    for number in range(first_user, first_user + count):
+        rng = random.Random(f"{config.seed}:{number}")
+        if rng.random() < config.guest_ratio:
+            user_id = batch.add("users", None, None, None)
+        else:
+            user_id = batch.next_ids["users"]
+            email = f"user{user_id}@seed.example.com"
+            registered_at = -int(rng.random() * 365 * MINS_IN_DAY)
+            batch.add("users", email, password_hash, times.naive(registered_at))
+
+        # expired lists cover distinct past days, so they never overlap
+        num_lists = min(int(rng.random() * (2 * config.lists + 1)), 365)
+        for days_ago in sorted(rng.sample(range(1, 366), k=num_lists), reverse=True):
+            _add_list(
+                batch,
+                rng,
+                config,
+                times,
+                user_id,
+                created_at=-days_ago * MINS_IN_DAY,
+                expiry=(1 - days_ago) * MINS_IN_DAY,
+                done_ratio=config.expired_done_ratio,
+            )
+        if rng.random() < config.active_ratio:
+            _add_list(
+                batch,
+                rng,
+                config,
+                times,
+                user_id,
+                created_at=0,  # started at midnight, as made by the rollover job
+                expiry=MINS_IN_DAY,
+                done_ratio=config.active_done_ratio,
+            )
+
+    return batch
+
+
+def _add_list(
+    batch: SeedBatch,
+    rng: random.Random,
+    config: SeedConfig,
+    times: Timestamps,
+    user_id: int,
+    created_at: int,
+    expiry: int,
+    done_ratio: float,
+) -> None:
+    daylist_expiry = times.aware(expiry)
+    daylist_id = batch.add("daylists", user_id, daylist_expiry, times.aware(created_at))
+    order = 0
+    for _ in range(int(rng.random() * (2 * config.tasks + 1))):
+        title = TITLES[int(rng.random() * len(TITLES))]
+        estimate = ESTIMATES[int(rng.random() * len(ESTIMATES))]
+        task_created = created_at + int(rng.random() * 60)
+        if rng.random() < done_ratio:
+            finished_at = task_created + 10 + int(rng.random() * 590)
+            batch.add(
+                "tasks",
+                title,
+                "t",
+                estimate,
+                times.naive(task_created),
+                times.naive(finished_at),
+                daylist_id,
+                None,
+                daylist_expiry,
+            )
+        else:
+            order += 1
+            batch.add(
+                "tasks",
+                title,
+                "f",
+                estimate,
+                times.naive(task_created),
+                None,
+                daylist_id,
+                order,
+                daylist_expiry,
+            )
+
+
+# Loading
+
+
+class CopyStream:
+    """A file-like reader over lines of text, for streaming them to COPY."""
+
+    def __init__(self, lines: Iterable[str]) -> None:
+        self._lines: Iterator[str] = iter(lines)
+        self._buffer = b""
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buffer += line.encode()
+        if size < 0:
+            size = len(self._buffer)
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+
+def seed_database(
+    url: str,
+    config: SeedConfig,
+    batch_size: int = 5000,
+    password_hash: str = "",
+) -> dict[str, int]:
+    """Generate and load the configured data, returning the row count per table."""
+    engine = create_engine(url)
+    counts = {table: 0 for table in TABLES}
+    with engine.connect() as connection:
+        next_ids = {
+            table: connection.execute(
+                text(f"SELECT coalesce(max(id), 0) + 1 FROM {table}")
+            ).scalar_one()
+            for table in TABLES
+        }
+
+    times = Timestamps(config.today)
+    raw_connection = engine.raw_connection()
+    cursor: Any = raw_connection.cursor()  # psycopg2, for copy_expert
+    try:
+        for first_user in range(0, config.users, batch_size):
+            count = min(batch_size, config.users - first_user)
+            batch = generate_batch(
+                config, first_user, count, next_ids, password_hash, times
+            )
+            # a lost batch after a crash is fine for synthetic data
+            cursor.execute("SET LOCAL synchronous_commit = off")
+            for table in TABLES:
+                cursor.copy_expert(
+                    f"COPY {table} ({COPY_COLUMNS[table]}) FROM STDIN",
+                    CopyStream(batch.rows[table]),
+                )
+                counts[table] += len(batch.rows[table])
+                if not batch.rows[table]:
+                    continue
+                # keep the id sequence past the seeded rows
+                cursor.execute(
+                    "SELECT setval(pg_get_serial_sequence(%s, 'id'), %s)",
+                    (table, batch.next_ids[table] - 1),
+                )
+            raw_connection.commit()
+            next_ids = batch.next_ids
+    finally:
+        cursor.close()
+        raw_connection.close()
+        engine.dispose()
+
+    return counts
+
+
+# Commands
+
+
+@app.command()
+def main(
+    users: Annotated[int, typer.Option(help="Users to create")] = 1000,
+    guest_ratio: Annotated[float, typer.Option(help="Share of guest users")] = 0.5,
+    lists: Annotated[int, typer.Option(help="Mean expired lists per user")] = 4,
+    active_ratio: Annotated[
+        float, typer.Option(help="Share of users with a list for today")
+    ] = 0.3,
+    tasks: Annotated[int, typer.Option(help="Mean tasks per list")] = 3,
+    seed: Annotated[int, typer.Option(help="Seed for reproducible data")] = 0,
+    batch_size: Annotated[int, typer.Option(help="Users loaded per batch")] = 5000,
+    url: Annotated[
+        Optional[str], typer.Option(help="Database url; from settings if unset")
+    ] = None,
+) -> None:
+    """Load synthetic users, daylists and tasks into the database."""
+    from config import get_settings
+    from src.userauth import hash_password
+
+    config = SeedConfig(
+        users=users,
+        guest_ratio=guest_ratio,
+        lists=lists,
+        active_ratio=active_ratio,
+        tasks=tasks,
+        seed=seed,
+    )
+    start = time.perf_counter()
+    counts = seed_database(
+        url or get_settings().database_url,
+        config,
+        batch_size=batch_size,
+        # registered users can all log in with this password
+        password_hash=hash_password("password"),
+    )
+    elapsed = time.perf_counter() - start
+
+    for table, count in counts.items():
+        print(f"{table}:\t{count:,} rows")
+    print(f"Seeded {sum(counts.values()):,} rows in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    app()
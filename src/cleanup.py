@@ -0,0 +1,142 @@
+"""Delete guest users nobody can log in as any more, and lists past retention.
+
+Rows are deleted in small batches, each its own short transaction, pausing between
+batches so the job never holds long locks on the tables requests use. Tasks are
+kept in monthly partitions, which the job makes ahead of time and retires whole
+once their lists are past retention. Run it from a scheduler::
+
+    python -m src.cleanup
+
+Or set CLEANUP_INTERVAL for each API worker to run it in the background.
+"""
+
+from dataclasses import dataclass
+import datetime as dt
+import logging
+from typing import Any, Awaitable, Callable, Optional
+
+import anyio
+import typer
+
+from config import Settings
+import src.operations as backend
+from src.metrics import REGISTRY
+
+
+# guest tokens last a day, so younger guests may still be using theirs
+MIN_GUEST_RETENTION = dt.timedelta(days=1)
+
+CLEANUP_DELETED = REGISTRY.counter(
+    "cleanup_deleted_rows_total",
+    "Rows deleted by the cleanup job, by what they were.",
+    ("kind",),
+)
+
+logger = logging.getLogger(__name__)
+app = typer.Typer()
+
+
+@dataclass
+class CleanupReport:
+    guests: int = 0
+    daylists: int = 0
+    partitions_made: int = 0
+    partitions_retired: int = 0
+
+
+async def delete_in_batches(
+    query: Callable[..., Awaitable[int]],
+    batch_size: int,
+    pause: float,
+    **params: Any,
+) -> int:
+    """Call a delete query until it deletes less than a batch, returning the total."""
+    total = 0
+    while True:
+        deleted = await query(batch_size=batch_size, **params)
+        total += deleted
+        if deleted < batch_size:
+            return total
+        await anyio.sleep(pause)
+
+
+async def run_cleanup(
+    settings: Settings, now: Optional[dt.datetime] = None
+) -> CleanupReport:
+    """Delete inactive guests, then lists that expired before the retention period.
+
+    Guests are inactive once their token has expired and they neither read a list
+    nor wrote to one within the guest retention period. A retention of 0 keeps
+    those rows.
+    Task partitions are made for the coming months first.
+    """
+    now = now or dt.datetime.now(dt.timezone.utc)
+    report = CleanupReport()
+
+    async def delete(query: Callable[..., Awaitable[int]], before: dt.datetime) -> int:
+        return await delete_in_batches(
+            query,
+            settings.cleanup_batch_size,
+            settings.cleanup_batch_pause,
+            before=before,
+        )
+
+    report.partitions_made = await backend.ADB.create_task_partitions(
+        since=now, until=now + dt.timedelta(days=31 * settings.task_partition_months)
+    )
+
+    if settings.guest_retention_days:
+        retention = dt.timedelta(days=settings.guest_retention_days)
+        report.guests = await delete(
+            backend.ADB.delete_inactive_guests,
+            before=now - max(retention, MIN_GUEST_RETENTION),
+        )
+        CLEANUP_DELETED.inc(report.guests, kind="guests")
+
+    if settings.daylist_retention_days:
+        before = now - dt.timedelta(days=settings.daylist_retention_days)
+        # whole months of old tasks go at once, then their lists in batches
+        report.partitions_retired = await backend.ADB.retire_task_partitions(
+            before=before, detach=settings.detach_task_partitions
+        )
+        report.daylists = await delete(backend.ADB.delete_expired_daylists, before)
+        CLEANUP_DELETED.inc(report.daylists, kind="daylists")
+
+    return report
+
+
+async def cleanup_forever(settings: Settings) -> None:
+    """Run the cleanup every interval until cancelled, logging any failed run."""
+    while True:
+        await anyio.sleep(settings.cleanup_interval)
+        try:
+            report = await run_cleanup(settings)
+        except Exception:
+            logger.exception("Cleanup failed, will retry next interval")
+        else:
+            logger.info(f"Cleanup finished: {report}")
+
+
+# Commands
+
+
+@app.command()
+def main() -> None:
+    """Delete inactive guest users and lists past retention, as configured."""
+
+    async def run() -> CleanupReport:
+        try:
+            return await run_cleanup(backend.SETTINGS)
+        finally:
+            await backend.ADB.disconnect()
+
+    report = anyio.run(run)
+    print(f"Deleted {report.guests} guest users and {report.daylists} lists")
+    print(
+        f"Made {report.partitions_made} task partitions,"
+        f" retired {report.partitions_retired}"
+    )
+
+
+if __name__ == "__main__":
+    app()
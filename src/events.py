@@ -0,0 +1,84 @@
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+import json
+from typing import Any, AsyncIterator
+
+import anyio
+from anyio.streams.memory import MemoryObjectReceiveStream, MemoryObjectSendStream
+
+from src.metrics import REGISTRY
+
+
+OPEN_STREAMS = REGISTRY.gauge(
+    "event_streams_open", "Event streams of list changes open in this process."
+)
+DROPPED_STREAMS = REGISTRY.counter(
+    "event_streams_dropped_total",
+    "Event streams closed because their client fell behind.",
+)
+
+
+@dataclass(frozen=True)
+class ListEvent:
+    """A change to a user's list, e.g. "added" with the ids of the new tasks."""
+
+    name: str
+    data: dict[str, Any] = field(default_factory=dict)
+
+    def encode(self) -> str:
+        """The event as a server-sent event message."""
+        data = json.dumps(self.data, separators=(",", ":"))
+        return f"event: {self.name}\ndata: {data}\n\n"
+
+
+class Broadcaster:
+    """Fans events out to every open stream of each user, within this process.
+
+    Users' streams are found by a key, such as their id. Each stream buffers up to
+    buffer events. A stream whose client falls further behind is closed, so its
+    client reconnects and reads the list afresh.
+    """
+
+    def __init__(self, buffer: int) -> None:
+        self.buffer = buffer
+        self._streams: defaultdict[str, set[MemoryObjectSendStream[ListEvent]]] = (
+            defaultdict(set)
+        )
+
+    @asynccontextmanager
+    async def subscribe(
+        self, key: str
+    ) -> AsyncIterator[MemoryObjectReceiveStream[ListEvent]]:
+        """Receive the events published for the user until the context exits."""
+        send, receive = anyio.create_memory_object_stream[ListEvent](self.buffer)
+        self._streams[key].add(send)
+        OPEN_STREAMS.inc()
+        try:
+            with receive:
+                yield receive
+        finally:
+            self._remove(key, send)
+            OPEN_STREAMS.dec()
+
+    def publish(self, key: str, event: ListEvent) -> None:
+        """Send an event to the user's open streams, without waiting for any."""
+        for send in list(self._streams.get(key, ())):
+            try:
+                send.send_nowait(event)
+            except anyio.WouldBlock:
+                self._remove(key, send)
+                DROPPED_STREAMS.inc()
+            except anyio.BrokenResourceError:
+                self._remove(key, send)
+
+    def subscribers(self, key: str) -> int:
+        return len(self._streams.get(key, ()))
+
+    def _remove(self, key: str, send: MemoryObjectSendStream[ListEvent]) -> None:
+        send.close()
+        streams = self._streams.get(key)
+        if streams is not None:
+            streams.discard(send)
+            if not streams:
+                del self._streams[key]
@@ -0,0 +1,131 @@
+"""Evict entries from every worker's in-process caches when any worker writes.
+
+Writes evict the keys they make stale here, and publish them with Postgres NOTIFY
+in the transaction of the write, so the notification is only sent if it commits,
+without a commit of its own. Each worker listens on a connection of its own and
+evicts the keys from its caches too. Notifications sent while a listener is
+disconnected are lost, so its caches are flushed when it reconnects.
+"""
+
+import json
+import logging
+from typing import Any, Hashable, Protocol
+import uuid
+
+import anyio
+import asyncpg  # type: ignore
+
+from src.metrics import REGISTRY
+
+
+CHANNEL = "cache_invalidation"
+# seconds to wait before reconnecting a listener that lost its connection
+RECONNECT_DELAY = 1
+
+INVALIDATIONS = REGISTRY.counter(
+    "cache_invalidations_total",
+    "Cache keys evicted, by cache and by whether this worker or another wrote.",
+    ("cache", "origin"),
+)
+CACHE_FLUSHES = REGISTRY.counter(
+    "cache_flushes_total",
+    "Times every cache was flushed because invalidations may have been missed.",
+)
+LISTENER_CONNECTED = REGISTRY.gauge(
+    "cache_invalidation_listener_connected",
+    "Whether this worker is listening for other workers' cache invalidations.",
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Cache(Protocol):
+    def invalidate(self, key: Any) -> None: ...
+    def clear(self) -> None: ...
+
+
+class InvalidationBus:
+    """Invalidations for the named caches of each worker, sent through Postgres.
+
+    Keys must survive a round trip through json, e.g. strings or integers. If not
+    enabled, keys are only evicted from this worker's caches.
+    """
+
+    def __init__(
+        self, queries: Any, url: str, enabled: bool = True, check_interval: float = 10
+    ) -> None:
+        self.queries = queries
+        self.url = url
+        self.enabled = enabled
+        self.check_interval = check_interval
+        # tells this worker's notifications apart, as it has evicted those keys
+        self.origin = uuid.uuid4().hex
+        self.caches: dict[str, Cache] = {}
+        self.connected = False
+
+    def register(self, name: str, cache: Cache) -> None:
+        self.caches[name] = cache
+
+    async def invalidate(self, name: str, *keys: Hashable) -> None:
+        """Evict keys from a cache here, and from the same cache in other workers.
+
+        Other workers hear of it when the current transaction commits, if one is open.
+        """
+        self._evict(name, keys, "local")
+        if self.enabled and keys:
+            payload = {"origin": self.origin, "cache": name, "keys": list(keys)}
+            await self.queries.notify(channel=CHANNEL, payload=json.dumps(payload))
+
+    def flush(self) -> None:
+        """Clear every cache, when invalidations may have been missed."""
+        for cache in self.caches.values():
+            cache.clear()
+        CACHE_FLUSHES.inc()
+
+    async def listen_forever(self) -> None:
+        """Evict the keys other workers invalidate until cancelled, reconnecting."""
+        while True:
+            try:
+                await self._listen()
+            except Exception:
+                logger.exception("Cache invalidation listener disconnected")
+            self.connected = False
+            LISTENER_CONNECTED.set(0)
+            # entries cached meanwhile may be stale, and unknown until reconnected
+            self.flush()
+            await anyio.sleep(RECONNECT_DELAY)
+
+    async def _listen(self) -> None:
+        connection = await asyncpg.connect(self.url)
+        try:
+            await connection.add_listener(CHANNEL, self._receive)
+            # writes made before the listener connected were missed
+            self.flush()
+            self.connected = True
+            LISTENER_CONNECTED.set(1)
+            # a dead connection only shows when used, so check it now and then
+            while True:
+                await anyio.sleep(self.check_interval)
+                with anyio.fail_after(self.check_interval):
+                    await connection.fetchval("SELECT 1")
+        finally:
+            connection.terminate()
+
+    def _receive(self, connection: Any, pid: int, channel: str, payload: str) -> None:
+        try:
+            message = json.loads(payload)
+            origin, name, keys = message["origin"], message["cache"], message["keys"]
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"Unreadable cache invalidation, flushing: {payload!r}")
+            self.flush()
+            return
+        if origin != self.origin:
+            self._evict(name, keys, "remote")
+
+    def _evict(self, name: str, keys: Any, origin: str) -> None:
+        cache = self.caches.get(name)
+        if cache is None:
+            return
+        for key in keys:
+            cache.invalidate(key)
+        INVALIDATIONS.inc(len(keys), cache=name, origin=origin)
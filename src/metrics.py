@@ -0,0 +1,308 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+import threading
+import time
+from typing import Any, Iterator
+
+
+LabelValues = tuple[str, ...]
+
+# latency buckets in seconds, from a fast query up to a slow request
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+# Metric types
+
+
+class Metric(ABC):
+    """A named measurement, kept as one series per combination of label values."""
+
+    kind = "untyped"
+
+    def __init__(
+        self, name: str, description: str, labels: tuple[str, ...] = ()
+    ) -> None:
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> LabelValues:
+        if labels.keys() != set(self.labels):
+            raise ValueError(
+                f"Metric {self.name} takes labels {self.labels}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def _labels(self, key: LabelValues) -> dict[str, str]:
+        return dict(zip(self.labels, key))
+
+    @abstractmethod
+    def samples(self) -> list[dict[str, Any]]:
+        """Each series' labels and values."""
+
+    @abstractmethod
+    def reset(self) -> None:
+        """Forget every series."""
+
+    def export(self) -> dict[str, Any]:
+        """Describe the metric and its current samples as plain, JSON-ready data."""
+        return {
+            "name": self.name,
+            "type": self.kind,
+            "help": self.description,
+            "samples": self.samples(),
+        }
+
+
+class Counter(Metric):
+    """A total that only goes up, such as a number of calls."""
+
+    kind = "counter"
+
+    def __init__(
+        self, name: str, description: str, labels: tuple[str, ...] = ()
+    ) -> None:
+        super().__init__(name, description, labels)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> list[dict[str, Any]]:
+        with self._lock:
+            values = list(self._values.items())
+        return [{"labels": self._labels(key), "value": value} for key, value in values]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Gauge(Metric):
+    """A value that goes up and down, such as requests in progress."""
+
+    kind = "gauge"
+
+    def __init__(
+        self, name: str, description: str, labels: tuple[str, ...] = ()
+    ) -> None:
+        super().__init__(name, description, labels)
+        self._values: dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> list[dict[str, Any]]:
+        with self._lock:
+            values = list(self._values.items())
+        return [{"labels": self._labels(key), "value": value} for key, value in values]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+@dataclass
+class HistogramValue:
+    """Observations of one histogram series, with a count per bucket.
+
+    Bucket counts are not cumulative; the final count is for values above every
+    bucket bound.
+    """
+
+    bucket_counts: list[int]
+    count: int = 0
+    sum: float = 0.0
+
+    def copy(self) -> "HistogramValue":
+        return HistogramValue(list(self.bucket_counts), self.count, self.sum)
+
+    def cumulative(self, buckets: tuple[float, ...]) -> dict[str, int]:
+        """Counts of values less than or equal to each bucket bound, and in total."""
+        totals = {}
+        running = 0
+        for bound, bucket_count in zip(buckets, self.bucket_counts):
+            running += bucket_count
+            totals[str(bound)] = running
+        totals["+Inf"] = self.count
+        return totals
+
+
+class Histogram(Metric):
+    """A distribution of measurements, such as latencies, grouped into buckets."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values: dict[LabelValues, HistogramValue] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = HistogramValue([0] * (len(self.buckets) + 1))
+                self._values[key] = series
+            series.bucket_counts[bisect_left(self.buckets, value)] += 1
+            series.count += 1
+            series.sum += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe the seconds spent in this block, even if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def value(self, **labels: str) -> HistogramValue:
+        series = self._values.get(self._key(labels))
+        if series is None:
+            return HistogramValue([0] * (len(self.buckets) + 1))
+        return series.copy()
+
+    def samples(self) -> list[dict[str, Any]]:
+        with self._lock:
+            values = [(key, series.copy()) for key, series in self._values.items()]
+        return [
+            {
+                "labels": self._labels(key),
+                "count": series.count,
+                "sum": series.sum,
+                "buckets": series.cumulative(self.buckets),
+            }
+            for key, series in values
+        ]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+# Registry
+
+
+@dataclass
+class Registry:
+    """The metrics of a process, which can be read in-process or exported."""
+
+    metrics: dict[str, Metric] = field(default_factory=dict)
+
+    def counter(
+        self, name: str, description: str, labels: tuple[str, ...] = ()
+    ) -> Counter:
+        """Get the named counter, creating it if needed."""
+        metric = self.metrics.setdefault(name, Counter(name, description, labels))
+        if not isinstance(metric, Counter):
+            raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+        return metric
+
+    def gauge(self, name: str, description: str, labels: tuple[str, ...] = ()) -> Gauge:
+        """Get the named gauge, creating it if needed."""
+        metric = self.metrics.setdefault(name, Gauge(name, description, labels))
+        if not isinstance(metric, Gauge):
+            raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        description: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        """Get the named histogram, creating it if needed."""
+        metric = self.metrics.setdefault(
+            name, Histogram(name, description, labels, buckets)
+        )
+        if not isinstance(metric, Histogram):
+            raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+        return metric
+
+    def export(self) -> list[dict[str, Any]]:
+        return [metric.export() for metric in self.metrics.values()]
+
+    def reset(self) -> None:
+        for metric in self.metrics.values():
+            metric.reset()
+
+    def render(self) -> str:
+        """Format every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics.values():
+            help_text = metric.description.replace("\\", "\\\\").replace("\n", "\\n")
+            name = metric.name
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for sample in metric.samples():
+                labels = sample["labels"]
+                if metric.kind != "histogram":
+                    lines.append(_sample_line(name, labels, sample["value"]))
+                    continue
+                for bound, count in sample["buckets"].items():
+                    bucket_labels = {**labels, "le": bound}
+                    lines.append(_sample_line(f"{name}_bucket", bucket_labels, count))
+                lines.append(_sample_line(f"{name}_sum", labels, sample["sum"]))
+                lines.append(_sample_line(f"{name}_count", labels, sample["count"]))
+        return "\n".join(lines) + "\n"
+
+
+def _sample_line(name: str, labels: dict[str, str], value: float) -> str:
+    if labels:
+        label_text = ",".join(
+            f'{label}="{_escape_label(label_value)}"'
+            for label, label_value in labels.items()
+        )
+        name = f"{name}{{{label_text}}}"
+    return f"{name} {value}"
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REGISTRY = Registry()
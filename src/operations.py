@@ -1,19 +1,63 @@
+from dataclasses import dataclass
 import datetime as dt
-from typing import Optional
+import json
+from typing import AsyncIterator, Optional
 
+import anyio
 from sqlalchemy.exc import IntegrityError
 
 from config import get_settings
-from db.connect import query_connect, DBQueriesWrapper
-from src.models import Daylist, Agenda, AgendaItem, Task, NewTask
+from db.connect import (
+    async_query_connect,
+    query_connect,
+    AsyncDBQueriesWrapper,
+    DBQueriesWrapper,
+)
+from src.cache import TTLCache
+from src.events import Broadcaster, ListEvent
+from src.invalidation import InvalidationBus
+from src.metrics import REGISTRY
+from src.models import Daylist, Agenda, Task, NewTask
 from src.utils import next_midnight, next_timepoint
 
 
 SETTINGS = get_settings()
-DB: DBQueriesWrapper = query_connect(SETTINGS.database_url)
+DB: DBQueriesWrapper = query_connect(
+    SETTINGS.database_url, **SETTINGS.db_pool_options()
+)
+# the API awaits its queries instead of holding a thread for each one
+ADB: AsyncDBQueriesWrapper = async_query_connect(
+    SETTINGS.database_url, **SETTINGS.db_pool_options()
+)
+# changes to lists, sent to the streams open in this process
+EVENTS = Broadcaster(SETTINGS.stream_buffer)
+# entries of in-process caches made stale by writes, evicted from every worker
+BUS = InvalidationBus(
+    ADB,
+    SETTINGS.database_url,
+    enabled=SETTINGS.cache_invalidation,
+    check_interval=SETTINGS.cache_invalidation_check,
+)
 
+# agenda timelines by user id, used while the version of their list is unchanged,
+# so writes in any worker make them stale without telling the others
+AGENDA_CACHE: TTLCache[int, "AgendaPlan"] = TTLCache(
+    maxsize=SETTINGS.agenda_cache_size, ttl=SETTINGS.agenda_cache_ttl
+)
 
-def get_or_make_todaylist(
+TODAYLISTS = REGISTRY.counter(
+    "todaylists_total",
+    "Today's lists requested, by whether they were created or fetched.",
+    ("result",),
+)
+AGENDA_CACHE_LOOKUPS = REGISTRY.counter(
+    "agenda_cache_lookups_total",
+    "Agendas read, by whether the cache held a current timeline.",
+    ("result",),
+)
+
+
+async def get_or_make_todaylist(
     uid: int, user_expiry: Optional[dt.time] = None
 ) -> tuple[bool, Daylist]:
     """Get or create an unexpired daylist for today, for a placeholder user.
@@ -22,81 +66,227 @@ def get_or_make_todaylist(
     - bool: does this function call create the list or merely get it?
     - list: the list content
     """
-    is_new = False
-    with DB.transaction():
-        active_daylist = DB.get_active_daylist(user_id=uid)
-
-        if active_daylist:
-            active_daylist["pending_tasks"] = list(DB.get_pending_tasks(user_id=uid))
-            active_daylist["done_tasks"] = list(DB.get_done_tasks(user_id=uid))
-        else:
-            # handle optional user-provided expiry time
-            if user_expiry:
-                set_expiry = next_timepoint(user_expiry)
+    # handle optional user-provided expiry time, used only if a list is created
+    set_expiry = list_expiry(user_expiry)
+
+    # list and its grouped tasks arrive in a single query, created if needed
+    todaylist = await ADB.get_or_add_todaylist(user_id=uid, expiry=set_expiry)
+    if todaylist is None or todaylist["is_stale"]:
+        # a concurrent request created the list first, or this one copied yesterday's
+        # pending tasks into it, so it can be read now
+        todaylist = await ADB.get_or_add_todaylist(user_id=uid, expiry=set_expiry)
+
+    is_new = bool(todaylist and todaylist.pop("is_new"))
+    TODAYLISTS.inc(result="created" if is_new else "fetched")
+    return (is_new, Daylist.from_row(todaylist))  # type: ignore
+
+
+def list_expiry(user_expiry: Optional[dt.time] = None) -> dt.datetime:
+    """When a list made now expires: at the user's time, or midnight UTC."""
+    if user_expiry:
+        return next_timepoint(user_expiry)
+    return next_midnight("utc")
+
+
+def stream_key(uid: int, guest_key: Optional[str] = None) -> str:
+    """The key of a user's streams: a guest's key, which they keep once stored."""
+    return guest_key or str(uid)
+
+
+async def get_todaylist_version(uid: int) -> Optional[tuple[int, int]]:
+    """Get the id and version of the user's unexpired list, if they have one."""
+    daylist = await ADB.get_active_daylist(user_id=uid)
+    if daylist is None:
+        return None
+    return (daylist["id"], daylist["version"])  # type: ignore
+
+
+# seconds between checks for the next list, while the database still has the one
+# that expired by this process's clock
+EXPIRED_LIST_RECHECK = 1.0
+
+
+async def follow_todaylist(
+    uid: int, keepalive: float, guest_key: Optional[str] = None
+) -> AsyncIterator[Optional[ListEvent]]:
+    """Yield events for changes to the user's list as they happen, until closed.
+
+    Yields "expired" once when the list expires, and None after keepalive seconds
+    without events. Waiting holds no database connection, only the list's expiry.
+    A guest without a row (uid 0) has no list to look up until a change stores them.
+    """
+
+    async def current() -> tuple[int, Optional[dt.datetime]]:
+        nonlocal uid
+        if not uid and guest_key:
+            guest = await ADB.get_guest_user(guest_key=guest_key)
+            if guest is None:
+                return (0, None)
+            uid = guest["id"]  # type: ignore
+        daylist = await ADB.get_active_daylist(user_id=uid)
+        if daylist is None:
+            return (0, None)
+        return (daylist["id"], daylist["expiry"])  # type: ignore
+
+    async with EVENTS.subscribe(stream_key(uid, guest_key)) as events:
+        daylist_id, expiry = await current() if uid else (0, None)
+        expired_id = 0
+        while True:
+            now = dt.datetime.now(dt.timezone.utc)
+            wait = keepalive
+            if daylist_id and daylist_id == expired_id:
+                # the database's clock is behind, so it still finds the expired list
+                wait = min(wait, EXPIRED_LIST_RECHECK)
+            elif expiry is not None:
+                wait = max(0, min(wait, (expiry - now).total_seconds()))
+
+            event = None
+            with anyio.move_on_after(wait):
+                try:
+                    event = await events.receive()
+                except anyio.EndOfStream:
+                    return  # dropped for falling behind
+
+            if event is not None:
+                yield event
+                if expiry is None:
+                    # changes mean there is a list now, which will expire
+                    daylist_id, expiry = await current()
+            elif expiry is not None and expiry <= dt.datetime.now(dt.timezone.utc):
+                if daylist_id != expired_id:
+                    yield ListEvent("expired", {"id": daylist_id})
+                    expired_id = daylist_id
+                else:
+                    yield None
+                # the next list may already be made by the rollover job
+                daylist_id, expiry = await current()
             else:
-                set_expiry = next_midnight("utc")
-            DB.add_daylist(user_id=uid, expiry=set_expiry)
-            active_daylist = DB.get_active_daylist(user_id=uid)
-            is_new = True
-
-    return (is_new, Daylist.model_validate(active_daylist))
-
-
-def build_agenda(daylist: Daylist) -> Agenda:
-    timestamp = dt.datetime.now(dt.timezone.utc).replace(second=0, microsecond=0)
-    items = []
-    for task in daylist.pending_tasks:
-        items.append(
-            AgendaItem(
-                title=task.title,
-                start=timestamp,
-                end=timestamp + task.estimate,
-            )
+                yield None
+
+
+def agenda_start() -> dt.datetime:
+    """The time an agenda built now starts at, to the minute."""
+    return dt.datetime.now(dt.timezone.utc).replace(second=0, microsecond=0)
+
+
+@dataclass(frozen=True)
+class AgendaPlan:
+    """The timeline of a version of a list, with times as offsets from its start.
+
+    Agendas start at the current minute, so a plan is anchored to it when read.
+    """
+
+    daylist_id: int
+    version: int
+    expiry: dt.datetime
+    # each pending task's title, and when it starts and ends after the agenda starts
+    items: tuple[tuple[str, dt.timedelta, dt.timedelta], ...]
+    length: dt.timedelta
+
+    @classmethod
+    def from_daylist(cls, daylist: Daylist) -> "AgendaPlan":
+        offset = dt.timedelta(0)
+        items = []
+        for task in daylist.pending_tasks:
+            items.append((task.title, offset, offset + task.estimate))
+            offset += task.estimate
+        return cls(daylist.id, daylist.version, daylist.expiry, tuple(items), offset)
+
+    def anchor(self, start: dt.datetime) -> Agenda:
+        finish = start + self.length
+        # validating the timeline in one call is faster than building each item
+        timeline = [
+            {"title": title, "start": start + begins, "end": start + ends}
+            for title, begins, ends in self.items
+        ]
+        return Agenda.model_validate(
+            {
+                "timeline": timeline,
+                "expiry": self.expiry,
+                "finish": finish,
+                "past_expiry": finish > self.expiry,
+            }
         )
-        timestamp += task.estimate
 
-    return Agenda(
-        timeline=items,
-        expiry=daylist.expiry,
-        finish=timestamp,
-        past_expiry=(timestamp > daylist.expiry),
-    )
 
+def build_agenda(daylist: Daylist, start: Optional[dt.datetime] = None) -> Agenda:
+    return AgendaPlan.from_daylist(daylist).anchor(start or agenda_start())
+
+
+async def get_or_make_agenda(
+    uid: int, user_expiry: Optional[dt.time] = None
+) -> tuple[bool, AgendaPlan]:
+    """Get the timeline of the user's list for today, creating the list if needed.
+
+    Returns a tuple like get_or_make_todaylist. A cached timeline is used if the
+    list's id and version still match, so only those are looked up.
+    """
+    cached = AGENDA_CACHE.get(uid)
+    if cached is not None:
+        current = await get_todaylist_version(uid)
+        if current == (cached.daylist_id, cached.version):
+            AGENDA_CACHE_LOOKUPS.inc(result="hit")
+            return (False, cached)
+    AGENDA_CACHE_LOOKUPS.inc(result="miss")
+
+    created, daylist = await get_or_make_todaylist(uid, user_expiry)
+    plan = AgendaPlan.from_daylist(daylist)
+    AGENDA_CACHE.set(uid, plan)
+    return (created, plan)
 
-def create_task(uid: int, task: NewTask) -> Task | None:
+
+async def create_task(
+    uid: int, task: NewTask, guest_key: Optional[str] = None
+) -> Task | None:
     """Create a new task in the user's list and return it."""
+    created_tasks = await create_tasks(uid, [task], guest_key)
+    if not created_tasks:
+        return None
+    return created_tasks[0]
+
+
+async def create_tasks(
+    uid: int, tasks: list[NewTask], guest_key: Optional[str] = None
+) -> list[Task] | None:
+    """Create new tasks at the end of the user's list, in order, and return them.
+
+    Guests' streams are found by their guest key, which they are given if set.
+    """
+    new_tasks = json.dumps([task.model_dump(mode="json") for task in tasks])
     try:
-        with DB.transaction():
-            task_id = DB.add_task_for_user(
-                user_id=uid, title=task.title, estimate=task.estimate
-            )
-            new_task = DB.get_task(id=task_id)
-            return Task(**new_task)  # type: ignore
+        created = [
+            Task.from_row(new_task)
+            for new_task in await ADB.add_tasks_for_user(user_id=uid, tasks=new_tasks)
+        ]
     except IntegrityError:
         return None
+    added = ListEvent("added", {"ids": [task.id for task in created]})
+    EVENTS.publish(stream_key(uid, guest_key), added)
+    return created
 
 
-def mark_tasks_done(user_id: int, task_ids: list[int]) -> tuple[bool, list[int]]:
+async def mark_tasks_done(
+    user_id: int, task_ids: list[int], guest_key: Optional[str] = None
+) -> tuple[bool, list[int]]:
     """Complete task(s) from user's list. Return success status and ids.
 
     The returned tuple contains a boolean indicating if the operation succeeded.
     * If successful, the returned ids are all the tasks now marked done.
     * Otherwise, the returned ids indicate invalid task ids that could not be affected.
     """
-    unique_task_ids = set(task_ids)
-    with DB.transaction():
-        list_tasks = [task["id"] for task in DB.get_current_tasks(user_id=user_id)]
-
-        invalid_tasks = [id for id in unique_task_ids if id not in list_tasks]
-        if invalid_tasks:
-            return (False, invalid_tasks)
-        else:
-            for task_id in unique_task_ids:
-                DB.complete_task(id=task_id)
-            return (True, sorted(list(unique_task_ids)))
+    results = list(
+        await ADB.complete_tasks_for_user(
+            user_id=user_id, task_ids=json.dumps(task_ids)
+        )
+    )
+    return await _publish_task_results(
+        user_id, guest_key, "done", _split_task_results(results)
+    )
 
 
-def mark_tasks_pending(user_id: int, task_ids: list[int]) -> tuple[bool, list[int]]:
+async def mark_tasks_pending(
+    user_id: int, task_ids: list[int], guest_key: Optional[str] = None
+) -> tuple[bool, list[int]]:
     """Mark done task(s) from user's list as pending. Return success status and ids.
 
     The returned tuple contains a boolean indicating if the operation succeeded.
@@ -106,17 +296,33 @@ def mark_tasks_pending(user_id: int, task_ids: list[int]) -> tuple[bool, list[in
     Only 'done' tasks are affected by this action.
     Already-pending tasks are valid input but are not affected.
     """
-    unique_task_ids = set(task_ids)
-    with DB.transaction():
-        list_tasks = {
-            task["id"]: task for task in DB.get_current_tasks(user_id=user_id)
-        }
-
-        invalid_tasks = [id for id in unique_task_ids if id not in list_tasks.keys()]
-        if invalid_tasks:
-            return (False, invalid_tasks)
-        else:
-            done_tasks = [id for id in unique_task_ids if list_tasks[id]["done"]]
-            for task_id in done_tasks:
-                DB.uncomplete_task(id=task_id)
-            return (True, done_tasks)
+    results = list(
+        await ADB.uncomplete_tasks_for_user(
+            user_id=user_id, task_ids=json.dumps(task_ids)
+        )
+    )
+    return await _publish_task_results(
+        user_id, guest_key, "pending", _split_task_results(results)
+    )
+
+
+def _split_task_results(results: list[dict[str, int | bool]]) -> tuple[bool, list[int]]:
+    """Interpret the rows of a bulk task update as a success status and ids.
+
+    Bulk updates are all or nothing: any invalid id means nothing was affected.
+    """
+    invalid_tasks = [int(row["id"]) for row in results if not row["valid"]]
+    if invalid_tasks:
+        return (False, invalid_tasks)
+    return (True, [int(row["id"]) for row in results])
+
+
+async def _publish_task_results(
+    user_id: int, guest_key: Optional[str], name: str, result: tuple[bool, list[int]]
+) -> tuple[bool, list[int]]:
+    """Tell the user's streams about the tasks a bulk update changed."""
+    successful, task_ids = result
+    if successful and task_ids:
+        changed = ListEvent(name, {"ids": task_ids})
+        EVENTS.publish(stream_key(user_id, guest_key), changed)
+    return result
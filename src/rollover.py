@@ -0,0 +1,112 @@
+"""Make users' next lists before their lists expire, so requests find them ready.
+
+Lists for today mostly expire at midnight UTC, so otherwise the first request from
+every user after midnight would make a list at the same moment. The job makes the
+next list for each user whose latest list is about to expire, starting when it
+expires, in batches with a pause between them. Idle users are left for their next
+request, or their lists would roll over forever. Users given a next list are skipped
+when the job runs again, so an interrupted run can simply be repeated::
+
+    python -m src.rollover
+
+Or set ROLLOVER_INTERVAL for each API worker to run it in the background.
+"""
+
+from dataclasses import dataclass
+import datetime as dt
+import logging
+from typing import Optional
+
+import anyio
+import typer
+
+from config import Settings
+import src.operations as backend
+from src.metrics import REGISTRY
+
+
+ROLLOVER_DAYLISTS = REGISTRY.counter(
+    "rollover_daylists_total",
+    "Next lists made by the rollover job, by whether a request made them first.",
+    ("result",),
+)
+
+logger = logging.getLogger(__name__)
+app = typer.Typer()
+
+
+@dataclass
+class RolloverReport:
+    daylists: int = 0
+    skipped: int = 0  # a request made the user's next list first
+
+
+async def run_rollover(
+    settings: Settings, now: Optional[dt.datetime] = None
+) -> RolloverReport:
+    """Make the next list for users whose unexpired lists expire within the window.
+
+    Users whose lists have already expired are left for their next request, as are
+    users who neither read a list recently nor wrote to the expiring one.
+    """
+    now = now or dt.datetime.now(dt.timezone.utc)
+    until = now + dt.timedelta(seconds=settings.rollover_ahead)
+    active_since = now - dt.timedelta(days=settings.rollover_active_days)
+    report = RolloverReport()
+    # lists are visited in order of expiry and id, continuing after the last batch
+    after_expiry, after_id = now, 0
+
+    while True:
+        rows = list(
+            await backend.ADB.add_next_daylists(
+                after_expiry=after_expiry,
+                after_id=after_id,
+                until=until,
+                active_since=active_since,
+                batch_size=settings.rollover_batch_size,
+                carry_over=settings.rollover_carry_over,
+            )
+        )
+        made = sum(1 for row in rows if row["next_id"] is not None)
+        report.daylists += made
+        report.skipped += len(rows) - made
+        ROLLOVER_DAYLISTS.inc(made, result="made")
+        ROLLOVER_DAYLISTS.inc(len(rows) - made, result="skipped")
+
+        if len(rows) < settings.rollover_batch_size:
+            return report
+        after_expiry, after_id = rows[-1]["expiry"], rows[-1]["id"]  # type: ignore
+        await anyio.sleep(settings.rollover_batch_pause)
+
+
+async def rollover_forever(settings: Settings) -> None:
+    """Run the rollover every interval until cancelled, logging any failed run."""
+    while True:
+        try:
+            report = await run_rollover(settings)
+        except Exception:
+            logger.exception("Rollover failed, will retry next interval")
+        else:
+            logger.info(f"Rollover finished: {report}")
+        await anyio.sleep(settings.rollover_interval)
+
+
+# Commands
+
+
+@app.command()
+def main() -> None:
+    """Make the next lists of users whose lists are about to expire, as configured."""
+
+    async def run() -> RolloverReport:
+        try:
+            return await run_rollover(backend.SETTINGS)
+        finally:
+            await backend.ADB.disconnect()
+
+    report = anyio.run(run)
+    print(f"Made {report.daylists} lists, {report.skipped} were already made")
+
+
+if __name__ == "__main__":
+    app()
@@ -1,40 +1,108 @@
+from functools import lru_cache
 import logging
+from anyio import to_process, to_thread, CapacityLimiter
+from anyio.lowlevel import RunVar
 from passlib.context import CryptContext
 from sqlalchemy.exc import IntegrityError
 import re
-from typing import Optional
+import time
+from typing import Any, Callable, Optional, TypeVar
+import uuid
 
 import src.operations as backend
-from src.models import User, UserFromDB
+from src.cache import TTLCache
+from src.metrics import REGISTRY
+from src.models import LazyGuest, User, UserFromDB
 
 
 # silence a passlib/bcrypt warning
 logging.getLogger("passlib").setLevel(logging.ERROR)
 
-#
+# token subjects are user ids, or guest keys for guests who may have no row yet;
+# older tokens used emails, or the anon prefix for guests
+USER_ID_PATTERN = r"\d+"
+GUEST_PREFIX = "guest:"
+GUEST_PATTERN = GUEST_PREFIX + r"[0-9a-f]{8}-([0-9a-f]{4}-){3}[0-9a-f]{12}"
 ANON_PREFIX = "anon:"
 ANON_PATTERN = ANON_PREFIX + r"\d+"
 GUEST_USER_KEY = backend.SETTINGS.guest_user_key
 
-pw_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt costs: calibration stays at or above the minimum, however slow the machine
+MIN_CALIBRATED_ROUNDS = 10
+MAX_ROUNDS = 31
+# token-authenticated requests read their user from here instead of the database,
+# so lazy guests' reads need no queries at all
+USER_CACHE: TTLCache[str, UserFromDB] = TTLCache(
+    maxsize=backend.SETTINGS.user_cache_size, ttl=backend.SETTINGS.user_cache_ttl
+)
+backend.BUS.register("users", USER_CACHE)
+USER_CACHE_LOOKUPS = REGISTRY.counter(
+    "user_cache_lookups_total",
+    "Users looked up by token subject, by whether the cache held them.",
+    ("result",),
+)
+GUESTS_STORED = REGISTRY.counter(
+    "guests_stored_total", "Lazy guests given a database row by their first write."
+)
+PASSWORD_DURATION = REGISTRY.histogram(
+    "password_hash_duration_seconds",
+    "Time spent hashing or verifying passwords, including waiting for a worker.",
+    ("operation",),
+)
+PASSWORD_ROUNDS = REGISTRY.gauge(
+    "password_hash_rounds", "The bcrypt cost of new password hashes."
+)
+PASSWORD_REHASHES = REGISTRY.counter(
+    "password_rehashes_total",
+    "Password hashes replaced at login because their cost was outdated.",
+)
+PASSWORD_REJECTIONS = REGISTRY.counter(
+    "password_queue_rejections_total",
+    "Password operations refused because too many were waiting for a worker.",
+    ("operation",),
+)
+# one limiter per event loop, which bounds the worker processes it starts
+PASSWORD_LIMITER: RunVar[CapacityLimiter] = RunVar("password_limiter")
+
+T = TypeVar("T")
+
+# the cost of new hashes, which configure() sets from the settings
+password_rounds = backend.SETTINGS.password_rounds
+PASSWORD_ROUNDS.set(password_rounds)
+
+
+class PasswordQueueFull(Exception):
+    """Too many password operations are already waiting for a worker."""
 
 
 # User operations
 
 
-def fetch_user(
+async def fetch_user(
     id: Optional[int] = None, email: Optional[str] = None, sub: Optional[str] = None
 ) -> UserFromDB | None:
     if sub:
+        cached_user = USER_CACHE.get(sub)
+        USER_CACHE_LOOKUPS.inc(result="hit" if cached_user else "miss")
+        if cached_user:
+            return cached_user
+
         # recursive branch
-        if re.fullmatch(ANON_PATTERN, sub):
-            return fetch_user(id=int(sub.strip(ANON_PREFIX)))
+        if re.fullmatch(USER_ID_PATTERN, sub):
+            user = await fetch_user(id=int(sub))
+        elif re.fullmatch(GUEST_PATTERN, sub):
+            user = await fetch_guest(sub.removeprefix(GUEST_PREFIX))
+        elif re.fullmatch(ANON_PATTERN, sub):
+            user = await fetch_user(id=int(sub.strip(ANON_PREFIX)))
         else:
-            return fetch_user(email=sub)
+            user = await fetch_user(email=sub)
+        if user:
+            USER_CACHE.set(sub, user)
+        return user
     elif email:
-        user_dict = backend.DB.get_registered_user(email=email)
+        user_dict = await backend.ADB.get_registered_user(email=email)
     elif id:
-        user_dict = backend.DB.get_user(id=id)
+        user_dict = await backend.ADB.get_user(id=id)
     else:
         raise ValueError("Requires id, email, or token sub value")
 
@@ -43,21 +111,74 @@ def fetch_user(
     return None
 
 
+async def fetch_guest(guest_key: str) -> UserFromDB:
+    """Find a guest's row, or a lazy guest if they haven't written anything yet."""
+    user_dict = await backend.ADB.get_guest_user(guest_key=guest_key)
+    if user_dict:
+        return UserFromDB(**user_dict)  # type: ignore
+    return LazyGuest(guest_key=guest_key)
+
+
+async def fetch_token_user(sub: str, version: Optional[int]) -> UserFromDB | None:
+    """Find the user a token was issued to, if the token is still current.
+
+    Tokens name the user by id or guest key, with the version of the user they
+    were issued for. Tokens from before versions have no version, and name users
+    by a legacy sub.
+    """
+    if version is None:
+        if not backend.SETTINGS.accept_legacy_tokens:
+            return None
+        return await fetch_user(sub=sub)
+    if not re.fullmatch(USER_ID_PATTERN, sub) and not re.fullmatch(GUEST_PATTERN, sub):
+        return None
+
+    user = await fetch_user(sub=sub)
+    if user and user.version < version:
+        # cached before the user changed, e.g. in another worker process
+        USER_CACHE.invalidate(sub)
+        user = await fetch_user(sub=sub)
+    if user and user.version == version:
+        return user
+    return None
+
+
 def make_user_sub(user: User) -> str:
-    return user.email or ANON_PREFIX + str(user.id)
+    if isinstance(user, LazyGuest):
+        return GUEST_PREFIX + user.guest_key
+    return str(user.id)
 
 
-def authenticate_user(user_email: str, pw: str | None) -> UserFromDB | None:
+async def authenticate_user(user_email: str, pw: str | None) -> UserFromDB | None:
     if not pw:
         return None
 
-    user = fetch_user(email=user_email)
-    if user and user.password_hash and verify_password(pw, user.password_hash):
-        return user
+    user = await fetch_user(email=user_email)
+    if user and user.password_hash:
+        valid, new_hash = await run_password_op(
+            "verify", _verify_and_update, pw, user.password_hash, password_rounds
+        )
+        if valid:
+            if new_hash:
+                await _store_rehash(user, user.password_hash, new_hash)
+            return user
 
     return None
 
 
+async def _store_rehash(user: UserFromDB, old_hash: str, new_hash: str) -> None:
+    """Replace a user's hash with one at the current cost, unless it just changed."""
+    async with backend.ADB.transaction():
+        stored = await backend.ADB.update_password_hash(
+            id=user.id, password_hash=old_hash, new_hash=new_hash
+        )
+        if stored:
+            await backend.BUS.invalidate("users", make_user_sub(user), user.email)
+    if stored:
+        PASSWORD_REHASHES.inc()
+        user.password_hash = new_hash
+
+
 def acceptable_user_creds(email: str, pw: str) -> bool:
     """Provide very basic validation checks for email structure and pw length."""
     email_pat = r"[^@\s]+@[^@\s]+\.[^@\s]+"  # general email structure: ___@__._
@@ -68,43 +189,162 @@ def acceptable_user_creds(email: str, pw: str) -> bool:
     return bool(good_email and good_pw)
 
 
-def create_user(email: str, pw: str) -> int | None:
+async def create_user(email: str, pw: str) -> int | None:
+    password_hash = await run_password_op("hash", _hash, pw, password_rounds)
     try:
-        new_uid = backend.DB.add_registered_user(
-            email=email, password_hash=hash_password(pw)
-        )
+        async with backend.ADB.transaction():
+            new_uid = await backend.ADB.add_registered_user(
+                email=email, password_hash=password_hash
+            )
+            await backend.BUS.invalidate("users", email)
         return new_uid
     except IntegrityError:
         # username already exists, or other error
         return None
 
 
-def create_guest_user(pw: str) -> UserFromDB | None:
+async def create_guest_user(pw: str) -> UserFromDB | None:
+    """Make a guest for a new token, who is only stored once they write something.
+
+    The guest is cached, so their reads in this worker need no query to find that
+    they have no row.
+    """
     # use a password so guests are only created by system
     if pw != GUEST_USER_KEY:
         return None
 
-    new_uid = backend.DB.add_anon_user()
-    return fetch_user(id=new_uid)
-
-
-def populate_guest_user(user: User, email: str, pw: str) -> bool:
+    guest = LazyGuest(guest_key=str(uuid.uuid4()))
+    USER_CACHE.set(make_user_sub(guest), guest)
+    return guest
+
+
+async def materialize_guest(guest: LazyGuest) -> UserFromDB:
+    """Store a lazy guest, or find them if a concurrent request already did."""
+    async with backend.ADB.transaction():
+        user_dict = await backend.ADB.add_guest_user(guest_key=guest.guest_key)
+        # other workers may have cached the guest as lazy
+        await backend.BUS.invalidate("users", GUEST_PREFIX + guest.guest_key)
+    GUESTS_STORED.inc()
+    user = UserFromDB(**user_dict)  # type: ignore
+    USER_CACHE.set(GUEST_PREFIX + guest.guest_key, user)
+    return user
+
+
+async def populate_guest_user(user: UserFromDB, email: str, pw: str) -> Optional[int]:
+    """Register a guest with the credentials, returning their id, or None if taken.
+
+    A lazy guest is only stored once their password is hashed, so requests that
+    fail before then leave no row behind.
+    """
+    password_hash = await run_password_op("hash", _hash, pw, password_rounds)
+    if isinstance(user, LazyGuest):
+        user = await materialize_guest(user)
+    # the guest's tokens now find a registered user at a new version
+    subs = [make_user_sub(user), ANON_PREFIX + str(user.id), email]
+    if user.guest_key:
+        subs.append(GUEST_PREFIX + user.guest_key)
     try:
-        num_affected = backend.DB.register_anon_user(
-            id=user.id, email=email, password_hash=hash_password(pw)
-        )
-        return num_affected == 1
+        async with backend.ADB.transaction():
+            num_affected = await backend.ADB.register_anon_user(
+                id=user.id, email=email, password_hash=password_hash
+            )
+            await backend.BUS.invalidate("users", *subs)
+        return user.id if num_affected == 1 else None
     except IntegrityError:
         # username already exists, or other error
-        return False
+        return None
 
 
 # Password helpers
+# note: bcrypt is slow by design, so async callers run it in worker processes
+
+
+async def run_password_op(operation: str, func: Callable[..., T], *args: Any) -> T:
+    """Run a password function in a worker, or refuse if too many are waiting.
+
+    Workers are processes, so hashing uses every core and leaves the event loop
+    and its threads free; with PASSWORD_WORKERS=0 they are threads instead.
+    """
+    settings = backend.SETTINGS
+    limiter = _password_limiter()
+    if limiter.statistics().tasks_waiting >= settings.password_queue_size:
+        PASSWORD_REJECTIONS.inc(operation=operation)
+        raise PasswordQueueFull()
+
+    with PASSWORD_DURATION.time(operation=operation):
+        if settings.password_workers:
+            return await to_process.run_sync(func, *args, limiter=limiter)
+        return await to_thread.run_sync(func, *args, limiter=limiter)
+
+
+def _password_limiter() -> CapacityLimiter:
+    try:
+        return PASSWORD_LIMITER.get()
+    except LookupError:
+        limiter = CapacityLimiter(max(backend.SETTINGS.password_workers, 1))
+        PASSWORD_LIMITER.set(limiter)
+        return limiter
+
+
+def set_password_rounds(rounds: int) -> None:
+    """Hash new passwords at this cost, and rehash others at login to match it."""
+    global password_rounds
+    password_rounds = rounds
+    PASSWORD_ROUNDS.set(rounds)
+
+
+def calibrate_password_rounds(
+    target_ms: float, min_rounds: int = MIN_CALIBRATED_ROUNDS
+) -> int:
+    """The highest bcrypt cost that hashes a password within target_ms here.
+
+    Each extra round doubles the time, so this stops at the first cost over the
+    target. Run once through perf.calibrate, and configure its result for every
+    worker.
+    """
+    rounds = min_rounds
+    while rounds < MAX_ROUNDS and _time_hash(rounds + 1) * 1000 <= target_ms:
+        rounds += 1
+    return rounds
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pw_context.verify(plain_password, hashed_password)
+    with PASSWORD_DURATION.time(operation="verify"):
+        return _context(password_rounds).verify(plain_password, hashed_password)
 
 
 def hash_password(password: str) -> str:
-    return pw_context.hash(password)
+    with PASSWORD_DURATION.time(operation="hash"):
+        return _hash(password, password_rounds)
+
+
+# note: worker processes have their own module state, so costs are passed to them
+
+
+@lru_cache
+def _context(rounds: int) -> CryptContext:
+    # hashes at any other cost need updating
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds,
+    )
+
+
+def _hash(password: str, rounds: int) -> str:
+    return _context(rounds).hash(password)
+
+
+def _verify_and_update(
+    plain_password: str, hashed_password: str, rounds: int
+) -> tuple[bool, str | None]:
+    """Check a password, and make a new hash for it if the old one's cost is wrong."""
+    return _context(rounds).verify_and_update(plain_password, hashed_password)
+
+
+def _time_hash(rounds: int) -> float:
+    start = time.perf_counter()
+    _hash("calibration", rounds)
+    return time.perf_counter() - start
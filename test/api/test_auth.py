@@ -1,6 +1,9 @@
+import jwt
 import pytest
 
-from src.userauth import hash_password
+from api.routes.auth import create_token, ALGORITHM, SECRET_KEY
+import src.operations as backend
+from src.userauth import hash_password, PasswordQueueFull
 from test.helpers import auth_headers
 
 
@@ -49,6 +52,45 @@ def test_get_user_deleted(client, db, known_user):
     assert response.status_code == 401
 
 
+def test_token_claims(client, known_user):
+    form_data = {"username": known_user["email"], "password": known_user["password"]}
+    token = client.post("/user/token", data=form_data).json()["access_token"]
+
+    claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    assert claims["sub"] == str(known_user["id"])
+    assert claims["ver"] == 1
+
+
+def test_get_user_old_version(client, known_user):
+    token = create_token(data={"sub": str(known_user["id"]), "ver": 2})
+    response = client.get("/user", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 401
+
+
+@pytest.mark.parametrize("claims", [{"sub": "one@test.com", "ver": 1}, {"ver": 1}])
+def test_get_user_bad_claims(client, claims):
+    token = create_token(data=claims)
+    response = client.get("/user", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 401
+
+
+@pytest.mark.parametrize("user_fixture", ["anon_user", "known_user"])
+def test_get_user_legacy_sub(client, request, user_fixture):
+    user = request.getfixturevalue(user_fixture)
+    legacy_sub = user.get("email") or f"anon:{user['id']}"
+    token = create_token(data={"sub": legacy_sub})
+    response = client.get("/user", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert response.json()["id"] == user["id"]
+
+
+def test_get_user_legacy_sub_refused(client, known_user, monkeypatch):
+    monkeypatch.setattr(backend.SETTINGS, "accept_legacy_tokens", False)
+    token = create_token(data={"sub": known_user["email"]})
+    response = client.get("/user", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 401
+
+
 # POST signup
 
 
@@ -112,6 +154,20 @@ def test_add_creds(client, anon_user, has_grant_type):
     assert data["success"] == [anon_user["id"]]
 
 
+def test_add_creds_expires_guest_token(client, anon_user):
+    headers = auth_headers(anon_user)
+    assert client.get("/user", headers=headers).json()["email"] is None
+
+    form_data = {"username": "jester@example.com", "password": "unicorn"}
+    client.post("/user/register", data=form_data, headers=headers)
+    # the guest's token was for the user before registering, so it must be renewed
+    assert client.get("/user", headers=headers).status_code == 401
+
+    token = client.post("/user/token", data=form_data).json()["access_token"]
+    response = client.get("/user", headers={"Authorization": f"Bearer {token}"})
+    assert response.json()["email"] == "jester@example.com"
+
+
 def test_add_creds_no_auth(client):
     form_data = {
         "username": "new@email.com",
@@ -203,6 +259,23 @@ def test_login_not_a_user(client, username):
     assert response.status_code == 401
 
 
+@pytest.mark.parametrize(
+    "path,patched",
+    [
+        ("/user/token", "authenticate_user"),
+        ("/user/", "create_user"),
+        ("/user/register", "populate_guest_user"),
+    ],
+)
+def test_password_queue_full(client, mocker, anon_user, path, patched):
+    mocker.patch(f"api.routes.auth.{patched}", side_effect=PasswordQueueFull())
+    form_data = {"username": "jester@example.com", "password": "unicorn"}
+
+    response = client.post(path, data=form_data, headers=auth_headers(anon_user))
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
 def test_login_as_guest(client, db, settings):
     orig_users = db.count_anon_users()
     form_data = {
@@ -216,5 +289,125 @@ def test_login_as_guest(client, db, settings):
     data = response.json()
     assert isinstance(data["access_token"], str)
     assert data["token_type"] == "bearer"
-    # added a temp user
+    # the guest is only stored once they write something
+    assert db.count_anon_users() == orig_users
+
+
+def guest_headers(client, settings):
+    form_data = {"username": "anonymous", "password": settings.guest_user_key}
+    token = client.post("/user/token", data=form_data).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_guest_reads_without_row(client, db, settings, mocker):
+    headers = guest_headers(client, settings)
+    orig_users = db.count_users()
+    get_user = mocker.spy(backend.ADB, "get_guest_user")
+
+    for path in ["/today", "/today?expire=23:00:00Z"]:
+        response = client.get(path, headers=headers)
+        assert response.status_code == 200
+        assert response.json()["pending_tasks"] == []
+    response = client.get("/agenda?expire=23:00:00Z", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["timeline"] == []
+    assert response.json()["expiry"].endswith("T23:00:00Z")
+    assert db.count_users() == orig_users
+    # the guest was cached when their token was issued
+    assert get_user.call_count == 0
+
+
+def test_guest_stored_by_first_task(client, db, settings):
+    headers = guest_headers(client, settings)
+    orig_users = db.count_anon_users()
+
+    new_task = {"title": "first task", "estimate": "PT10M"}
+    response = client.post("/task/", json=new_task, headers=headers)
+    assert response.status_code == 201
     assert db.count_anon_users() == orig_users + 1
+
+    # the same token now reads the stored guest and their list
+    response = client.get("/today", headers=headers)
+    assert response.status_code == 200
+    assert [task["title"] for task in response.json()["pending_tasks"]] == [
+        "first task"
+    ]
+    assert client.get("/user", headers=headers).json()["id"] > 0
+
+
+def test_guest_list_expiry_kept_until_first_write(client, db, settings):
+    form_data = {"username": "anonymous", "password": settings.guest_user_key}
+    response = client.post("/user/token?expire=23:00:00Z", data=form_data)
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    orig_users = db.count_anon_users()
+
+    response = client.get("/today", headers=headers)
+    assert response.json()["expiry"].endswith("T23:00:00Z")
+    assert db.count_anon_users() == orig_users
+
+    new_task = {"title": "first task", "estimate": "PT10M"}
+    assert client.post("/task/", json=new_task, headers=headers).status_code == 201
+    response = client.get("/today", headers=headers)
+    assert response.json()["id"] > 0
+    assert response.json()["expiry"].endswith("T23:00:00Z")
+
+
+def test_guest_login_expiry_needs_timezone(client, settings):
+    form_data = {"username": "anonymous", "password": settings.guest_user_key}
+    response = client.post("/user/token?expire=23:00:00", data=form_data)
+    assert response.status_code == 422
+
+
+def test_guest_stream_without_row(client, db, settings, mocker):
+    headers = guest_headers(client, settings)
+    orig_users = db.count_anon_users()
+    follow = mocker.patch("src.operations.follow_todaylist")
+    follow.return_value.__aiter__.return_value = []
+
+    # changes are sent to guests by their key, so following them stores nothing
+    response = client.get("/today/stream", headers=headers)
+    assert response.status_code == 200
+    assert db.count_anon_users() == orig_users
+    user_id, _, guest_key = follow.call_args.args
+    assert user_id == 0
+    assert guest_key is not None
+
+
+def test_guest_stored_by_reading_user(client, db, settings):
+    headers = guest_headers(client, settings)
+    orig_users = db.count_anon_users()
+
+    # a user's details include their id, which a guest only has once stored
+    user_id = client.get("/user", headers=headers).json()["id"]
+    assert user_id > 0
+    assert db.count_anon_users() == orig_users + 1
+    assert client.get("/user", headers=headers).json()["id"] == user_id
+
+
+@pytest.mark.parametrize(
+    "username,password", [("not an email", "unicorn"), ("jester@example.com", "pw")]
+)
+def test_guest_not_stored_by_bad_registration(
+    client, db, settings, username, password
+):
+    headers = guest_headers(client, settings)
+    orig_users = db.count_anon_users()
+
+    form_data = {"username": username, "password": password}
+    response = client.post("/user/register", data=form_data, headers=headers)
+    assert response.status_code == 422
+    # credentials are checked before a lazy guest is stored
+    assert db.count_anon_users() == orig_users
+
+
+def test_guest_stored_by_registering(client, db, settings):
+    headers = guest_headers(client, settings)
+    orig_users = db.count_registered_users()
+
+    form_data = {"username": "jester@example.com", "password": "unicorn"}
+    response = client.post("/user/register", data=form_data, headers=headers)
+    assert response.status_code == 200
+    assert db.count_registered_users() == orig_users + 1
+    assert db.get_registered_user(email="jester@example.com")["id"] in (
+        response.json()["success"]
+    )
@@ -6,6 +6,8 @@ Interacts with the test database.
 from datetime import datetime, time, timedelta
 import pytest
 
+from src.events import ListEvent
+import src.operations as backend
 from src.utils import system_tz
 from test.helpers import auth_headers
 
@@ -46,6 +48,23 @@ def test_get_root(client):
     assert data == "API server is running!"
 
 
+@pytest.mark.parametrize(
+    "path,method,model",
+    [
+        ("/today", "get", "Daylist"),
+        ("/agenda", "get", "Agenda"),
+        ("/task/", "post", "Task"),
+    ],
+)
+def test_docs_response_models(client, path, method, model):
+    """Routes returning trusted models without validating them still document them."""
+    route = client.get("/openapi.json").json()["paths"][path][method]
+    responses = route["responses"]
+    status = "201" if method == "post" else "200"
+    schema = responses[status]["content"]["application/json"]["schema"]
+    assert schema == {"$ref": f"#/components/schemas/{model}"}
+
+
 # GET today's list
 
 
@@ -67,6 +86,15 @@ def test_get_list_none(client, any_user):
     assert data["pending_tasks"] == []
 
 
+def test_get_list_repeated(client, any_user):
+    """Only the first request creates today's list; later ones read it."""
+    first = client.get("/today", headers=auth_headers(any_user))
+    second = client.get("/today", headers=auth_headers(any_user))
+    assert first.status_code == 201
+    assert second.status_code == 200
+    assert first.json()["id"] == second.json()["id"]
+
+
 def test_get_list_expired(client, db, any_user):
     """An expired list exists for this user - make a new blank one."""
     old_lid = db.add_daylist(user_id=any_user["id"], expiry=OLD_TIME)
@@ -233,6 +261,44 @@ def test_get_agenda_active(client, db, any_user):
     assert datetime.fromisoformat(data["expiry"]) >= now
 
 
+def test_get_agenda_cached(client, db, mocker, any_user):
+    """A repeated agenda is only rebuilt when its list changes."""
+    headers = auth_headers(any_user)
+    client.get("/agenda", headers=headers)
+    fetch = mocker.spy(backend.ADB, "get_or_add_todaylist")
+
+    response = client.get("/agenda", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["timeline"] == []
+    assert fetch.call_count == 0
+
+    # written without telling the cache, as another worker might
+    db.add_task_for_user(user_id=any_user["id"], title="new", estimate=DUR_20M)
+    response = client.get("/agenda", headers=headers)
+    assert [item["title"] for item in response.json()["timeline"]] == ["new"]
+    assert fetch.call_count == 1
+
+
+def test_get_today_carried_over(client, db, any_user):
+    """The first read of a rolled over list shows yesterday's pending tasks."""
+    expiry = datetime.now().astimezone() - timedelta(minutes=1)
+    lid = db.add_daylist(user_id=any_user["id"], expiry=expiry)
+    db.add_task_to_list(daylist_id=lid, title="carried", estimate=DUR_20M)
+    rolled = db.add_next_daylists(
+        after_expiry=expiry - timedelta(hours=1),
+        after_id=0,
+        until=expiry,
+        active_since=expiry - timedelta(days=1),
+        batch_size=10,
+        carry_over=True,
+    )
+    assert [row["id"] for row in rolled] == [lid]
+
+    response = client.get("/today", headers=auth_headers(any_user))
+    assert response.status_code == 200
+    assert [task["title"] for task in response.json()["pending_tasks"]] == ["carried"]
+
+
 # Test providing custom expiry for both endpoints
 
 
@@ -289,3 +355,97 @@ def test_get_list_expiry_no_tz(client, db, endpoint, anon_user):
     data = response.json()
     assert "detail" in data
     assert "msg" in data["detail"][0]
+
+
+# Conditional requests with etags
+
+
+@pytest.fixture()
+def fixed_start(mocker):
+    """Agendas start at the same minute during a test."""
+    start = datetime.now(LOCAL_TZ).replace(second=0, microsecond=0)
+    return mocker.patch("src.operations.agenda_start", return_value=start)
+
+
+@pytest.mark.usefixtures("fixed_start")
+@pytest.mark.parametrize("endpoint", ["/today", "/agenda"])
+def test_get_list_etag(client, endpoint, any_user):
+    """A client whose copy of the list is current gets a 304 without a body."""
+    headers = auth_headers(any_user)
+    first = client.get(endpoint, headers=headers)
+    etag = first.headers["ETag"]
+    assert etag.startswith('"') and etag.endswith('"')
+
+    response = client.get(endpoint, headers=headers | {"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+
+    # weak and listed etags match too
+    weak = {"If-None-Match": f'"other", W/{etag}'}
+    response = client.get(endpoint, headers=headers | weak)
+    assert response.status_code == 304
+
+
+@pytest.mark.usefixtures("fixed_start")
+@pytest.mark.parametrize("endpoint", ["/today", "/agenda"])
+def test_get_list_etag_changed(client, db, endpoint, any_user):
+    """Changing the list's tasks changes its etag, so the client gets the list."""
+    headers = auth_headers(any_user)
+    etag = client.get(endpoint, headers=headers).headers["ETag"]
+    db.add_task_for_user(user_id=any_user["id"], title="new", estimate=DUR_20M)
+
+    response = client.get(endpoint, headers=headers | {"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_get_agenda_etag_next_minute(client, fixed_start, any_user):
+    """Agendas start at the current minute, so they change each minute."""
+    headers = auth_headers(any_user)
+    etag = client.get("/agenda", headers=headers).headers["ETag"]
+    fixed_start.return_value += timedelta(minutes=1)
+
+    response = client.get("/agenda", headers=headers | {"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_get_list_etag_new_list(client, db, any_user):
+    """An etag for an expired list doesn't match the new one."""
+    old_lid = db.add_daylist(user_id=any_user["id"], expiry=OLD_TIME)
+    old_etag = f'"{old_lid}.1"'
+
+    headers = auth_headers(any_user) | {"If-None-Match": old_etag}
+    response = client.get("/today", headers=headers)
+    assert response.status_code == 201
+    assert response.headers["ETag"] != old_etag
+
+
+# Streams of list changes
+
+
+def test_stream_today_no_user(client):
+    response = client.get("/today/stream")
+    assert response.status_code == 401
+
+
+def test_stream_today(client, mocker, any_user):
+    """Changes are sent as server-sent events, with comments to keep idle streams."""
+
+    async def follow(uid, keepalive, guest_key):
+        assert uid == any_user["id"]
+        yield ListEvent("added", {"ids": [1]})
+        yield None
+        yield ListEvent("expired", {"id": 2})
+
+    mocker.patch("src.operations.follow_todaylist", follow)
+
+    response = client.get("/today/stream", headers=auth_headers(any_user))
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith("text/event-stream")
+    assert response.text == (
+        'event: added\ndata: {"ids":[1]}\n\n'
+        ": keepalive\n\n"
+        'event: expired\ndata: {"id":2}\n\n'
+    )
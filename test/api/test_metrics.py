@@ -0,0 +1,81 @@
+import pytest
+
+from src.metrics import REGISTRY
+from test.helpers import auth_headers
+
+
+@pytest.fixture(autouse=True)
+def db_setup_teardown(db):
+    try:
+        REGISTRY.reset()
+        yield
+    finally:
+        db.delete_all_users()
+
+
+# GET metrics
+
+
+def test_get_metrics(client):
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE http_request_duration_seconds histogram" in response.text
+
+
+def test_get_metrics_requests(client, any_user):
+    client.get("/today", headers=auth_headers(any_user))
+    client.post("/task/0/do", headers=auth_headers(any_user))
+    client.get("/not-a-route")
+
+    response = client.get("/metrics")
+    text = response.text
+    # routes are recorded by template, not by path
+    assert 'http_requests_total{method="GET",route="/today",status="201"} 1' in text
+    assert (
+        'http_requests_total{method="POST",route="/task/{id}/do",status="422"}' in text
+    )
+    assert 'route="/task/0/do"' not in text
+    assert 'http_requests_total{method="GET",route="unmatched",status="404"} 1' in text
+    assert 'http_request_duration_seconds_count{method="GET",route="/today"} 1' in text
+    # only the metrics request itself is in progress
+    assert "http_requests_in_progress 1" in text
+
+
+def test_get_metrics_todaylists(client, any_user):
+    client.get("/today", headers=auth_headers(any_user))
+    client.get("/agenda", headers=auth_headers(any_user))
+
+    text = client.get("/metrics").text
+    assert 'todaylists_total{result="created"} 1' in text
+    assert 'todaylists_total{result="fetched"} 1' in text
+
+
+def test_get_metrics_passwords(client, known_user):
+    form_data = {"username": known_user["email"], "password": known_user["password"]}
+    client.post("/user/token", data=form_data)
+
+    text = client.get("/metrics").text
+    assert 'password_hash_duration_seconds_count{operation="verify"} 1' in text
+
+
+def test_get_metrics_pools(client):
+    text = client.get("/metrics").text
+    for stat in ["size", "checked_out", "idle", "overflow", "waiting"]:
+        assert f'db_pool_{stat}{{pool="async"}}' in text
+        assert f'db_pool_{stat}{{pool="sync"}}' in text
+    for stat in ["checkouts", "wait_seconds"]:
+        assert f"# TYPE db_pool_{stat}_total counter" in text
+        assert f'db_pool_{stat}_total{{pool="async"}}' in text
+
+
+def test_get_metrics_pool_totals(client, mocker):
+    stats = {"checkouts": 5, "wait_seconds": 0.5}
+    mocker.patch("api.routes.metrics.pool_stats", side_effect=lambda engine: stats)
+    client.get("/metrics")
+    stats = {"checkouts": 8, "wait_seconds": 0.75}
+
+    # each scrape reports the pool's totals, not their sum over scrapes
+    text = client.get("/metrics").text
+    assert 'db_pool_checkouts_total{pool="sync"} 8' in text
+    assert 'db_pool_wait_seconds_total{pool="sync"} 0.75' in text
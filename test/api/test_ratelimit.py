@@ -0,0 +1,167 @@
+import pytest
+
+from api import ratelimit
+from api.ratelimit import Limit, MemoryStore, RedisStore
+import src.operations as backend
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+# Limits
+
+
+@pytest.mark.parametrize(
+    "spec,capacity,period",
+    [("5/minute", 5, 60), ("1/second", 1, 1), ("24/day", 24, 86400)],
+)
+def test_limit_parse(spec, capacity, period):
+    limit = Limit.parse(spec)
+    assert limit.capacity == capacity
+    assert limit.period == period
+
+
+@pytest.mark.parametrize(
+    "spec", ["5", "five/minute", "5/fortnight", "-1/minute", "0/minute"]
+)
+def test_limit_parse_invalid(spec):
+    with pytest.raises(ValueError):
+        Limit.parse(spec)
+
+
+# Stores
+
+
+@pytest.mark.anyio
+async def test_memory_store_bucket():
+    clock = Clock()
+    store = MemoryStore(clock=clock)
+    limit = Limit(capacity=2, period=60)
+
+    first = await store.take("key", limit)
+    assert first.allowed and first.remaining == 1
+    assert (await store.take("key", limit)).allowed
+    refused = await store.take("key", limit)
+    assert not refused.allowed
+    assert refused.remaining == 0
+    assert refused.retry_after == pytest.approx(30)
+    assert refused.reset == pytest.approx(60)
+
+    # other keys have their own buckets
+    assert (await store.take("other", limit)).allowed
+    # a token refills after 30 seconds, whether or not requests were refused
+    clock.now = 30
+    assert (await store.take("key", limit)).allowed
+    assert not (await store.take("key", limit)).allowed
+
+
+@pytest.mark.anyio
+async def test_memory_store_refill_capped():
+    clock = Clock()
+    store = MemoryStore(clock=clock)
+    limit = Limit(capacity=2, period=60)
+    await store.take("key", limit)
+
+    clock.now = 3600
+    results = [(await store.take("key", limit)).allowed for _ in range(3)]
+    assert results == [True, True, False]
+
+
+@pytest.mark.anyio
+async def test_memory_store_max_keys():
+    store = MemoryStore(max_keys=2, clock=Clock())
+    limit = Limit(capacity=1, period=60)
+    for key in ["a", "b", "c"]:
+        await store.take(key, limit)
+
+    # the least recently used bucket was forgotten
+    assert (await store.take("a", limit)).allowed
+    assert not (await store.take("c", limit)).allowed
+
+
+@pytest.mark.anyio
+async def test_redis_store(mocker):
+    client = mocker.Mock()
+    client.eval = mocker.AsyncMock(return_value=b"-0.5")
+    store = RedisStore(client)
+
+    decision = await store.take("key", Limit(capacity=2, period=60))
+    assert not decision.allowed
+    assert decision.retry_after == pytest.approx(15)
+    args = client.eval.await_args.args
+    assert args[1:5] == (1, "ratelimit:key", 2, 2 / 60)
+
+
+def test_make_store():
+    assert isinstance(ratelimit.make_store(""), MemoryStore)
+
+
+# Routes
+
+
+def login(client, username="someone@example.com"):
+    form_data = {"username": username, "password": "wrong-password"}
+    return client.post("/user/token", data=form_data)
+
+
+def test_login_limited_by_email(client, monkeypatch):
+    limits = {"/user/token": {"ip": "10/minute", "email": "2/minute"}}
+    monkeypatch.setattr(backend.SETTINGS, "rate_limits", limits)
+
+    assert login(client).status_code == 401
+    assert login(client).status_code == 401
+    response = login(client)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "30"
+    assert response.headers["RateLimit-Limit"] == "2"
+    assert response.headers["RateLimit-Remaining"] == "0"
+    assert response.headers["RateLimit-Reset"] == "60"
+    # emails are limited separately, and are case insensitive
+    assert login(client, "other@example.com").status_code == 401
+    assert login(client, "SomeOne@example.com").status_code == 429
+
+
+def test_login_limited_by_ip(client, monkeypatch):
+    limits = {"/user/token": {"ip": "2/minute"}}
+    monkeypatch.setattr(backend.SETTINGS, "rate_limits", limits)
+
+    assert login(client, "one@example.com").status_code == 401
+    assert login(client, "two@example.com").status_code == 401
+    assert login(client, "three@example.com").status_code == 429
+
+
+def test_guest_login_limited_by_ip(client, monkeypatch, settings):
+    limits = {"/user/token": {"ip": "1/minute", "email": "100/minute"}}
+    monkeypatch.setattr(backend.SETTINGS, "rate_limits", limits)
+
+    assert login_guest(client, settings).status_code == 200
+    assert login_guest(client, settings).status_code == 429
+
+
+def login_guest(client, settings):
+    form_data = {"username": "anonymous", "password": settings.guest_user_key}
+    return client.post("/user/token", data=form_data)
+
+
+def test_signup_limited(client, db, monkeypatch):
+    monkeypatch.setattr(backend.SETTINGS, "rate_limits", {"/user/": {"ip": "1/hour"}})
+    # signing up hashes a password, which takes long enough to refill some tokens
+    monkeypatch.setattr(ratelimit, "STORE", MemoryStore(clock=Clock()))
+    form_data = {"username": "jester@example.com", "password": "unicorn"}
+    try:
+        assert client.post("/user/", data=form_data).status_code == 200
+        response = client.post("/user/", data=form_data)
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "3600"
+    finally:
+        db.delete_all_users()
+
+
+def test_unlimited_route(client, monkeypatch):
+    monkeypatch.setattr(backend.SETTINGS, "rate_limits", {})
+    assert all(login(client).status_code == 401 for _ in range(12))
@@ -101,6 +101,79 @@ def test_post_add_task_no_list(client, anon_user):
     assert "msg" in data["detail"][0]
 
 
+# POST: add many new tasks
+
+
+def test_post_add_tasks_no_auth(client, db, anon_user):
+    db.add_daylist(user_id=anon_user["id"], expiry=FUTURE_TIME)
+    input_data = [{"title": "my new task", "estimate": "PT1H15M"}]
+
+    response = client.post("/task/bulk", json=input_data)
+    assert response.status_code == 401
+
+
+def test_post_add_tasks(client, db, any_user):
+    """Create several tasks at the end of today's list, in order."""
+    active_lid = db.add_daylist(user_id=any_user["id"], expiry=FUTURE_TIME)
+    prior_id = db.add_task_to_list(daylist_id=active_lid, title="a", estimate="PT5M")
+    input_data = [
+        {"title": "first", "estimate": "PT1H15M"},
+        {"title": "second", "estimate": "PT20M"},
+        {"title": "third", "estimate": "PT5M"},
+    ]
+
+    response = client.post(
+        "/task/bulk", json=input_data, headers=auth_headers(any_user)
+    )
+    assert response.status_code == 201
+
+    data = response.json()
+    # return new task info in the given order
+    assert [task["title"] for task in data] == ["first", "second", "third"]
+    assert [task["estimate"] for task in data] == ["PT1H15M", "PT20M", "PT5M"]
+    # new tasks are pending after the existing ones
+    pending = [task["id"] for task in db.get_pending_tasks(user_id=any_user["id"])]
+    assert pending == [prior_id] + [task["id"] for task in data]
+
+
+@pytest.mark.parametrize(
+    "bad_tasks",
+    [
+        [],  # blank
+        [{"title": "sample", "estimate": "PT20M"}, {"title": "a" * 1000}],  # one bad
+        [{"title": "sample", "estimate": "PT1M"}] * 1000,  # too many tasks
+    ],
+)
+def test_post_add_tasks_invalid(client, db, bad_tasks, anon_user):
+    """Can't create tasks that fail basic validation."""
+    lid = db.add_daylist(user_id=anon_user["id"], expiry=FUTURE_TIME)
+
+    response = client.post(
+        "/task/bulk", json=bad_tasks, headers=auth_headers(anon_user)
+    )
+    assert response.status_code == 422
+    # has error message in correct schema
+    data = response.json()
+    assert "detail" in data
+    assert "msg" in data["detail"][0]
+    # nothing was added
+    assert db.count_tasks(daylist_id=lid) == 0
+
+
+def test_post_add_tasks_no_list(client, anon_user):
+    """Attempt to create tasks but list does not exist yet."""
+    input_data = [{"title": "my new task", "estimate": "PT1H15M"}]
+
+    response = client.post(
+        "/task/bulk", json=input_data, headers=auth_headers(anon_user)
+    )
+    assert response.status_code == 404
+    # has error message in correct schema
+    data = response.json()
+    assert "detail" in data
+    assert "msg" in data["detail"][0]
+
+
 # POST: mark task done
 
 
@@ -147,6 +220,22 @@ def test_post_do_task_none(client, any_user):
     assert "msg" in data["detail"][0]
 
 
+@pytest.mark.parametrize(
+    "path,body",
+    [("/task/{id}/do", None), ("/task/{id}/undo", None), ("/task/bulk/do", "[{id}]")],
+)
+def test_post_task_id_oversized(client, any_user, path, body):
+    """Ids too large for the database are rejected as invalid, not failing there."""
+    too_large = 2**40
+    response = client.post(
+        path.format(id=too_large),
+        content=body and body.format(id=too_large),
+        headers=auth_headers(any_user),
+    )
+    assert response.status_code == 422
+    assert "msg" in response.json()["detail"][0]
+
+
 def test_post_do_task_bad_list(client, db, any_user):
     """Marking a task done but task is not in today's list."""
     old_lid = db.add_daylist(user_id=any_user["id"], expiry=OLD_TIME)
@@ -1,11 +1,20 @@
-from typing import Union
+from typing import AsyncIterator, Iterator, Union
 import pytest
 from fastapi.testclient import TestClient
 
 from config import Settings, get_settings
 from api.main import app, configure
-from db.connect import DBQueriesWrapper, query_connect
-from src.userauth import hash_password
+from api import ratelimit
+from sqlalchemy.pool import NullPool
+
+from db.connect import (
+    async_query_connect,
+    query_connect,
+    AsyncDBQueriesWrapper,
+    DBQueriesWrapper,
+)
+from src.operations import AGENDA_CACHE
+from src.userauth import hash_password, USER_CACHE
 
 
 @pytest.fixture(scope="session")
@@ -22,10 +31,40 @@ def db(settings) -> DBQueriesWrapper:
     return queries
 
 
+@pytest.fixture()
+async def adb(db) -> AsyncIterator[AsyncDBQueriesWrapper]:
+    # same database as the sync queries, unpooled since each test has its own loop
+    url = db.engine.url.render_as_string(hide_password=False)
+    queries = async_query_connect(url=url, poolclass=NullPool)
+    yield queries
+    await queries.disconnect()
+
+
 @pytest.fixture(scope="session")
-def client(settings) -> TestClient:
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+def client(settings) -> Iterator[TestClient]:
     configure(app, settings=settings)
-    return TestClient(app)
+    # one event loop for the whole session, shared by the app's async connections
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture(autouse=True)
+def clear_caches() -> Iterator[None]:
+    # test users are deleted and recreated, so cached ones would go stale
+    yield
+    USER_CACHE.clear()
+    AGENDA_CACHE.clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_rate_limits(monkeypatch) -> None:
+    # every test's client has the same address, so each starts with full buckets
+    monkeypatch.setattr(ratelimit, "STORE", ratelimit.MemoryStore())
 
 
 @pytest.fixture()
@@ -0,0 +1,20 @@
+from perf.bench import list_row, run_benchmark, PATHS
+
+
+def test_list_row():
+    row = list_row(9, done_every=3)
+    assert len(row["pending_tasks"]) == 6
+    assert [task["id"] for task in row["done_tasks"]] == [3, 6, 9]
+
+
+def test_paths_agree():
+    """Every path gives the response body the API sent before trusting rows."""
+    row = list_row(20)
+    bodies = {name: path(row) for name, path in PATHS.items()}
+    assert len(set(bodies.values())) == 1
+
+
+def test_run_benchmark():
+    timings = run_benchmark(tasks=5, number=2, repeat=1)
+    assert [timing.name for timing in timings] == list(PATHS)
+    assert all(timing.seconds > 0 for timing in timings)
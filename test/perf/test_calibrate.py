@@ -0,0 +1,13 @@
+from typer.testing import CliRunner
+
+from perf.calibrate import app
+
+
+def test_main(mocker):
+    calibrate = mocker.patch(
+        "perf.calibrate.calibrate_password_rounds", return_value=11
+    )
+    result = CliRunner().invoke(app, ["--target-ms", "100"])
+    assert result.exit_code == 0
+    assert result.output.strip() == "PASSWORD_ROUNDS=11"
+    calibrate.assert_called_once_with(100)
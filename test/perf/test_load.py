@@ -0,0 +1,133 @@
+import asyncio
+
+import httpx
+import pytest
+
+from api.main import app
+from perf.load import (
+    load_client,
+    percentile,
+    run_load,
+    unlimited_logins,
+    LoadReport,
+    SessionConfig,
+    IN_PROCESS_URL,
+)
+import src.operations as backend
+
+
+@pytest.fixture(autouse=True)
+def db_teardown(db):
+    try:
+        yield
+    finally:
+        db.delete_all_users()
+
+
+@pytest.mark.parametrize(
+    "pct,expected", [(0, 1), (50, 50), (95, 95), (99, 99), (100, 100)]
+)
+def test_percentile(pct, expected):
+    values = [float(value) for value in range(100, 0, -1)]
+    assert percentile(values, pct) == expected
+
+
+def test_percentile_empty():
+    assert percentile([], 50) == 0.0
+
+
+def test_throughput():
+    report = LoadReport(elapsed=2)
+    report.endpoints["GET /today"].latencies = [0.1] * 10
+    report.endpoints["GET /agenda"].latencies = [0.1] * 30
+
+    assert report.throughput() == 20
+    assert report.throughput("GET /today") == 5
+
+
+def test_load_client():
+    assert isinstance(load_client()._transport, httpx.ASGITransport)
+    assert str(load_client().base_url) == IN_PROCESS_URL
+    assert str(load_client("http://example.com").base_url) == "http://example.com"
+
+
+def test_run_load(client, db, settings):
+    config = SessionConfig(
+        guest_key=settings.guest_user_key, tasks=3, agenda_polls=2, think_time=0
+    )
+
+    async def run() -> LoadReport:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url=IN_PROCESS_URL
+        ) as http:
+            return await run_load(http, config, users=4, sessions=2)
+
+    # run in the test client's event loop, which the app's async pool belongs to
+    report = client.portal.call(run)
+
+    assert report.sessions == 8
+    assert db.count_anon_users() == 8
+    expected_requests = {
+        "POST /user/token": 8,
+        "GET /today": 8,
+        "POST /task/": 24,
+        "POST /task/bulk/do": 8,
+        "GET /agenda": 16,
+    }
+    for name, count in expected_requests.items():
+        assert len(report.endpoints[name].latencies) == count
+        assert report.endpoints[name].errors == 0
+    assert report.requests() == 64
+    assert report.throughput() > 0
+
+
+def test_run_load_transport_errors():
+    config = SessionConfig(guest_key="key", tasks=3, agenda_polls=1, think_time=0)
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/task/":
+            raise httpx.ConnectError("Connection reset", request=request)
+        if request.url.path == "/user/token":
+            return httpx.Response(200, json={"access_token": "token"})
+        return httpx.Response(200, json={})
+
+    async def run() -> LoadReport:
+        transport = httpx.MockTransport(handle)
+        async with httpx.AsyncClient(
+            transport=transport, base_url=IN_PROCESS_URL
+        ) as http:
+            return await run_load(http, config, users=2)
+
+    report = asyncio.run(run())
+
+    # failed connections are counted, and sessions carry on without those tasks
+    assert report.sessions == 2
+    assert len(report.endpoints["POST /task/"].latencies) == 6
+    assert report.endpoints["POST /task/"].errors == 6
+    assert "POST /task/bulk/do" not in report.endpoints
+    assert report.endpoints["GET /agenda"].errors == 0
+
+
+def test_unlimited_logins(client, db, settings, monkeypatch):
+    monkeypatch.setattr(
+        backend.SETTINGS, "rate_limits", {"/user/token": {"ip": "1/minute"}}
+    )
+    config = SessionConfig(
+        guest_key=settings.guest_user_key, tasks=0, agenda_polls=0, think_time=0
+    )
+
+    async def run() -> LoadReport:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url=IN_PROCESS_URL
+        ) as http:
+            with unlimited_logins():
+                return await run_load(http, config, users=3)
+
+    report = client.portal.call(run)
+
+    # virtual users share an IP, and all of them got past login
+    assert report.sessions == 3
+    assert report.endpoints["POST /user/token"].errors == 0
+    assert backend.SETTINGS.rate_limits == {"/user/token": {"ip": "1/minute"}}
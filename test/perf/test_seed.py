@@ -0,0 +1,89 @@
+import datetime as dt
+import pytest
+from sqlalchemy import text
+
+from perf.seed import generate_batch, seed_database, CopyStream, SeedConfig
+
+FIRST_IDS = {"users": 1, "daylists": 1, "tasks": 1}
+
+
+@pytest.fixture(autouse=True)
+def db_teardown(db):
+    try:
+        yield
+    finally:
+        db.delete_all_users()
+
+
+def test_generate_batch_deterministic():
+    config = SeedConfig(users=10, today=dt.date(2024, 1, 1))
+    first = generate_batch(config, 0, 10, FIRST_IDS, "hash")
+    second = generate_batch(config, 0, 10, FIRST_IDS, "hash")
+    assert first.rows == second.rows
+
+    other_seed = generate_batch(
+        SeedConfig(users=10, seed=1, today=dt.date(2024, 1, 1)),
+        0,
+        10,
+        FIRST_IDS,
+        "hash",
+    )
+    assert other_seed.rows != first.rows
+
+
+def test_generate_batch_size_independent():
+    config = SeedConfig(users=10, today=dt.date(2024, 1, 1))
+    whole = generate_batch(config, 0, 10, FIRST_IDS, "hash")
+    first_half = generate_batch(config, 0, 5, FIRST_IDS, "hash")
+    second_half = generate_batch(config, 5, 5, first_half.next_ids, "hash")
+
+    for table, rows in whole.rows.items():
+        assert rows == first_half.rows[table] + second_half.rows[table]
+    assert whole.next_ids == second_half.next_ids
+
+
+@pytest.mark.parametrize("guest_ratio", [0, 1])
+def test_generate_batch_guests(guest_ratio):
+    config = SeedConfig(users=10, guest_ratio=guest_ratio)
+    batch = generate_batch(config, 0, 10, FIRST_IDS, "hash")
+
+    guests = [row for row in batch.rows["users"] if "\\N" in row]
+    assert len(guests) == 10 * guest_ratio
+
+
+def test_copy_stream():
+    lines = [f"{number}\tline\n" for number in range(1000)]
+    stream = CopyStream(lines)
+
+    chunks = []
+    while chunk := stream.read(100):
+        assert len(chunk) <= 100
+        chunks.append(chunk)
+    assert b"".join(chunks).decode() == "".join(lines)
+
+
+def test_seed_database(db):
+    url = db.engine.url.render_as_string(hide_password=False)
+    config = SeedConfig(users=50, active_ratio=1)
+
+    counts = seed_database(url, config, batch_size=20, password_hash="hash")
+
+    assert counts["users"] == db.count_users() == 50
+    with db.engine.connect() as connection:
+        for table in ["daylists", "tasks"]:
+            count = connection.execute(text(f"SELECT count(*) FROM {table}"))
+            assert counts[table] == count.scalar_one()
+        max_user_id = connection.execute(text("SELECT max(id) FROM users"))
+        max_user_id = max_user_id.scalar_one()
+
+    # every seeded user has a list for today
+    guest = db.get_anon_user()
+    assert db.get_active_daylist(user_id=guest["id"]) is not None
+    # ids continue after the seeded rows
+    assert db.add_anon_user() == max_user_id + 1
+
+
+def test_seed_database_empty(db):
+    url = db.engine.url.render_as_string(hide_password=False)
+    counts = seed_database(url, SeedConfig(users=0))
+    assert counts == {"users": 0, "daylists": 0, "tasks": 0}
@@ -0,0 +1,7 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def patched_notify(mocker):
+    # unit tests mock the queries they expect, and cache invalidations go nowhere
+    return mocker.patch("src.operations.ADB.notify", new_callable=mocker.AsyncMock)
@@ -0,0 +1,77 @@
+import pytest
+
+from src.cache import TTLCache
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture()
+def clock():
+    return Clock()
+
+
+def test_get_set(clock):
+    cache = TTLCache(maxsize=10, ttl=60, clock=clock)
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+
+
+def test_expiry(clock):
+    cache = TTLCache(maxsize=10, ttl=60, clock=clock)
+    cache.set("a", 1)
+    clock.now = 59
+    assert cache.get("a") == 1
+    clock.now = 60
+    assert cache.get("a") is None
+    # expired entries are dropped
+    assert len(cache) == 0
+
+
+def test_evicts_least_recently_used(clock):
+    cache = TTLCache(maxsize=2, ttl=60, clock=clock)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_set_refreshes_expiry(clock):
+    cache = TTLCache(maxsize=10, ttl=60, clock=clock)
+    cache.set("a", 1)
+    clock.now = 30
+    cache.set("a", 2)
+    clock.now = 70
+    assert cache.get("a") == 2
+
+
+def test_invalidate_clear(clock):
+    cache = TTLCache(maxsize=10, ttl=60, clock=clock)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.invalidate("a")
+    cache.invalidate("missing")
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+
+    cache.clear()
+    assert len(cache) == 0
+
+
+@pytest.mark.parametrize("maxsize,ttl", [(0, 60), (10, 0)])
+def test_disabled(clock, maxsize, ttl):
+    cache = TTLCache(maxsize=maxsize, ttl=ttl, clock=clock)
+    cache.set("a", 1)
+    assert not cache.enabled
+    assert cache.get("a") is None
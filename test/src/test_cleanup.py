@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+
+from config import Settings
+from src.cleanup import cleanup_forever, delete_in_batches, run_cleanup
+from src.operations import ADB
+
+NOW = datetime(2024, 8, 24, tzinfo=timezone.utc)
+
+
+@pytest.fixture()
+def patched_deletes(mocker):
+    for name in [
+        "delete_inactive_guests",
+        "delete_expired_daylists",
+        "create_task_partitions",
+        "retire_task_partitions",
+    ]:
+        mocker.patch(
+            f"src.operations.ADB.{name}", new_callable=mocker.AsyncMock, return_value=0
+        )
+
+
+@pytest.mark.anyio
+async def test_delete_in_batches(mocker):
+    query = mocker.AsyncMock(side_effect=[3, 3, 1])
+    sleep = mocker.patch("anyio.sleep", new_callable=mocker.AsyncMock)
+
+    total = await delete_in_batches(query, batch_size=3, pause=0.5, before=NOW)
+    assert total == 7
+    query.assert_awaited_with(batch_size=3, before=NOW)
+    assert query.await_count == 3
+    # pauses between full batches, and stops after a partial one
+    assert sleep.await_count == 2
+    sleep.assert_awaited_with(0.5)
+
+
+@pytest.mark.anyio
+async def test_run_cleanup(patched_deletes):
+    settings = Settings(
+        guest_retention_days=7, daylist_retention_days=30, cleanup_batch_size=10
+    )
+    ADB.delete_inactive_guests.return_value = 4
+    ADB.delete_expired_daylists.return_value = 2
+
+    report = await run_cleanup(settings, now=NOW)
+    assert (report.guests, report.daylists) == (4, 2)
+    ADB.delete_inactive_guests.assert_awaited_once_with(
+        batch_size=10, before=NOW - timedelta(days=7)
+    )
+    ADB.delete_expired_daylists.assert_awaited_once_with(
+        batch_size=10, before=NOW - timedelta(days=30)
+    )
+
+
+@pytest.mark.anyio
+async def test_run_cleanup_task_partitions(patched_deletes):
+    settings = Settings(
+        daylist_retention_days=30, task_partition_months=2, detach_task_partitions=True
+    )
+    ADB.create_task_partitions.return_value = 1
+    ADB.retire_task_partitions.return_value = 3
+
+    report = await run_cleanup(settings, now=NOW)
+    assert (report.partitions_made, report.partitions_retired) == (1, 3)
+    ADB.create_task_partitions.assert_awaited_once_with(
+        since=NOW, until=NOW + timedelta(days=62)
+    )
+    # old months of tasks are retired whole, along with their lists
+    ADB.retire_task_partitions.assert_awaited_once_with(
+        before=NOW - timedelta(days=30), detach=True
+    )
+
+
+@pytest.mark.anyio
+async def test_run_cleanup_guest_tokens(patched_deletes):
+    settings = Settings(guest_retention_days=0.1)
+
+    await run_cleanup(settings, now=NOW)
+    # guests are kept at least as long as their tokens work
+    ADB.delete_inactive_guests.assert_awaited_once_with(
+        batch_size=settings.cleanup_batch_size, before=NOW - timedelta(days=1)
+    )
+
+
+@pytest.mark.anyio
+async def test_run_cleanup_keep_all(patched_deletes):
+    settings = Settings(guest_retention_days=0, daylist_retention_days=0)
+
+    report = await run_cleanup(settings, now=NOW)
+    assert (report.guests, report.daylists) == (0, 0)
+    ADB.delete_inactive_guests.assert_not_awaited()
+    ADB.delete_expired_daylists.assert_not_awaited()
+    ADB.retire_task_partitions.assert_not_awaited()
+
+
+@pytest.mark.anyio
+async def test_cleanup_forever_survives_failures(mocker):
+    mocker.patch("anyio.sleep", new_callable=mocker.AsyncMock)
+    cleanup = mocker.patch(
+        "src.cleanup.run_cleanup",
+        new_callable=mocker.AsyncMock,
+        side_effect=[ConnectionError, mocker.DEFAULT, KeyboardInterrupt],
+    )
+
+    with pytest.raises(KeyboardInterrupt):
+        await cleanup_forever(Settings(cleanup_interval=60))
+    assert cleanup.await_count == 3
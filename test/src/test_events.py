@@ -0,0 +1,60 @@
+import anyio
+import pytest
+
+from src.events import Broadcaster, ListEvent, DROPPED_STREAMS, OPEN_STREAMS
+
+ADDED = ListEvent("added", {"ids": [1, 2]})
+
+
+def test_encode_event():
+    assert ADDED.encode() == 'event: added\ndata: {"ids":[1,2]}\n\n'
+    assert ListEvent("expired").encode() == "event: expired\ndata: {}\n\n"
+
+
+@pytest.mark.anyio
+async def test_publish_to_user_streams():
+    broadcaster = Broadcaster(buffer=4)
+
+    async with (
+        broadcaster.subscribe("1") as first,
+        broadcaster.subscribe("1") as second,
+    ):
+        async with broadcaster.subscribe("2") as other:
+            broadcaster.publish("1", ADDED)
+            assert await first.receive() == ADDED
+            assert await second.receive() == ADDED
+            # other users' streams hear nothing
+            with pytest.raises(anyio.WouldBlock):
+                other.receive_nowait()
+
+
+@pytest.mark.anyio
+async def test_subscribe_closes():
+    broadcaster = Broadcaster(buffer=4)
+    before = OPEN_STREAMS.value()
+
+    async with broadcaster.subscribe("1"):
+        assert broadcaster.subscribers("1") == 1
+        assert OPEN_STREAMS.value() == before + 1
+
+    assert broadcaster.subscribers("1") == 0
+    assert OPEN_STREAMS.value() == before
+    # publishing to users without streams does nothing
+    broadcaster.publish("1", ADDED)
+
+
+@pytest.mark.anyio
+async def test_publish_drops_slow_stream():
+    broadcaster = Broadcaster(buffer=1)
+    dropped = DROPPED_STREAMS.value()
+
+    async with broadcaster.subscribe("1") as events:
+        broadcaster.publish("1", ADDED)
+        broadcaster.publish("1", ListEvent("done", {"ids": [1]}))
+
+        # the buffered event is still read, then the stream ends
+        assert await events.receive() == ADDED
+        with pytest.raises(anyio.EndOfStream):
+            await events.receive()
+    assert broadcaster.subscribers("1") == 0
+    assert DROPPED_STREAMS.value() == dropped + 1
@@ -0,0 +1,91 @@
+import json
+import pytest
+
+from src.cache import TTLCache
+from src.invalidation import CHANNEL, InvalidationBus
+
+
+@pytest.fixture()
+def cache() -> TTLCache[str, int]:
+    cache: TTLCache[str, int] = TTLCache(maxsize=10, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    return cache
+
+
+@pytest.fixture()
+def bus(mocker, cache) -> InvalidationBus:
+    queries = mocker.Mock(notify=mocker.AsyncMock())
+    bus = InvalidationBus(queries, "postgresql://localhost/test")
+    bus.register("test", cache)
+    return bus
+
+
+def notification(origin="other", cache="test", keys=("a",)) -> str:
+    return json.dumps({"origin": origin, "cache": cache, "keys": list(keys)})
+
+
+@pytest.mark.anyio
+async def test_invalidate(bus, cache):
+    await bus.invalidate("test", "a")
+
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    payload = json.loads(bus.queries.notify.await_args.kwargs["payload"])
+    assert payload == {"origin": bus.origin, "cache": "test", "keys": ["a"]}
+    assert bus.queries.notify.await_args.kwargs["channel"] == CHANNEL
+
+
+@pytest.mark.anyio
+async def test_invalidate_disabled(bus, cache):
+    bus.enabled = False
+
+    await bus.invalidate("test", "a")
+    # a single worker only needs its own caches evicted
+    assert cache.get("a") is None
+    bus.queries.notify.assert_not_awaited()
+
+
+def test_receive(bus, cache):
+    bus._receive(None, 1, CHANNEL, notification(keys=["a", "b"]))
+    assert len(cache) == 0
+
+
+def test_receive_own(bus, cache):
+    # this worker evicted its keys when it wrote, and may have cached new ones since
+    bus._receive(None, 1, CHANNEL, notification(origin=bus.origin))
+    assert cache.get("a") == 1
+
+
+def test_receive_unknown_cache(bus, cache):
+    bus._receive(None, 1, CHANNEL, notification(cache="other"))
+    assert cache.get("a") == 1
+
+
+def test_receive_unreadable(bus, cache):
+    bus._receive(None, 1, CHANNEL, "not json")
+    assert len(cache) == 0
+
+
+@pytest.mark.anyio
+async def test_listen_forever_reconnects(mocker, bus, cache):
+    mocker.patch("anyio.sleep", new_callable=mocker.AsyncMock)
+    connection = mocker.Mock(
+        add_listener=mocker.AsyncMock(),
+        fetchval=mocker.AsyncMock(side_effect=[1, ConnectionError]),
+    )
+    connect = mocker.patch(
+        "asyncpg.connect",
+        new_callable=mocker.AsyncMock,
+        side_effect=[OSError, connection, KeyboardInterrupt],
+    )
+    flush = mocker.spy(bus, "flush")
+
+    with pytest.raises(KeyboardInterrupt):
+        await bus.listen_forever()
+    assert connect.await_count == 3
+    connection.add_listener.assert_awaited_once_with(CHANNEL, bus._receive)
+    connection.terminate.assert_called_once()
+    # flushed after each failure, and when the listener connected
+    assert flush.call_count == 3
+    assert bus.connected is False
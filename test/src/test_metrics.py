@@ -0,0 +1,112 @@
+import pytest
+
+from src.metrics import Counter, Gauge, Histogram, Metric, Registry
+
+
+def test_counter():
+    counter = Counter("calls_total", "Calls.", ("name",))
+    counter.inc(name="a")
+    counter.inc(2, name="a")
+    counter.inc(name="b")
+
+    assert counter.value(name="a") == 3
+    assert counter.value(name="b") == 1
+    assert counter.value(name="c") == 0
+
+
+def test_counter_wrong_labels():
+    counter = Counter("calls_total", "Calls.", ("name",))
+    with pytest.raises(ValueError):
+        counter.inc(other="a")
+
+
+def test_metric_incomplete():
+    class Unsampled(Metric):
+        def reset(self) -> None:
+            pass
+
+    with pytest.raises(TypeError):
+        Unsampled("unsampled", "Never sampled.")
+
+
+def test_histogram():
+    histogram = Histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+    for value in [0.05, 0.1, 0.5, 5]:
+        histogram.observe(value)
+
+    series = histogram.value()
+    assert series.count == 4
+    assert series.sum == pytest.approx(5.65)
+    # values on a bound belong to that bucket
+    assert series.cumulative(histogram.buckets) == {"0.1": 2, "1.0": 3, "+Inf": 4}
+
+
+def test_histogram_time():
+    histogram = Histogram("latency_seconds", "Latency.", ("name",))
+    with pytest.raises(RuntimeError):
+        with histogram.time(name="a"):
+            raise RuntimeError()
+
+    # the block is observed even though it raised
+    assert histogram.value(name="a").count == 1
+
+
+def test_registry_get_or_create():
+    registry = Registry()
+    counter = registry.counter("calls_total", "Calls.")
+    assert registry.counter("calls_total", "Calls.") is counter
+
+    with pytest.raises(ValueError):
+        registry.histogram("calls_total", "Calls.")
+
+
+def test_registry_export():
+    registry = Registry()
+    registry.counter("calls_total", "Calls.", ("name",)).inc(name="a")
+    registry.histogram("latency_seconds", "Latency.", buckets=(1.0,)).observe(0.5)
+
+    exported = registry.export()
+    assert exported[0] == {
+        "name": "calls_total",
+        "type": "counter",
+        "help": "Calls.",
+        "samples": [{"labels": {"name": "a"}, "value": 1}],
+    }
+    assert exported[1]["samples"] == [
+        {"labels": {}, "count": 1, "sum": 0.5, "buckets": {"1.0": 1, "+Inf": 1}}
+    ]
+
+    registry.reset()
+    assert registry.export()[0]["samples"] == []
+
+
+def test_gauge():
+    gauge = Gauge("in_progress", "In progress.")
+    gauge.inc()
+    gauge.inc()
+    gauge.dec()
+    assert gauge.value() == 1
+
+    gauge.set(5)
+    assert gauge.value() == 5
+
+
+def test_registry_render():
+    registry = Registry()
+    registry.counter("calls_total", "Calls.", ("name",)).inc(name='say "hi"')
+    registry.histogram("latency_seconds", "Latency.", buckets=(1.0,)).observe(0.5)
+
+    assert registry.render() == "\n".join(
+        [
+            "# HELP calls_total Calls.",
+            "# TYPE calls_total counter",
+            'calls_total{name="say \\"hi\\""} 1',
+            "# HELP latency_seconds Latency.",
+            "# TYPE latency_seconds histogram",
+            'latency_seconds_bucket{le="1.0"} 1',
+            'latency_seconds_bucket{le="+Inf"} 1',
+            "latency_seconds_sum 0.5",
+            "latency_seconds_count 1",
+            "",
+        ]
+    )
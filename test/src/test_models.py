@@ -27,6 +27,12 @@ class TestTaskModel:
         with pytest.raises(ValueError):
             Task(id=1, title=bad_title, estimate=100)
 
+    @pytest.mark.parametrize("estimate", [600.0, timedelta(minutes=10)])
+    def test_from_row(self, estimate):
+        """Rows give estimates as intervals, or as seconds when nested in json."""
+        row = {"id": 1, "title": "test", "estimate": estimate, "done": False}
+        assert Task.from_row(row) == Task(id=1, title="test", estimate=600)
+
 
 class TestDaylistModel:
     def test_expiry_good(self):
@@ -40,3 +46,31 @@ class TestDaylistModel:
         # providing a far future expiry date is illegal
         with pytest.raises(ValueError):
             Daylist(id=1, expiry=datetime.now(timezone.utc) + timedelta(days=10))
+
+    def test_from_row(self):
+        expiry = datetime.now(timezone.utc) + timedelta(hours=1)
+        task = {"id": 2, "title": "test", "estimate": 600.0, "done": False}
+        row = {
+            "id": 1,
+            "expiry": expiry,
+            "version": 3,
+            "pending_tasks": [task],
+            "done_tasks": [task | {"id": 3, "done": True}],
+        }
+
+        daylist = Daylist.from_row(row)
+        validated = Daylist.model_validate(row)
+        assert daylist == validated
+        assert daylist.version == 3
+        assert daylist.done_tasks[0].id == 3
+        # serialized as if validated, without the version
+        assert daylist.model_dump_json() == validated.model_dump_json()
+
+    def test_from_row_trusted(self):
+        """Rows skip the checks for client input, which they passed when written."""
+        expiry = datetime.now(timezone.utc) + timedelta(days=2)
+        daylist = Daylist.from_row({"id": 1, "expiry": expiry})
+        assert daylist.expiry == expiry
+
+        with pytest.raises(ValueError):
+            Daylist.model_validate({"id": 1, "expiry": expiry})
@@ -1,8 +1,19 @@
 import pytest
 from datetime import datetime, timedelta, timezone
 
-from src.models import Daylist, Task
-from src.operations import build_agenda
+from src.events import ListEvent
+from src.models import Daylist, NewTask, Task
+from src.operations import (
+    build_agenda,
+    create_tasks,
+    follow_todaylist,
+    get_or_make_agenda,
+    mark_tasks_done,
+    mark_tasks_pending,
+    AgendaPlan,
+    ADB,
+    EVENTS,
+)
 
 TWENTY_M = timedelta(minutes=20)
 
@@ -96,3 +107,205 @@ def test_agenda_exceeds_expiry(list_with_tasks):
     )
     # warning due to exceeding expiry time
     assert agenda.past_expiry is True
+
+
+def test_agenda_given_start(list_with_tasks):
+    start = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+
+    agenda = build_agenda(list_with_tasks, start - timedelta(hours=2))
+
+    # the timeline starts when asked, so it ends past the expiry in 4h
+    assert agenda.timeline[0].start == start - timedelta(hours=2)
+    assert agenda.finish == start - timedelta(hours=1)
+    assert agenda.past_expiry is False
+
+
+def test_agenda_plan_anchor(list_with_tasks):
+    start = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    plan = AgendaPlan.from_daylist(list_with_tasks)
+
+    assert plan.anchor(start) == build_agenda(list_with_tasks, start)
+    # the same plan moves with the minute it's read at
+    later = plan.anchor(start + timedelta(minutes=5))
+    assert later.timeline[0].start == start + timedelta(minutes=5)
+    assert later.finish == start + timedelta(minutes=65)
+
+
+# cached agendas
+
+
+@pytest.fixture()
+def stored_list(mocker, list_with_tasks):
+    """Today's list for user 1 as queried, with id 3 at version 1."""
+    row = list_with_tasks.model_dump() | {"id": 3, "version": 1}
+    for task in row["pending_tasks"] + row["done_tasks"]:
+        # tasks nested in json give their estimates in seconds
+        task["estimate"] = task["estimate"].total_seconds()
+    mocker.patch(
+        "src.operations.ADB.get_or_add_todaylist",
+        new_callable=mocker.AsyncMock,
+        side_effect=lambda **kwargs: row | {"is_new": False, "is_stale": False},
+    )
+    mocker.patch(
+        "src.operations.ADB.get_active_daylist",
+        new_callable=mocker.AsyncMock,
+        return_value={"id": 3, "version": 1, "expiry": list_with_tasks.expiry},
+    )
+    return row
+
+
+@pytest.mark.anyio
+async def test_get_or_make_agenda_cached(stored_list):
+    created, plan = await get_or_make_agenda(1)
+    assert created is False
+    assert (plan.daylist_id, plan.version) == (3, 1)
+    assert [title for title, _, _ in plan.items] == ["one", "two", "three"]
+    ADB.get_active_daylist.assert_not_awaited()
+
+    # only the list's version is looked up while it's unchanged
+    assert await get_or_make_agenda(1) == (False, plan)
+    ADB.get_or_add_todaylist.assert_awaited_once()
+    ADB.get_active_daylist.assert_awaited_once()
+
+
+@pytest.mark.anyio
+async def test_get_or_make_agenda_changed(stored_list):
+    await get_or_make_agenda(1)
+    # changed by another worker, whose invalidation hasn't arrived
+    stored_list["version"] = 2
+    ADB.get_active_daylist.return_value["version"] = 2
+
+    _, plan = await get_or_make_agenda(1)
+    assert plan.version == 2
+    assert ADB.get_or_add_todaylist.await_count == 2
+
+
+@pytest.mark.anyio
+async def test_write_sends_no_invalidation(mocker):
+    mocker.patch(
+        "src.operations.ADB.add_tasks_for_user",
+        new_callable=mocker.AsyncMock,
+        return_value=[{"id": 5, "title": "a", "estimate": TWENTY_M, "done": False}],
+    )
+    notify = mocker.patch("src.operations.ADB.notify", new_callable=mocker.AsyncMock)
+
+    # cached agendas are checked against their list's version, so writes are one query
+    await create_tasks(1, [NewTask(title="a", estimate=TWENTY_M)])
+    notify.assert_not_awaited()
+
+
+# events
+
+
+@pytest.mark.anyio
+async def test_create_tasks_publishes(mocker):
+    mocker.patch(
+        "src.operations.ADB.add_tasks_for_user",
+        new_callable=mocker.AsyncMock,
+        return_value=[{"id": 5, "title": "a", "estimate": TWENTY_M, "done": False}],
+    )
+
+    async with EVENTS.subscribe("1") as events:
+        await create_tasks(1, [NewTask(title="a", estimate=TWENTY_M)])
+        assert events.receive_nowait() == ListEvent("added", {"ids": [5]})
+
+    # guests' streams follow their guest key
+    async with EVENTS.subscribe("guest-key") as events:
+        await create_tasks(1, [NewTask(title="a", estimate=TWENTY_M)], "guest-key")
+        assert events.receive_nowait() == ListEvent("added", {"ids": [5]})
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "operation,query,name",
+    [
+        (mark_tasks_done, "complete_tasks_for_user", "done"),
+        (mark_tasks_pending, "uncomplete_tasks_for_user", "pending"),
+    ],
+)
+async def test_mark_tasks_publishes(mocker, operation, query, name):
+    mocker.patch(f"src.operations.ADB.{query}", new_callable=mocker.AsyncMock)
+
+    async with EVENTS.subscribe("1") as events:
+        getattr(ADB, query).return_value = [{"id": 0, "valid": False}]
+        await operation(1, [0])
+        getattr(ADB, query).return_value = [{"id": 2, "valid": True}]
+        await operation(1, [2])
+
+        # only the update that changed tasks is sent
+        assert events.receive_nowait() == ListEvent(name, {"ids": [2]})
+        assert events.statistics().current_buffer_used == 0
+
+
+@pytest.mark.anyio
+async def test_follow_todaylist(mocker):
+    expiry = datetime.now(timezone.utc) + timedelta(milliseconds=50)
+    lookup = mocker.patch(
+        "src.operations.ADB.get_active_daylist",
+        new_callable=mocker.AsyncMock,
+        side_effect=[{"id": 3, "expiry": expiry}, None, None],
+    )
+    events = follow_todaylist(1, keepalive=0.01)
+
+    # keepalives until the list expires, with no next list yet
+    event = None
+    while event is None:
+        event = await anext(events)
+    assert event == ListEvent("expired", {"id": 3})
+    assert await anext(events) is None
+    assert lookup.await_count == 2
+
+    EVENTS.publish("1", ListEvent("added", {"ids": [7]}))
+    assert await anext(events) == ListEvent("added", {"ids": [7]})
+    # a change means a new list, whose expiry is looked up before waiting again
+    assert await anext(events) is None
+    assert lookup.await_count == 3
+    await events.aclose()
+    assert EVENTS.subscribers("1") == 0
+
+
+@pytest.mark.anyio
+async def test_follow_todaylist_database_clock_behind(mocker, monkeypatch):
+    monkeypatch.setattr("src.operations.EXPIRED_LIST_RECHECK", 0.05)
+    expired = {"id": 3, "expiry": datetime.now(timezone.utc) - timedelta(seconds=1)}
+    lookup = mocker.patch(
+        "src.operations.ADB.get_active_daylist",
+        new_callable=mocker.AsyncMock,
+        side_effect=[expired, expired, expired, None],
+    )
+    events = follow_todaylist(1, keepalive=10)
+
+    # the list is only announced as expired once, while the database still finds it
+    assert await anext(events) == ListEvent("expired", {"id": 3})
+    assert await anext(events) is None
+    assert await anext(events) is None
+    assert lookup.await_count == 3
+    await events.aclose()
+
+
+@pytest.mark.anyio
+async def test_follow_todaylist_guest_without_row(mocker):
+    find_guest = mocker.patch(
+        "src.operations.ADB.get_guest_user",
+        new_callable=mocker.AsyncMock,
+        return_value={"id": 9},
+    )
+    lookup = mocker.patch(
+        "src.operations.ADB.get_active_daylist",
+        new_callable=mocker.AsyncMock,
+        return_value=None,
+    )
+    events = follow_todaylist(0, keepalive=0.01, guest_key="guest-key")
+
+    # a guest without a row has no list to look up
+    assert await anext(events) is None
+    find_guest.assert_not_awaited()
+    lookup.assert_not_awaited()
+
+    # their first write stores them, and their list is looked up by id
+    EVENTS.publish("guest-key", ListEvent("added", {"ids": [7]}))
+    assert await anext(events) == ListEvent("added", {"ids": [7]})
+    assert await anext(events) is None
+    find_guest.assert_awaited_once_with(guest_key="guest-key")
+    lookup.assert_awaited_once_with(user_id=9)
+    await events.aclose()
@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+
+from config import Settings
+from src.operations import ADB
+from src.rollover import rollover_forever, run_rollover
+
+NOW = datetime(2024, 8, 24, tzinfo=timezone.utc)
+EXPIRY = NOW + timedelta(minutes=30)
+
+
+@pytest.fixture()
+def patched_rollover(mocker):
+    return mocker.patch(
+        "src.operations.ADB.add_next_daylists",
+        new_callable=mocker.AsyncMock,
+        return_value=[],
+    )
+
+
+@pytest.mark.anyio
+async def test_run_rollover(patched_rollover):
+    settings = Settings(rollover_ahead=3600, rollover_carry_over=True)
+    ADB.add_next_daylists.return_value = [
+        {"id": 1, "expiry": EXPIRY, "next_id": 3},
+        {"id": 2, "expiry": EXPIRY, "next_id": None},
+    ]
+
+    report = await run_rollover(settings, now=NOW)
+    assert (report.daylists, report.skipped) == (1, 1)
+    ADB.add_next_daylists.assert_awaited_once_with(
+        after_expiry=NOW,
+        after_id=0,
+        until=NOW + timedelta(hours=1),
+        active_since=NOW - timedelta(days=settings.rollover_active_days),
+        batch_size=settings.rollover_batch_size,
+        carry_over=True,
+    )
+
+
+@pytest.mark.anyio
+async def test_run_rollover_batches(mocker, patched_rollover):
+    sleep = mocker.patch("anyio.sleep", new_callable=mocker.AsyncMock)
+    settings = Settings(rollover_batch_size=2, rollover_batch_pause=0.5)
+    ADB.add_next_daylists.side_effect = [
+        [
+            {"id": 1, "expiry": EXPIRY, "next_id": 4},
+            {"id": 2, "expiry": EXPIRY, "next_id": 5},
+        ],
+        [{"id": 3, "expiry": EXPIRY, "next_id": 6}],
+    ]
+
+    report = await run_rollover(settings, now=NOW)
+    assert report.daylists == 3
+    # each batch continues after the last list of the one before
+    assert ADB.add_next_daylists.await_count == 2
+    assert ADB.add_next_daylists.await_args.kwargs["after_expiry"] == EXPIRY
+    assert ADB.add_next_daylists.await_args.kwargs["after_id"] == 2
+    sleep.assert_awaited_once_with(0.5)
+
+
+@pytest.mark.anyio
+async def test_rollover_forever_survives_failures(mocker):
+    mocker.patch("anyio.sleep", new_callable=mocker.AsyncMock)
+    rollover = mocker.patch(
+        "src.rollover.run_rollover",
+        new_callable=mocker.AsyncMock,
+        side_effect=[ConnectionError, mocker.DEFAULT, KeyboardInterrupt],
+    )
+
+    with pytest.raises(KeyboardInterrupt):
+        await rollover_forever(Settings(rollover_interval=60))
+    assert rollover.await_count == 3
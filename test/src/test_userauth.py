@@ -2,59 +2,93 @@ import pytest
 from sqlalchemy.exc import IntegrityError
 
 import src
-from src.models import User
+from src.models import LazyGuest, User, UserFromDB
 from src.userauth import (
     acceptable_user_creds,
+    authenticate_user,
     create_guest_user,
     create_user,
+    fetch_token_user,
     fetch_user,
     make_user_sub,
+    materialize_guest,
     populate_guest_user,
+    run_password_op,
+    PasswordQueueFull,
+    USER_CACHE,
 )
 import src.userauth
 
-DB = src.operations.DB
+ADB = src.operations.ADB
 DB_ERROR = IntegrityError("mock", "mock", "mock")
 
 
+@pytest.mark.anyio
 @pytest.mark.parametrize("email,pw", [("test@test.com", "123456789")])
-def test_create_user(mocker, email, pw):
-    mocker.patch("src.operations.DB.add_registered_user", return_value=1)
-    result = create_user(email, pw)
+async def test_create_user(mocker, email, pw):
+    mocker.patch(
+        "src.operations.ADB.add_registered_user",
+        new_callable=mocker.AsyncMock,
+        return_value=1,
+    )
+    result = await create_user(email, pw)
     assert result == 1
-    DB.add_registered_user.assert_called()
-
-
-def test_create_guest_user(mocker, settings):
-    mocker.patch("src.operations.DB.add_anon_user")
-    mocker.patch("src.userauth.fetch_user")
-
-    create_guest_user(settings.guest_user_key)
-    # called correctly
-    DB.add_anon_user.assert_called()
-    src.userauth.fetch_user.assert_called()
-
-
-def test_create_guest_user_bad(mocker):
-    mocker.patch("src.operations.DB.add_anon_user", side_effect=DB_ERROR)
-    result = create_guest_user(pw="wrong")
+    ADB.add_registered_user.assert_awaited()
+
+
+@pytest.mark.anyio
+async def test_create_guest_user(mocker, settings):
+    mocker.patch("src.operations.ADB.add_anon_user", new_callable=mocker.AsyncMock)
+
+    guest = await create_guest_user(settings.guest_user_key)
+    # guests are not stored until they write something
+    ADB.add_anon_user.assert_not_awaited()
+    assert isinstance(guest, LazyGuest)
+    assert make_user_sub(guest) == f"guest:{guest.guest_key}"
+    assert guest != await create_guest_user(settings.guest_user_key)
+    # their token finds them without a query
+    assert USER_CACHE.get(make_user_sub(guest)) == guest
+
+
+@pytest.mark.anyio
+async def test_create_guest_user_bad(mocker):
+    mocker.patch(
+        "src.operations.ADB.add_anon_user",
+        new_callable=mocker.AsyncMock,
+        side_effect=DB_ERROR,
+    )
+    result = await create_guest_user(pw="wrong")
     assert result is None
 
 
-def test_populate_guest_user(mocker):
-    mocker.patch("src.operations.DB.register_anon_user", return_value=1)
-
-    result = populate_guest_user(User(id=123), email="e@mail.com", pw="secret")
-    DB.register_anon_user.assert_called()
-    assert result is True
-
-
-def test_populate_guest_user_duplicate(mocker):
-    mocker.patch("src.operations.DB.register_anon_user", side_effect=DB_ERROR)
-
-    result = populate_guest_user(User(id=123), email="e@mail.com", pw="secret")
-    DB.register_anon_user.assert_called()
-    assert result is False
+@pytest.mark.anyio
+async def test_populate_guest_user(mocker):
+    mocker.patch(
+        "src.operations.ADB.register_anon_user",
+        new_callable=mocker.AsyncMock,
+        return_value=1,
+    )
+
+    result = await populate_guest_user(
+        UserFromDB(id=123), email="e@mail.com", pw="secret"
+    )
+    ADB.register_anon_user.assert_awaited()
+    assert result == 123
+
+
+@pytest.mark.anyio
+async def test_populate_guest_user_duplicate(mocker):
+    mocker.patch(
+        "src.operations.ADB.register_anon_user",
+        new_callable=mocker.AsyncMock,
+        side_effect=DB_ERROR,
+    )
+
+    result = await populate_guest_user(
+        UserFromDB(id=123), email="e@mail.com", pw="secret"
+    )
+    ADB.register_anon_user.assert_awaited()
+    assert result is None
 
 
 @pytest.mark.parametrize(
@@ -86,76 +120,311 @@ def test_user_creds_invalid(email, pw):
 
 @pytest.mark.parametrize(
     "user,expected_sub",
-    [(User(id=123), "anon:123"), (User(id=123, email="my@email.com"), "my@email.com")],
+    [(User(id=123), "123"), (User(id=123, email="my@email.com"), "123")],
 )
 def test_make_user_sub(user, expected_sub):
     result = make_user_sub(user)
     assert result == expected_sub
 
 
-def test_fetch_user_email(mocker):
+@pytest.mark.anyio
+async def test_fetch_user_email(mocker):
     dummy_user = {"id": 123, "email": "my@email.com"}
-    mocker.patch("src.operations.DB.get_registered_user", return_value=dummy_user)
-    mocker.patch("src.operations.DB.get_user", return_value=dummy_user)
-
-    result = fetch_user(email=dummy_user["email"])
+    mocker.patch(
+        "src.operations.ADB.get_registered_user",
+        new_callable=mocker.AsyncMock,
+        return_value=dummy_user,
+    )
+    mocker.patch(
+        "src.operations.ADB.get_user",
+        new_callable=mocker.AsyncMock,
+        return_value=dummy_user,
+    )
+
+    result = await fetch_user(email=dummy_user["email"])
     # use the correct function
-    DB.get_registered_user.assert_called()
-    DB.get_user.assert_not_called()
+    ADB.get_registered_user.assert_awaited()
+    ADB.get_user.assert_not_awaited()
     # correct result properties
     assert result.id == dummy_user["id"]
 
 
-def test_fetch_user_anon(mocker):
+@pytest.mark.anyio
+async def test_fetch_user_anon(mocker):
     dummy_user = {"id": 123}
-    mocker.patch("src.operations.DB.get_registered_user", return_value=dummy_user)
-    mocker.patch("src.operations.DB.get_user", return_value=dummy_user)
-
-    result = fetch_user(id=dummy_user["id"])
+    mocker.patch(
+        "src.operations.ADB.get_registered_user",
+        new_callable=mocker.AsyncMock,
+        return_value=dummy_user,
+    )
+    mocker.patch(
+        "src.operations.ADB.get_user",
+        new_callable=mocker.AsyncMock,
+        return_value=dummy_user,
+    )
+
+    result = await fetch_user(id=dummy_user["id"])
     # use the correct function
-    DB.get_user.assert_called()
-    DB.get_registered_user.assert_not_called()
+    ADB.get_user.assert_awaited()
+    ADB.get_registered_user.assert_not_awaited()
     # correct result properties
     assert result.id == dummy_user["id"]
 
 
+@pytest.mark.anyio
 @pytest.mark.parametrize(
     "sub_value,dummy_user",
     [
+        ("123", {"id": 123}),
         ("anon:123", {"id": 123}),
         ("my@email.com", {"id": 123, "email": "my@email.com"}),
     ],
 )
-def test_fetch_user_sub(mocker, sub_value, dummy_user):
-    mocker.patch("src.operations.DB.get_registered_user", return_value=dummy_user)
-    mocker.patch("src.operations.DB.get_user", return_value=dummy_user)
-
-    result = fetch_user(sub=sub_value)
+async def test_fetch_user_sub(mocker, sub_value, dummy_user):
+    mocker.patch(
+        "src.operations.ADB.get_registered_user",
+        new_callable=mocker.AsyncMock,
+        return_value=dummy_user,
+    )
+    mocker.patch(
+        "src.operations.ADB.get_user",
+        new_callable=mocker.AsyncMock,
+        return_value=dummy_user,
+    )
+
+    result = await fetch_user(sub=sub_value)
     # use the correct function
-    if "anon" in sub_value:
-        DB.get_user.assert_called()
-        DB.get_registered_user.assert_not_called()
+    if "@" not in sub_value:
+        ADB.get_user.assert_awaited()
+        ADB.get_registered_user.assert_not_awaited()
     else:
-        DB.get_registered_user.assert_called()
-        DB.get_user.assert_not_called()
+        ADB.get_registered_user.assert_awaited()
+        ADB.get_user.assert_not_awaited()
     # correct result properties
     assert result.id == dummy_user["id"]
 
 
+@pytest.mark.anyio
 @pytest.mark.parametrize(
     "kwargs", [{"id": 123}, {"email": "hi@there.com"}, {"sub": "username"}]
 )
-def test_fetch_user_not_found(mocker, kwargs):
-    mocker.patch("src.operations.DB.get_registered_user", return_value=None)
-    mocker.patch("src.operations.DB.get_user", return_value=None)
-
-    result = fetch_user(**kwargs)
+async def test_fetch_user_not_found(mocker, kwargs):
+    mocker.patch(
+        "src.operations.ADB.get_registered_user",
+        new_callable=mocker.AsyncMock,
+        return_value=None,
+    )
+    mocker.patch(
+        "src.operations.ADB.get_user", new_callable=mocker.AsyncMock, return_value=None
+    )
+
+    result = await fetch_user(**kwargs)
     assert result is None
 
 
-def test_fetch_user_no_key(mocker):
-    mocker.patch("src.operations.DB.get_registered_user")
-    mocker.patch("src.operations.DB.get_user")
+@pytest.mark.anyio
+async def test_fetch_user_no_key(mocker):
+    mocker.patch(
+        "src.operations.ADB.get_registered_user", new_callable=mocker.AsyncMock
+    )
+    mocker.patch("src.operations.ADB.get_user", new_callable=mocker.AsyncMock)
 
     with pytest.raises(ValueError):
-        fetch_user()
+        await fetch_user()
+
+
+@pytest.mark.anyio
+async def test_fetch_user_sub_cached(mocker):
+    mocker.patch(
+        "src.operations.ADB.get_user",
+        new_callable=mocker.AsyncMock,
+        return_value={"id": 123},
+    )
+
+    first = await fetch_user(sub="anon:123")
+    second = await fetch_user(sub="anon:123")
+    # only the first lookup reaches the database
+    ADB.get_user.assert_awaited_once()
+    assert second == first
+
+
+@pytest.mark.anyio
+async def test_fetch_user_sub_not_found_uncached(mocker):
+    mocker.patch(
+        "src.operations.ADB.get_registered_user",
+        new_callable=mocker.AsyncMock,
+        return_value=None,
+    )
+
+    await fetch_user(sub="my@email.com")
+    await fetch_user(sub="my@email.com")
+    assert ADB.get_registered_user.await_count == 2
+
+
+@pytest.mark.anyio
+async def test_populate_guest_user_invalidates_cache(mocker):
+    mocker.patch(
+        "src.operations.ADB.get_user",
+        new_callable=mocker.AsyncMock,
+        return_value={"id": 123},
+    )
+    mocker.patch(
+        "src.operations.ADB.register_anon_user",
+        new_callable=mocker.AsyncMock,
+        return_value=1,
+    )
+    await fetch_user(sub="anon:123")
+
+    await populate_guest_user(UserFromDB(id=123), email="e@mail.com", pw="secret")
+    assert src.userauth.USER_CACHE.get("anon:123") is None
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("version,found", [(1, True), (2, False), (None, True)])
+async def test_fetch_token_user_version(mocker, version, found):
+    mocker.patch(
+        "src.operations.ADB.get_user",
+        new_callable=mocker.AsyncMock,
+        return_value={"id": 123, "version": 1},
+    )
+
+    result = await fetch_token_user("123", version)
+    assert (result is not None) == found
+
+
+@pytest.mark.anyio
+async def test_fetch_token_user_stale_cache(mocker):
+    mocker.patch(
+        "src.operations.ADB.get_user",
+        new_callable=mocker.AsyncMock,
+        side_effect=[{"id": 123, "version": 1}, {"id": 123, "version": 2}],
+    )
+    await fetch_token_user("123", 1)
+
+    # a token for a newer version than the cached user rereads the user
+    result = await fetch_token_user("123", 2)
+    assert result.version == 2
+    assert ADB.get_user.await_count == 2
+
+
+@pytest.mark.anyio
+async def test_fetch_token_user_legacy_refused(mocker, monkeypatch):
+    monkeypatch.setattr(src.operations.SETTINGS, "accept_legacy_tokens", False)
+    mocker.patch(
+        "src.operations.ADB.get_registered_user", new_callable=mocker.AsyncMock
+    )
+
+    result = await fetch_token_user("my@email.com", None)
+    assert result is None
+    ADB.get_registered_user.assert_not_awaited()
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("workers", [0, 1])
+async def test_run_password_op(monkeypatch, workers):
+    monkeypatch.setattr(src.operations.SETTINGS, "password_workers", workers)
+
+    password_hash = await run_password_op("hash", src.userauth._hash, "secret", 4)
+    assert await run_password_op(
+        "verify", src.userauth._verify_and_update, "secret", password_hash, 4
+    ) == (True, None)
+    assert await run_password_op(
+        "verify", src.userauth._verify_and_update, "wrong", password_hash, 4
+    ) == (False, None)
+
+
+@pytest.mark.anyio
+async def test_run_password_op_queue_full(mocker, monkeypatch):
+    monkeypatch.setattr(src.operations.SETTINGS, "password_queue_size", 0)
+    mocker.patch(
+        "src.operations.ADB.add_registered_user", new_callable=mocker.AsyncMock
+    )
+    # every worker is busy, and no operation may wait for one
+    limiter = src.userauth._password_limiter()
+    borrowers = [object() for _ in range(int(limiter.total_tokens))]
+    for borrower in borrowers:
+        limiter.acquire_on_behalf_of_nowait(borrower)
+
+    try:
+        with pytest.raises(PasswordQueueFull):
+            await create_user("test@test.com", "123456789")
+        ADB.add_registered_user.assert_not_awaited()
+    finally:
+        for borrower in borrowers:
+            limiter.release_on_behalf_of(borrower)
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("old_rounds,rehashed", [(4, True), (5, False)])
+async def test_authenticate_user_rehash(mocker, monkeypatch, old_rounds, rehashed):
+    monkeypatch.setattr(src.userauth, "password_rounds", 5)
+    old_hash = src.userauth._hash("secret", old_rounds)
+    mocker.patch(
+        "src.operations.ADB.get_registered_user",
+        new_callable=mocker.AsyncMock,
+        return_value={"id": 123, "email": "my@email.com", "password_hash": old_hash},
+    )
+    mocker.patch(
+        "src.operations.ADB.update_password_hash",
+        new_callable=mocker.AsyncMock,
+        return_value=1,
+    )
+
+    user = await authenticate_user("my@email.com", "secret")
+    assert user.id == 123
+    assert ADB.update_password_hash.await_count == int(rehashed)
+    if rehashed:
+        new_hash = ADB.update_password_hash.await_args.kwargs["new_hash"]
+        assert new_hash.startswith("$2b$05$")
+        assert user.password_hash == new_hash
+
+
+@pytest.mark.parametrize("target_ms,expected", [(0, 10), (40, 12), (10**9, 31)])
+def test_calibrate_password_rounds(mocker, target_ms, expected):
+    # each extra round doubles the time: 10ms at cost 10
+    mocker.patch(
+        "src.userauth._time_hash", side_effect=lambda rounds: 0.01 * 2 ** (rounds - 10)
+    )
+    assert src.userauth.calibrate_password_rounds(target_ms) == expected
+
+
+def test_set_password_rounds(monkeypatch):
+    monkeypatch.setattr(src.userauth, "password_rounds", 12)
+    src.userauth.set_password_rounds(4)
+    assert src.userauth.hash_password("secret").startswith("$2b$04$")
+
+
+GUEST_KEY = "0b5a3e4c-9f6d-4a51-8d8e-6f1c2b7a9e30"
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("stored", [True, False])
+async def test_fetch_user_guest_sub(mocker, stored):
+    stored_guest = {"id": 123, "guest_key": GUEST_KEY}
+    mocker.patch(
+        "src.operations.ADB.get_guest_user",
+        new_callable=mocker.AsyncMock,
+        return_value=stored_guest if stored else None,
+    )
+
+    result = await fetch_user(sub=f"guest:{GUEST_KEY}")
+    ADB.get_guest_user.assert_awaited_with(guest_key=GUEST_KEY)
+    assert isinstance(result, LazyGuest) != stored
+    assert result.id == (123 if stored else 0)
+
+
+@pytest.mark.anyio
+async def test_materialize_guest(mocker):
+    mocker.patch(
+        "src.operations.ADB.add_guest_user",
+        new_callable=mocker.AsyncMock,
+        return_value={"id": 123, "guest_key": GUEST_KEY},
+    )
+    mocker.patch("src.operations.ADB.get_guest_user", new_callable=mocker.AsyncMock)
+
+    user = await materialize_guest(LazyGuest(guest_key=GUEST_KEY))
+    assert user.id == 123
+    assert not isinstance(user, LazyGuest)
+    # the guest's token finds the stored guest from now on
+    assert await fetch_user(sub=f"guest:{GUEST_KEY}") == user
+    ADB.get_guest_user.assert_not_awaited()
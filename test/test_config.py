@@ -1,3 +1,6 @@
+from pydantic import ValidationError
+import pytest
+
 from config import Settings
 
 
@@ -12,3 +15,28 @@ def test_postgres_url(settings):
     assert settings.test_database_url != bad_pgurl
     assert "postgresql" in settings.database_url
     assert "postgresql" in settings.test_database_url
+
+
+def test_db_pool_options(monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "2")
+    monkeypatch.setenv("DB_POOL_PRE_PING", "true")
+
+    options = Settings().db_pool_options()
+
+    assert options["pool_size"] == 2
+    assert options["pool_pre_ping"] is True
+    assert options["max_overflow"] == 10
+
+
+def test_rate_limits(monkeypatch):
+    monkeypatch.setenv("RATE_LIMITS", '{"/user/token": {"ip": " 5/minute"}}')
+
+    assert Settings().rate_limits == {"/user/token": {"ip": " 5/minute"}}
+
+
+@pytest.mark.parametrize("spec", ["5", "five/minute", "5/fortnight", "0/minute"])
+def test_rate_limits_invalid(monkeypatch, spec):
+    monkeypatch.setenv("RATE_LIMITS", f'{{"/user/token": {{"ip": "{spec}"}}}}')
+
+    with pytest.raises(ValidationError):
+        Settings()
@@ -3,9 +3,25 @@
 Interacts with the test database.
 """
 
+import anyio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+import json
+from sqlalchemy import text
 from sqlalchemy.exc import IntegrityError
 import pytest
+import time
+
+from db.connect import pool_stats, query_connect
+from db.instrument import (
+    instrument,
+    QUERY_CALLS,
+    QUERY_DURATION,
+    QUERY_ROWS,
+    TRANSACTION_DURATION,
+)
+from src.cache import TTLCache
+from src.invalidation import InvalidationBus
 
 FUTURE_TIME = "2122-02-22T00:00:00+05"
 OLD_TIME = "2020-02-20 00:00:00+05"
@@ -126,6 +142,19 @@ class TestUsers:
         result = db.add_anon_user()
         assert db.count_anon_users() == 2
 
+    def test_add_guest_user(cls, db):
+        guest_key = "0b5a3e4c-9f6d-4a51-8d8e-6f1c2b7a9e30"
+        assert db.get_guest_user(guest_key=guest_key) is None
+
+        result = db.add_guest_user(guest_key=guest_key)
+        assert result["id"] > 0
+        assert result["guest_key"] == guest_key
+        assert result["email"] is None
+        assert db.get_guest_user(guest_key=guest_key) == result
+        # adding the guest again finds the same user
+        assert db.add_guest_user(guest_key=guest_key) == result
+        assert db.count_anon_users() == 1
+
     def test_add_registered_user(cls, db, seed):
         test_email = "my@email.com"
         test_pw = "hashyhash"
@@ -167,6 +196,19 @@ class TestUsers:
         assert result == 1
         user = db.get_user(id=uid)
         assert user["email"] == sample_email
+        # registering changes who the user is, so tokens for the guest are stale
+        assert user["version"] == 2
+
+    def test_update_password_hash(cls, db, seed):
+        uid = db.get_registered_user(email=TEST_EMAIL)["id"]
+
+        result = db.update_password_hash(id=uid, password_hash="12345", new_hash="678")
+        assert result == 1
+        assert db.get_user(id=uid)["password_hash"] == "678"
+        # the hash changed since it was read, so it is left alone
+        result = db.update_password_hash(id=uid, password_hash="12345", new_hash="9")
+        assert result == 0
+        assert db.get_user(id=uid)["password_hash"] == "678"
 
     def test_register_anon_user_invalid_known(cls, db, seed):
         uid = db.get_registered_user(email=TEST_EMAIL)["id"]
@@ -209,6 +251,45 @@ class TestUsers:
         result = db.delete_user(id=-1)
         assert result == 0
 
+    def test_delete_inactive_guests(cls, db, seed):
+        inactive = db.add_anon_user()
+        db.add_daylist(user_id=inactive, expiry=OLD_TIME)
+        active = db.add_anon_user()
+        lid = db.add_daylist(user_id=active, expiry=FUTURE_TIME)
+        db.add_task_to_list(daylist_id=lid, title="written", estimate="PT1M")
+        before = datetime.now().astimezone() + timedelta(hours=1)
+
+        # the seeded guest and the inactive one wrote to no list after the cutoff
+        assert db.delete_inactive_guests(before=before, batch_size=1) == 1
+        assert db.delete_inactive_guests(before=before, batch_size=1) == 1
+        assert db.delete_inactive_guests(before=before, batch_size=1) == 0
+        assert db.get_user(id=inactive) is None
+        assert db.get_user(id=active) is not None
+        assert db.get_registered_user(email=TEST_EMAIL) is not None
+
+    def test_delete_inactive_guests_rolled_over(cls, db, seed):
+        """Lists the rollover job made don't keep idle guests from being deleted."""
+        idle = db.add_anon_user()
+        db.add_daylist(user_id=idle, expiry=FUTURE_TIME)
+        rolled = db.add_next_daylists(
+            after_expiry=OLD_TIME,
+            after_id=0,
+            until=FUTURE_TIME,
+            active_since=OLD_TIME,
+            batch_size=10,
+            carry_over=False,
+        )
+        assert [row["next_id"] for row in rolled if row["next_id"]]
+        before = datetime.now().astimezone() + timedelta(hours=1)
+
+        assert db.delete_inactive_guests(before=before, batch_size=10) == 2
+        assert db.get_user(id=idle) is None
+
+    def test_delete_inactive_guests_recent(cls, db, seed):
+        result = db.delete_inactive_guests(before=OLD_TIME, batch_size=10)
+        assert result == 0
+        assert db.count_users() == 2
+
     def test_delete_all_users(cls, db, seed):
         result = db.delete_all_users()
         assert result != 0
@@ -270,12 +351,20 @@ class TestDaylist:
 
     def test_add_daylist(cls, db, uid):
         expiry_str = FUTURE_TIME
-        db.add_daylist(user_id=uid, expiry=expiry_str)
+        db.add_daylist(user_id=uid, expiry=OLD_TIME)
 
         result = db.add_daylist(user_id=uid, expiry=expiry_str)
         # successful creation + return id for both registered and anon
         assert isinstance(result, int) and result > 0
 
+    def test_add_daylist_already_active(cls, db, uid):
+        db.add_daylist(user_id=uid, expiry=FUTURE_TIME)
+
+        # only one list can be active for a user at once
+        with pytest.raises(IntegrityError):
+            db.add_daylist(user_id=uid, expiry=FUTURE_TIME)
+        assert db.get_active_daylist(user_id=uid) is not None
+
     @pytest.mark.parametrize(
         "expiry",
         [
@@ -297,6 +386,227 @@ class TestDaylist:
         with pytest.raises(IntegrityError):
             db.add_daylist(user_id=uid, expiry=expiry_str)
 
+    # get or add
+
+    def test_get_or_add_todaylist_new(cls, db, uid):
+        db.add_daylist(user_id=uid, expiry=OLD_TIME)
+
+        result = db.get_or_add_todaylist(user_id=uid, expiry=FUTURE_TIME)
+        # a fresh empty list is created
+        assert result["is_new"] is True
+        assert result["expiry"] == datetime.fromisoformat(FUTURE_TIME)
+        assert result["pending_tasks"] == []
+        assert result["done_tasks"] == []
+        assert db.get_active_daylist(user_id=uid)["id"] == result["id"]
+
+    def test_get_or_add_todaylist_existing(cls, db, uid):
+        lid = db.add_daylist(user_id=uid, expiry=FUTURE_TIME)
+        task_id = db.add_task_to_list(daylist_id=lid, title="one", estimate="PT1M")
+
+        result = db.get_or_add_todaylist(user_id=uid, expiry=OLD_TIME)
+        # the active list is returned with its tasks, ignoring the new expiry
+        assert result["is_new"] is False
+        assert result["id"] == lid
+        assert result["expiry"] == datetime.fromisoformat(FUTURE_TIME)
+        assert [task["id"] for task in result["pending_tasks"]] == [task_id]
+
+    def test_get_or_add_todaylist_existing_empty(cls, db, uid):
+        lid = db.add_daylist(user_id=uid, expiry=FUTURE_TIME)
+
+        result = db.get_or_add_todaylist(user_id=uid, expiry=FUTURE_TIME)
+        assert result["is_new"] is False
+        assert result["id"] == lid
+        assert result["pending_tasks"] == []
+        assert result["done_tasks"] == []
+
+    def test_get_or_add_todaylist_grouped_tasks(cls, db, uid):
+        old_lid = db.add_daylist(user_id=uid, expiry=OLD_TIME)
+        db.add_task_to_list(daylist_id=old_lid, title="old", estimate="PT1M")
+        lid = db.add_daylist(user_id=uid, expiry=FUTURE_TIME)
+        pending_ids = [
+            db.add_task_to_list(daylist_id=lid, title="one", estimate="PT1H5M"),
+            db.add_task_to_list(daylist_id=lid, title="two", estimate="PT1M"),
+        ]
+        done_ids = [
+            db.add_task_to_list(daylist_id=lid, title="cat", estimate="PT1M"),
+            db.add_task_to_list(daylist_id=lid, title="dog", estimate="PT1M"),
+        ]
+        done_ids.reverse()  # finish time != creation time
+        for task_id in done_ids:
+            db.complete_task(id=task_id)
+
+        result = db.get_or_add_todaylist(user_id=uid, expiry=FUTURE_TIME)
+        # tasks are grouped by status, in list order and finish order
+        assert [task["id"] for task in result["pending_tasks"]] == pending_ids
+        assert [task["id"] for task in result["done_tasks"]] == done_ids
+        assert all(task["done"] for task in result["done_tasks"])
+        # estimates are given in seconds
+        assert result["pending_tasks"][0]["estimate"] == 65 * 60
+
+    @staticmethod
+    def last_active(db, uid) -> datetime:
+        with db.engine.connect() as connection:
+            return connection.scalar(
+                text("SELECT last_active_at FROM users WHERE id = :uid"), {"uid": uid}
+            )
+
+    def test_get_or_add_todaylist_marks_active(cls, db, uid):
+        joined = cls.last_active(db, uid)
+
+        db.get_or_add_todaylist(user_id=uid, expiry=FUTURE_TIME)
+        first_read = cls.last_active(db, uid)
+        assert first_read > joined
+        # later reads of the same list write nothing
+        db.get_or_add_todaylist(user_id=uid, expiry=FUTURE_TIME)
+        assert cls.last_active(db, uid) == first_read
+
+    def test_get_or_add_todaylist_concurrent(cls, db, uid):
+        insert = text("INSERT INTO daylists (user_id, expiry) VALUES (:uid, :expiry)")
+        waiting = text(
+            "SELECT count(*) FROM pg_stat_activity WHERE wait_event_type = 'Lock'"
+        )
+
+        with db.engine.connect() as other, ThreadPoolExecutor(1) as pool:
+            # another request is creating a list for this user
+            other.execute(insert, {"uid": uid, "expiry": FUTURE_TIME})
+            racing = pool.submit(
+                db.get_or_add_todaylist, user_id=uid, expiry=FUTURE_TIME
+            )
+            with db.engine.connect() as monitor:
+                for _ in range(50):
+                    if racing.done() or monitor.scalar(waiting):
+                        break
+                    time.sleep(0.1)
+            other.commit()
+            result = racing.result()
+
+        # the racing insert backs off instead of adding a second active list
+        assert result is None
+        result = db.get_or_add_todaylist(user_id=uid, expiry=FUTURE_TIME)
+        assert result["is_new"] is False
+
+    # delete
+
+    def test_delete_expired_daylists(cls, db, uid):
+        old_list = db.add_daylist(user_id=uid, expiry=OLD_TIME)
+        db.add_task_to_list(daylist_id=old_list, title="old task", estimate="PT1M")
+        kept_list = db.add_daylist(user_id=uid, expiry=FUTURE_TIME)
+        before = "2023-01-01T00:00:00+00"
+
+        # lists from 2014, 2020 and 2022 are past the cutoff
+        assert db.delete_expired_daylists(before=before, batch_size=2) == 2
+        assert db.delete_expired_daylists(before=before, batch_size=2) == 1
+        assert db.delete_expired_daylists(before=before, batch_size=2) == 0
+        assert db.count_tasks(daylist_id=old_list) == 0
+        assert db.get_active_daylist(user_id=uid)["id"] == kept_list
+
+    # rollover
+
+    @staticmethod
+    def add_next_daylists(db, **params) -> list:
+        # after the seeded lists, which have all expired
+        defaults = dict(
+            after_expiry="2025-01-01T00:00:00+00",
+            after_id=0,
+            until=FUTURE_TIME,
+            active_since="2000-01-01T00:00:00+00",
+            batch_size=10,
+            carry_over=False,
+        )
+        return list(db.add_next_daylists(**(defaults | params)))
+
+    def test_add_next_daylists(cls, db, uid):
+        lid = db.add_daylist(user_id=uid, expiry=FUTURE_TIME)
+
+        result = cls.add_next_daylists(db)
+        assert [row["id"] for row in result] == [lid]
+        next_id = result[0]["next_id"]
+        assert next_id is not None
+        # the next list only becomes active once the current one expires
+        assert db.get_active_daylist(user_id=uid)["id"] == lid
+
+        after = datetime.fromisoformat(FUTURE_TIME)
+        result = cls.add_next_daylists(
+            db, after_expiry=after, until=after + timedelta(days=2)
+        )
+        assert [(row["id"], row["expiry"]) for row in result] == [
+            (next_id, after + timedelta(days=1))
+        ]
+
+    def test_add_next_daylists_rerun(cls, db, uid):
+        db.add_daylist(user_id=uid, expiry=FUTURE_TIME)
+        assert len(cls.add_next_daylists(db)) == 1
+        # users who have their next list are skipped
+        assert cls.add_next_daylists(db) == []
+
+    def test_add_next_daylists_batches(cls, db, uid):
+        first = db.add_daylist(user_id=uid, expiry=FUTURE_TIME)
+        other = db.add_daylist(user_id=db.add_anon_user(), expiry=FUTURE_TIME)
+        later = db.add_daylist(user_id=db.add_anon_user(), expiry="2122-02-22T06:00+05")
+        db.add_daylist(user_id=db.add_anon_user(), expiry="2122-02-22T18:00+05")
+        until = "2122-02-22T12:00+05"
+
+        result = cls.add_next_daylists(db, until=until, batch_size=2)
+        assert [row["id"] for row in result] == [first, other]
+        # the next batch continues after the last list of this one
+        last = result[-1]
+        result = cls.add_next_daylists(
+            db,
+            after_expiry=last["expiry"],
+            after_id=last["id"],
+            until=until,
+            batch_size=2,
+        )
+        assert [row["id"] for row in result] == [later]
+
+    def test_add_next_daylists_idle(cls, db, uid):
+        """Idle users' lists aren't rolled over, or they'd get a new list every day."""
+        lid = db.add_daylist(user_id=uid, expiry=FUTURE_TIME)
+        next_id = cls.add_next_daylists(db)[0]["next_id"]
+
+        # the user reads and writes nothing from now on
+        idle = datetime.now().astimezone() + timedelta(hours=1)
+        after = datetime.fromisoformat(FUTURE_TIME)
+        result = cls.add_next_daylists(
+            db, after_expiry=after, until=after + timedelta(days=2), active_since=idle
+        )
+        assert result == []
+        assert db.get_active_daylist(user_id=uid)["id"] == lid
+
+        # writing to a list counts as activity
+        db.add_task_to_list(daylist_id=next_id, title="new", estimate="PT1M")
+        result = cls.add_next_daylists(
+            db, after_expiry=after, until=after + timedelta(days=2), active_since=idle
+        )
+        assert [row["id"] for row in result] == [next_id]
+
+    @pytest.mark.parametrize("carry_over", [True, False])
+    def test_add_next_daylists_carry_over(cls, db, uid, carry_over):
+        expiry = datetime.now().astimezone() - timedelta(minutes=1)
+        lid = db.add_daylist(user_id=uid, expiry=expiry)
+        db.add_task_to_list(daylist_id=lid, title="pending", estimate="PT1M")
+        finished = db.add_task_to_list(daylist_id=lid, title="late", estimate="PT1M")
+        result = cls.add_next_daylists(
+            db, after_expiry=expiry - timedelta(hours=1), carry_over=carry_over
+        )
+        next_id = result[0]["next_id"]
+        # nothing is copied until the next list is read, once the current one expires
+        assert db.count_tasks(daylist_id=next_id) == 0
+        db.complete_task(id=finished)
+        db.add_task_to_list(daylist_id=lid, title="added", estimate="PT1M")
+        db.add_task_to_list(daylist_id=next_id, title="new", estimate="PT1M")
+
+        first = db.get_or_add_todaylist(user_id=uid, expiry=FUTURE_TIME)
+        assert first["id"] == next_id
+        assert first["is_stale"] is carry_over
+        result = db.get_or_add_todaylist(user_id=uid, expiry=FUTURE_TIME)
+        assert result["is_stale"] is False
+        # tasks still pending when the list expired follow any added since, in order
+        titles = [task["title"] for task in result["pending_tasks"]]
+        assert titles == (["new", "pending", "added"] if carry_over else ["new"])
+        assert result["version"] == first["version"] + int(carry_over)
+        assert db.count_tasks(daylist_id=lid) == 3
+
 
 # Task functions
 
@@ -498,6 +808,27 @@ class TestTask:
         # multiple inserts are successful
         assert db.count_tasks(daylist_id=lid) == 3
 
+    def test_add_usertasks(cls, db, uid, lid):
+        prior_id = db.add_task_for_user(user_id=uid, title="first", estimate="PT1M")
+        new_tasks = [
+            {"title": "second", "estimate": "PT1H5M"},
+            {"title": "third", "estimate": "PT10M"},
+        ]
+
+        result = list(db.add_tasks_for_user(user_id=uid, tasks=json.dumps(new_tasks)))
+        # new tasks are returned in order
+        assert [task["title"] for task in result] == ["second", "third"]
+        assert result[0]["estimate"] == timedelta(hours=1, minutes=5)
+        assert all(task["done"] is False for task in result)
+        # and added to the end of the list
+        pending = [task["id"] for task in db.get_pending_tasks(user_id=uid)]
+        assert pending == [prior_id] + [task["id"] for task in result]
+
+    def test_add_usertasks_no_list(cls, db, uid):
+        new_tasks = [{"title": "first", "estimate": "PT1H5M"}]
+        with pytest.raises(IntegrityError):
+            list(db.add_tasks_for_user(user_id=uid, tasks=json.dumps(new_tasks)))
+
     def test_add_listtask_no_list(cls, db, lid):
         db.add_task_to_list(daylist_id=lid, title="first", estimate="PT1H5M")
 
@@ -583,6 +914,75 @@ class TestTask:
         result = db.uncomplete_task(id=0)
         assert result == 0
 
+    def test_complete_tasks_for_user(cls, db, uid, lid):
+        task_ids = [
+            db.add_task_to_list(daylist_id=lid, title="one", estimate="PT10M"),
+            db.add_task_to_list(daylist_id=lid, title="two", estimate="PT10M"),
+        ]
+        db.complete_task(id=task_ids[1])
+
+        # duplicate and already-done ids are fine
+        attempted = [task_ids[1], task_ids[0], task_ids[1]]
+        result = list(
+            db.complete_tasks_for_user(user_id=uid, task_ids=json.dumps(attempted))
+        )
+        assert result == [{"id": task_id, "valid": True} for task_id in task_ids]
+        assert all(db.get_task(id=task_id)["done"] for task_id in task_ids)
+
+    def test_complete_tasks_for_user_invalid(cls, db, uid, lid):
+        task_id = db.add_task_to_list(daylist_id=lid, title="one", estimate="PT10M")
+        old_lid = db.add_daylist(user_id=uid, expiry=OLD_TIME)
+        old_id = db.add_task_to_list(daylist_id=old_lid, title="old", estimate="PT1M")
+        other_uid = db.get_registered_user(email="test@example.com")["id"]
+        other_id = list(db.get_current_tasks(user_id=other_uid))[0]["id"]
+
+        attempted = [task_id, old_id, other_id, 0]
+        result = list(
+            db.complete_tasks_for_user(user_id=uid, task_ids=json.dumps(attempted))
+        )
+        # only the invalid ids are returned and nothing is affected
+        assert result == [
+            {"id": bad_id, "valid": False} for bad_id in sorted([0, old_id, other_id])
+        ]
+        assert db.get_task(id=task_id)["done"] is False
+        assert db.get_task(id=other_id)["done"] is False
+
+    def test_complete_tasks_for_user_empty(cls, db, uid, lid):
+        result = list(db.complete_tasks_for_user(user_id=uid, task_ids="[]"))
+        assert result == []
+
+    def test_uncomplete_tasks_for_user(cls, db, uid, lid):
+        pending_id = db.add_task_to_list(daylist_id=lid, title="p", estimate="PT1M")
+        done_ids = [
+            db.add_task_to_list(daylist_id=lid, title="one", estimate="PT10M"),
+            db.add_task_to_list(daylist_id=lid, title="two", estimate="PT10M"),
+        ]
+        db.add_task_to_list(daylist_id=lid, title="last", estimate="PT1M")
+        for task_id in done_ids:
+            db.complete_task(id=task_id)
+
+        attempted = done_ids + [pending_id]
+        result = list(
+            db.uncomplete_tasks_for_user(user_id=uid, task_ids=json.dumps(attempted))
+        )
+        # only done tasks are affected and returned
+        assert result == [{"id": task_id, "valid": True} for task_id in done_ids]
+        # undone tasks join the end of the pending list
+        pending = [task["id"] for task in db.get_pending_tasks(user_id=uid)]
+        assert pending[0] == pending_id
+        assert pending[-2:] == done_ids
+
+    def test_uncomplete_tasks_for_user_invalid(cls, db, uid, lid):
+        task_id = db.add_task_to_list(daylist_id=lid, title="one", estimate="PT10M")
+        db.complete_task(id=task_id)
+
+        result = list(
+            db.uncomplete_tasks_for_user(user_id=uid, task_ids=json.dumps([task_id, 0]))
+        )
+        # only the invalid ids are returned and nothing is affected
+        assert result == [{"id": 0, "valid": False}]
+        assert db.get_task(id=task_id)["done"] is True
+
     # delete
 
     def test_delete_task(cls, db, lid):
@@ -596,3 +996,285 @@ class TestTask:
     def test_delete_task_invalid(cls, db, lid):
         result = db.delete_task(id=0)
         assert result == 0
+
+    # versions
+
+    def test_task_changes_count_list_version(cls, db, uid, lid):
+        def version():
+            return db.get_active_daylist(user_id=uid)["version"]
+
+        assert version() == 1
+        first = db.add_task_for_user(user_id=uid, title="one", estimate="PT1M")
+        second = db.add_task_to_list(daylist_id=lid, title="two", estimate="PT1M")
+        tasks = json.dumps([{"title": "three", "estimate": "PT1M"}])
+        list(db.add_tasks_for_user(user_id=uid, tasks=tasks))
+        assert version() == 4
+
+        db.complete_task(id=first)
+        db.uncomplete_task(id=first)
+        list(db.complete_tasks_for_user(user_id=uid, task_ids=json.dumps([second])))
+        list(db.uncomplete_tasks_for_user(user_id=uid, task_ids=json.dumps([second])))
+        db.delete_task(id=second)
+        assert version() == 9
+
+    def test_task_changes_count_list_version_unaffected(cls, db, uid, lid):
+        task_id = db.add_task_to_list(daylist_id=lid, title="one", estimate="PT1M")
+        before = db.get_active_daylist(user_id=uid)["version"]
+
+        # requests that change nothing leave the version as it was
+        db.uncomplete_task(id=task_id)
+        list(db.complete_tasks_for_user(user_id=uid, task_ids=json.dumps([task_id, 0])))
+        list(db.uncomplete_tasks_for_user(user_id=uid, task_ids=json.dumps([task_id])))
+        list(db.add_tasks_for_user(user_id=uid, tasks="[]"))
+        db.delete_task(id=0)
+        assert db.get_active_daylist(user_id=uid)["version"] == before
+
+
+# Task partitions
+
+
+class TestTaskPartitions:
+
+    @staticmethod
+    @pytest.fixture()
+    def old_task(db) -> int:
+        uid = db.add_anon_user()
+        lid = db.add_daylist(user_id=uid, expiry=OLD_TIME)
+        db.add_task_to_list(daylist_id=lid, title="old", estimate="PT1M")
+        yield lid
+        # partitions for these months are made only by these tests
+        with db.engine.begin() as connection:
+            for name in ["tasks_p2020_02", "tasks_p2020_03"]:
+                connection.execute(text(f"DROP TABLE IF EXISTS {name}"))
+
+    @staticmethod
+    def partition_of(db, lid: int) -> str:
+        with db.engine.connect() as connection:
+            return connection.scalar(
+                text(
+                    "SELECT CAST(CAST(tableoid AS regclass) AS text) FROM tasks"
+                    " WHERE daylist_id = :lid"
+                ),
+                {"lid": lid},
+            )
+
+    def test_create_task_partitions(cls, db, old_task):
+        # tasks for months without a partition wait in the default one
+        assert cls.partition_of(db, old_task) == "tasks_default"
+
+        result = db.create_task_partitions(since=OLD_TIME, until="2020-03-01T00:00Z")
+        assert result == 2
+        assert cls.partition_of(db, old_task) == "tasks_p2020_02"
+        # partitions are only made once
+        assert db.create_task_partitions(since=OLD_TIME, until=OLD_TIME) == 0
+
+    def test_retire_task_partitions_drop(cls, db, old_task):
+        db.create_task_partitions(since=OLD_TIME, until=OLD_TIME)
+
+        # the month ends after the cutoff
+        result = db.retire_task_partitions(before="2020-02-29T00:00Z", detach=False)
+        assert result == 0
+        result = db.retire_task_partitions(before="2020-03-01T00:00Z", detach=False)
+        assert result == 1
+        assert db.count_tasks(daylist_id=old_task) == 0
+
+    def test_retire_task_partitions_detach(cls, db, old_task):
+        db.create_task_partitions(since=OLD_TIME, until=OLD_TIME)
+
+        result = db.retire_task_partitions(before="2020-03-01T00:00Z", detach=True)
+        assert result == 1
+        assert db.count_tasks(daylist_id=old_task) == 0
+        # the detached tasks are kept, even once their list is deleted
+        db.delete_expired_daylists(before="2020-03-01T00:00Z", batch_size=10)
+        with db.engine.connect() as connection:
+            kept = connection.scalar(text("SELECT count(*) FROM tasks_p2020_02"))
+        assert kept == 1
+
+    def test_task_follows_list_expiry(cls, db, old_task):
+        db.create_task_partitions(since=OLD_TIME, until="2020-03-01T00:00Z")
+
+        with db.engine.begin() as connection:
+            connection.execute(
+                text("UPDATE daylists SET expiry = :expiry WHERE id = :lid"),
+                {"expiry": "2020-03-02T00:00Z", "lid": old_task},
+            )
+        assert cls.partition_of(db, old_task) == "tasks_p2020_03"
+
+
+# Connection pools
+
+
+class TestPool:
+
+    def test_pool_stats(cls, db):
+        before = pool_stats(db.engine)["checkouts"]
+        db.count_users()
+
+        stats = pool_stats(db.engine)
+        assert stats["checkouts"] == before + 1
+        assert stats["checked_out"] == 0
+        assert stats["idle"] >= 1
+        assert stats["waiting"] == 0
+
+    def test_pool_options(cls, db):
+        url = db.engine.url.render_as_string(hide_password=False)
+        queries = query_connect(url, pool_size=2, max_overflow=0)
+
+        stats = pool_stats(queries.engine)
+        assert stats["size"] == 2
+        assert stats["overflow"] == 0
+        queries.engine.dispose()
+
+    def test_pool_stats_waiting(cls, db):
+        url = db.engine.url.render_as_string(hide_password=False)
+        queries = query_connect(url, pool_size=1, max_overflow=0, pool_timeout=10)
+
+        with ThreadPoolExecutor() as executor:
+            with queries.engine.connect():
+                # the only connection is checked out, so the query waits for it
+                future = executor.submit(queries.count_users)
+                for _ in range(50):
+                    if pool_stats(queries.engine)["waiting"]:
+                        break
+                    time.sleep(0.01)
+                assert pool_stats(queries.engine)["waiting"] == 1
+                assert not future.done()
+            assert future.result() == 0
+
+        stats = pool_stats(queries.engine)
+        assert stats["waiting"] == 0
+        assert stats["wait_seconds"] > 0
+        queries.engine.dispose()
+
+
+# Async queries
+
+
+@pytest.mark.anyio
+class TestAsyncQueries:
+
+    async def test_scalar(cls, db, adb):
+        uid = await adb.add_anon_user()
+        assert db.get_user(id=uid)["id"] == uid
+
+    async def test_one(cls, db, adb):
+        uid = db.add_registered_user(email=TEST_EMAIL, password_hash="12345")
+        user = await adb.get_registered_user(email=TEST_EMAIL)
+        assert user["id"] == uid
+
+    async def test_one_none(cls, adb):
+        assert await adb.get_registered_user(email=TEST_EMAIL) is None
+
+    async def test_many(cls, db, adb):
+        uid = db.add_anon_user()
+        db.add_daylist(user_id=uid, expiry=FUTURE_TIME)
+        tasks = json.dumps([{"title": "one", "estimate": "PT10M"}] * 2)
+
+        result = list(await adb.add_tasks_for_user(user_id=uid, tasks=tasks))
+        assert [task["title"] for task in result] == ["one", "one"]
+
+    async def test_affected(cls, db, adb):
+        uid = db.add_anon_user()
+        num_affected = await adb.register_anon_user(
+            id=uid, email=TEST_EMAIL, password_hash="12345"
+        )
+        assert num_affected == 1
+
+    async def test_transaction_rollback(cls, db, adb):
+        with pytest.raises(IntegrityError):
+            async with adb.transaction():
+                await adb.add_anon_user()
+                await adb.add_registered_user(email=TEST_EMAIL, password_hash="1")
+                await adb.add_registered_user(email=TEST_EMAIL, password_hash="2")
+        # nothing from the failed block is kept
+        assert db.count_users() == 0
+
+    async def test_notify_invalidations(cls, db, adb):
+        url = db.engine.url.render_as_string(hide_password=False)
+        cache: TTLCache[str, int] = TTLCache(maxsize=10, ttl=60)
+        listener = InvalidationBus(adb, url, check_interval=1)
+        listener.register("test", cache)
+        other_worker = InvalidationBus(adb, url)
+
+        async with anyio.create_task_group() as tasks:
+            tasks.start_soon(listener.listen_forever)
+            with anyio.fail_after(10):
+                while not listener.connected:
+                    await anyio.sleep(0.01)
+                cache.set("stale", 1)
+                cache.set("fresh", 2)
+
+                await other_worker.invalidate("test", "stale")
+                while cache.get("stale") is not None:
+                    await anyio.sleep(0.01)
+            assert cache.get("fresh") == 2
+            tasks.cancel_scope.cancel()
+
+
+# Instrumentation
+
+
+class TestInstrument:
+
+    @staticmethod
+    @pytest.fixture()
+    def queries(db):
+        url = db.engine.url.render_as_string(hide_password=False)
+        queries = query_connect(url)
+        instrument(queries)
+        yield queries
+        queries.engine.dispose()
+
+    def test_instrument_calls(cls, queries):
+        calls = QUERY_CALLS.value(query="count_users")
+        observed = QUERY_DURATION.value(query="count_users").count
+
+        assert queries.count_users() == 0
+        assert QUERY_CALLS.value(query="count_users") == calls + 1
+        assert QUERY_DURATION.value(query="count_users").count == observed + 1
+
+    def test_instrument_rows(cls, queries):
+        uid = queries.add_anon_user()
+        lid = queries.add_daylist(user_id=uid, expiry=FUTURE_TIME)
+        for title in ["one", "two"]:
+            queries.add_task_to_list(daylist_id=lid, title=title, estimate="PT1M")
+        rows = QUERY_ROWS.value(query="get_pending_tasks")
+
+        result = queries.get_pending_tasks(user_id=uid)
+        # rows are still returned to the caller after counting them
+        assert [task["title"] for task in result] == ["one", "two"]
+        assert QUERY_ROWS.value(query="get_pending_tasks") == rows + 2
+
+    def test_instrument_transaction(cls, queries):
+        commits = TRANSACTION_DURATION.value(outcome="commit").count
+        rollbacks = TRANSACTION_DURATION.value(outcome="rollback").count
+
+        with queries.transaction():
+            queries.add_anon_user()
+        with pytest.raises(IntegrityError):
+            with queries.transaction():
+                queries.add_registered_user(email=TEST_EMAIL, password_hash="1")
+                queries.add_registered_user(email=TEST_EMAIL, password_hash="2")
+
+        assert TRANSACTION_DURATION.value(outcome="commit").count == commits + 1
+        assert TRANSACTION_DURATION.value(outcome="rollback").count == rollbacks + 1
+        assert queries.count_users() == 1
+
+    def test_instrument_twice(cls, queries):
+        instrument(queries)
+        calls = QUERY_CALLS.value(query="count_users")
+
+        queries.count_users()
+        assert QUERY_CALLS.value(query="count_users") == calls + 1
+
+    @pytest.mark.anyio
+    async def test_instrument_async(cls, adb):
+        instrument(adb)
+        calls = QUERY_CALLS.value(query="get_registered_user")
+        rows = QUERY_ROWS.value(query="get_registered_user")
+
+        async with adb.transaction():
+            assert await adb.get_registered_user(email=TEST_EMAIL) is None
+
+        assert QUERY_CALLS.value(query="get_registered_user") == calls + 1
+        assert QUERY_ROWS.value(query="get_registered_user") == rows
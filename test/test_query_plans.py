@@ -0,0 +1,178 @@
+"""For query plan regressions.
+
+Explains every named query against seeded data in the test database, so a query
+that stops matching an index fails here rather than slowing down in production.
+"""
+
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Iterator
+import pugsql  # type: ignore
+import pytest
+from sqlalchemy import text
+
+from perf.seed import seed_database, SeedConfig
+
+QUERY_DIR = Path(__file__).parent.parent / "db" / "queries"
+QUERY_NAMES = sorted(statement.name for statement in pugsql.module(str(QUERY_DIR)))
+SEED_USERS = 2000
+
+# sample values for each query parameter; plans depend on the table statistics
+PARAMS = {
+    "active_since": "2000-01-01T00:00:00+00",
+    "after_expiry": "2000-01-01T00:00:00+00",
+    "after_id": 0,
+    "batch_size": 500,
+    "before": "2000-01-01T00:00:00+00",
+    "carry_over": True,
+    "channel": "cache_invalidation",
+    "daylist_id": 1,
+    "detach": False,
+    "email": "user1@seed.example.com",
+    "estimate": "PT10M",
+    "expiry": "2122-02-22T00:00:00+05",
+    "guest_key": "0b5a3e4c-9f6d-4a51-8d8e-6f1c2b7a9e30",
+    "id": 1,
+    "new_hash": "67890",
+    "password_hash": "12345",
+    "payload": "{}",
+    "since": "2000-01-01T00:00:00+00",
+    "task_ids": "[1, 2]",
+    "tasks": '[{"title": "a task", "estimate": "PT10M"}]',
+    "title": "a task",
+    "until": "2000-01-01T00:00:00+00",
+    "user_id": 1,
+}
+
+# queries expected to read a whole table, which only tests and admin tasks use
+FULL_SCANS = {
+    "count_users",
+    "count_anon_users",
+    "count_registered_users",
+    "delete_all_users",
+}
+
+
+@pytest.fixture(scope="module")
+def seeded(db) -> Iterator[None]:
+    url = db.engine.url.render_as_string(hide_password=False)
+    seed_database(url, SeedConfig(users=SEED_USERS), password_hash="12345")
+    # move the seeded history out of the default partition into monthly ones
+    now = datetime.now(timezone.utc)
+    db.create_task_partitions(since=now - timedelta(days=366), until=now)
+    # planner statistics are transactional, so they must be committed
+    with db.engine.begin() as connection:
+        connection.execute(text("ANALYZE"))
+    try:
+        yield
+    finally:
+        db.delete_all_users()
+
+
+def explain(db, sql: str) -> dict[str, Any]:
+    statement = text(sql)
+    names = statement.compile().params
+    unknown = set(names) - set(PARAMS)
+    assert not unknown, f"Add sample values for new query parameters: {unknown}"
+
+    with db.engine.connect() as connection:
+        plan = connection.execute(
+            text(f"EXPLAIN (FORMAT JSON) {sql}"),
+            {name: PARAMS[name] for name in names},
+        ).scalar_one()
+    return plan[0]["Plan"]
+
+
+def plan_nodes(plan: dict[str, Any]) -> Iterator[dict[str, Any]]:
+    yield plan
+    for subplan in plan.get("Plans", []):
+        yield from plan_nodes(subplan)
+
+
+def empty_tables(db) -> set[str]:
+    """Analyzed tables without rows, e.g. partitions for months to come."""
+    with db.engine.connect() as connection:
+        tables = connection.scalars(
+            text("SELECT relname FROM pg_class WHERE relkind = 'r' AND reltuples = 0")
+        )
+        return set(tables)
+
+
+def parent_index(db, name: str) -> str:
+    """The partitioned index that an index on a partition belongs to, if any."""
+    with db.engine.connect() as connection:
+        parent = connection.scalar(
+            text(
+                "SELECT CAST(inhparent AS regclass) FROM pg_inherits"
+                " WHERE inhrelid = CAST(:name AS regclass)"
+            ),
+            {"name": name},
+        )
+    return str(parent) if parent else name
+
+
+def test_full_scans_are_queries():
+    """Queries allowed to read whole tables still exist, so the list stays current."""
+    assert FULL_SCANS <= set(QUERY_NAMES)
+
+
+@pytest.mark.usefixtures("seeded")
+@pytest.mark.parametrize(
+    "name", [name for name in QUERY_NAMES if name not in FULL_SCANS]
+)
+def test_query_uses_indexes(db, name):
+    """Named queries find their rows through indexes instead of reading tables.
+
+    Reading an empty partition whole costs nothing, so those scans are allowed.
+    """
+    plan = explain(db, getattr(db, name).sql)
+    empty = empty_tables(db)
+    scans = [
+        node["Relation Name"]
+        for node in plan_nodes(plan)
+        if node["Node Type"] == "Seq Scan" and node["Relation Name"] not in empty
+    ]
+    assert not scans, f"{name} reads whole tables: {scans}"
+
+
+@pytest.mark.usefixtures("seeded")
+@pytest.mark.parametrize(
+    "name,index",
+    [
+        ("get_active_daylist", "daylists_user_id_expiry_idx"),
+        ("get_pending_tasks", "tasks_pending_daylist_order_idx"),
+        ("get_done_tasks", "tasks_done_daylist_finished_at_idx"),
+        ("delete_inactive_guests", "users_guest_created_at_idx"),
+        ("delete_expired_daylists", "daylists_expiry_idx"),
+        ("add_next_daylists", "daylists_expiry_idx"),
+    ],
+)
+def test_query_uses_index(db, name, index):
+    """The hottest lookups use the indexes made to match their filters and order."""
+    plan = explain(db, getattr(db, name).sql)
+    used = [node["Index Name"] for node in plan_nodes(plan) if "Index Name" in node]
+    assert index in [parent_index(db, name) for name in used]
+
+
+@pytest.mark.usefixtures("seeded")
+@pytest.mark.parametrize(
+    "name", ["get_pending_tasks", "get_done_tasks", "add_task_for_user"]
+)
+def test_query_prunes_task_partitions(db, name):
+    """Queries for active lists skip the partitions of tasks for past months."""
+    current = datetime.now(timezone.utc).strftime("tasks_p%Y_%m")
+    with db.engine.connect() as connection:
+        partitions = connection.scalars(
+            text(
+                "SELECT CAST(inhrelid AS regclass) FROM pg_inherits"
+                " WHERE inhparent = CAST('tasks' AS regclass)"
+            )
+        )
+        months = {str(partition) for partition in partitions} - {"tasks_default"}
+    past = {month for month in months if month < current}
+    assert past, "The seeded history should fill partitions for past months"
+
+    plan = explain(db, getattr(db, name).sql)
+    scanned = {node.get("Relation Name") for node in plan_nodes(plan)}
+    assert current in scanned
+    assert not scanned & past